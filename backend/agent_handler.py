@@ -4,8 +4,10 @@ Sends emails to Foundry Agent for FAQ responses
 """
 import os
 import re
+import time
 import asyncio
-from typing import Dict
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
 from dotenv import load_dotenv
 from azure.ai.projects import AIProjectClient
 
@@ -39,18 +41,135 @@ def clean_agent_response(raw_text: str) -> str:
     return cleaned_text
 
 
+class AgentThreadPool:
+    """
+    Warm pool of empty Foundry threads so query_agent skips threads.create.
+
+    A background task keeps `size` threads ready and refills after each
+    acquire. Threads idle longer than `idle_ttl` seconds are deleted and
+    replaced, and the remaining stock is cleaned up on stop().
+    """
+
+    def __init__(self, project_client: AIProjectClient, size: int, idle_ttl: float = 900.0, refill_interval: float = 30.0):
+        """
+        Args:
+            project_client: Azure AI Foundry project client (sync version)
+            size: Number of threads to keep ready
+            idle_ttl: Seconds an unused thread may sit in the pool before it is deleted
+            refill_interval: Seconds between housekeeping passes when no acquire happens
+        """
+        self.project_client = project_client
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.refill_interval = refill_interval
+        self._ready: Deque[Tuple[str, float]] = deque()  # (thread_id, created_at)
+        self._refill_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Background deletes of expired threads, kept so they are not garbage collected mid-run
+        self._deletes: Set[asyncio.Task] = set()
+        self.stats = {"hits": 0, "misses": 0, "created": 0, "expired": 0}
+
+    async def start(self) -> None:
+        """Start the background refill task"""
+        if self._task is None:
+            self._refill_needed.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop refilling and delete every thread still waiting in the pool"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        leftover = [thread_id for thread_id, _ in self._ready]
+        self._ready.clear()
+        await asyncio.gather(*[self._delete_thread(thread_id) for thread_id in leftover], *self._deletes)
+
+    async def acquire(self) -> str:
+        """
+        Hand out a ready thread id, creating one inline if the pool is empty
+
+        Returns:
+            Foundry thread id that has not been used by any other run
+        """
+        now = time.monotonic()
+        while self._ready:
+            thread_id, created_at = self._ready.popleft()
+            if now - created_at < self.idle_ttl:
+                self.stats["hits"] += 1
+                self._refill_needed.set()
+                return thread_id
+            self.stats["expired"] += 1
+            task = asyncio.create_task(self._delete_thread(thread_id))
+            self._deletes.add(task)
+            task.add_done_callback(self._deletes.discard)
+
+        self.stats["misses"] += 1
+        self._refill_needed.set()
+        return await self._create_thread()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_needed.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_needed.clear()
+            try:
+                await self._reap_expired()
+                missing = self.size - len(self._ready)
+                if missing > 0:
+                    created = await asyncio.gather(
+                        *[self._create_thread() for _ in range(missing)],
+                        return_exceptions=True
+                    )
+                    now = time.monotonic()
+                    for thread_id in created:
+                        if isinstance(thread_id, Exception):
+                            print(f"Thread pool refill failed: {thread_id}")
+                            continue
+                        self._ready.append((thread_id, now))
+            except Exception as e:
+                print(f"Thread pool housekeeping failed: {e}")
+
+    async def _reap_expired(self) -> None:
+        now = time.monotonic()
+        expired = {thread_id for thread_id, created_at in self._ready if now - created_at >= self.idle_ttl}
+        if not expired:
+            return
+        self._ready = deque((thread_id, created_at) for thread_id, created_at in self._ready if thread_id not in expired)
+        self.stats["expired"] += len(expired)
+        await asyncio.gather(*[self._delete_thread(thread_id) for thread_id in expired])
+
+    async def _create_thread(self) -> str:
+        thread = await asyncio.to_thread(self.project_client.agents.threads.create)
+        self.stats["created"] += 1
+        return thread.id
+
+    async def _delete_thread(self, thread_id: str) -> None:
+        try:
+            await asyncio.to_thread(self.project_client.agents.threads.delete, thread_id)
+        except Exception as e:
+            print(f"Failed to delete pooled thread {thread_id}: {e}")
+
+
 class AzureAIFoundryAgent:
     """Handler for Azure AI Foundry Agent queries"""
     
-    def __init__(self, project_client: AIProjectClient):
+    def __init__(self, project_client: AIProjectClient, thread_pool: Optional[AgentThreadPool] = None):
         """
         Initialize Foundry Agent handler
         
         Args:
             project_client: Azure AI Foundry project client (sync version)
+            thread_pool: Optional warm pool of pre-created threads
         """
         self.project_client = project_client
         self.agent_id = os.getenv("AZURE_AGENT_ID")
+        self.thread_pool = thread_pool
     
     async def query_agent(self, subject: str, email_body: str, thread_context: str = "") -> Dict:
         """
@@ -65,11 +184,15 @@ class AzureAIFoundryAgent:
             raise ValueError("Project client not initialized")
         
         try:
-            # 1. Create Thread
-            thread = await asyncio.to_thread(
-                self.project_client.agents.threads.create
-            )
-            print(f"Created thread: {thread.id}")
+            # 1. Take a warm thread from the pool, or create one
+            if self.thread_pool is not None:
+                thread_id = await self.thread_pool.acquire()
+            else:
+                thread = await asyncio.to_thread(
+                    self.project_client.agents.threads.create
+                )
+                thread_id = thread.id
+            print(f"Using thread: {thread_id}")
 
             # 2. Build the message content
             # thread_context already contains the full thread with the current email marked
@@ -84,7 +207,7 @@ class AzureAIFoundryAgent:
             # 3. Add message to thread
             message = await asyncio.to_thread(
                 self.project_client.agents.messages.create,
-                thread_id=thread.id,
+                thread_id=thread_id,
                 role="user",
                 content=content
             )
@@ -94,7 +217,7 @@ class AzureAIFoundryAgent:
             run = await asyncio.to_thread(
                 self.project_client.agents.runs.create_and_process,
                 agent_id=self.agent_id,
-                thread_id=thread.id
+                thread_id=thread_id
             )
             print(f"Run completed with status: {run.status}")
 
@@ -104,7 +227,7 @@ class AzureAIFoundryAgent:
             # 4. Get response messages (returns ItemPaged iterator)
             messages_iter = await asyncio.to_thread(
                 self.project_client.agents.messages.list,
-                thread_id=thread.id
+                thread_id=thread_id
             )
             
             # Convert iterator to list in thread pool
@@ -134,7 +257,7 @@ class AzureAIFoundryAgent:
             
             return {
                 'response': cleaned_response,      # Clean text ready for email (links included at bottom)
-                'thread_id': thread.id,            # Conversation context
+                'thread_id': thread_id,            # Conversation context
             }
         
         except Exception as e:
@@ -0,0 +1,202 @@
+"""
+Daily triage analytics rollups
+triage_daily_stats keeps per-day, per-route counts (received, approved,
+rejected, redirected) and sums; triage_daily_histograms keeps bucketed
+distributions of classifier confidence and of the time from received_at to
+approval. Both are updated in the same transaction as the queue insert or the
+resolution, so /analytics reads a few hundred rollup rows for any date range
+and derives rates and percentiles from them instead of scanning history.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import ApprovalQueue, TriageDailyHistogram, TriageDailyStats
+
+CONFIDENCE = 'confidence'
+LATENCY = 'latency_seconds'
+
+# Confidence is bucketed in steps of 1 / CONFIDENCE_BUCKETS
+CONFIDENCE_BUCKETS = 20
+# Latency buckets grow geometrically, so percentiles are within ~10% at any scale
+LATENCY_BUCKET_BASE = 1.1
+
+RESOLUTION_STATUSES = ('approved', 'rejected', 'redirected')
+# Benchmark replays (replay.py) write queue rows with these email ids; they are never rolled up
+REPLAY_ID_PREFIX = 'replay-'
+PERCENTILES = (50, 90, 99)
+
+
+def confidence_bucket(confidence: float) -> int:
+    return min(max(int(confidence * CONFIDENCE_BUCKETS), 0), CONFIDENCE_BUCKETS - 1)
+
+
+def latency_bucket(seconds: float) -> int:
+    return int(math.log(max(seconds, 0) + 1, LATENCY_BUCKET_BASE))
+
+
+def bucket_bounds(metric: str, bucket: int) -> tuple[float, float]:
+    """Range of values [lower, upper) that fall in a bucket"""
+    if metric == CONFIDENCE:
+        return bucket / CONFIDENCE_BUCKETS, (bucket + 1) / CONFIDENCE_BUCKETS
+    return LATENCY_BUCKET_BASE ** bucket - 1, LATENCY_BUCKET_BASE ** (bucket + 1) - 1
+
+
+def _add_stats(db: Session, day: date, route: str, **increments: float) -> None:
+    """Add to the counters of one (day, route) row, creating it if needed"""
+    stmt = pg_insert(TriageDailyStats).values(day=day, route=route, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TriageDailyStats.day, TriageDailyStats.route],
+        set_={name: getattr(TriageDailyStats, name) + value for name, value in increments.items()},
+    )
+    db.execute(stmt)
+
+
+def _add_histogram(db: Session, day: date, route: str, metric: str, buckets: Counter) -> None:
+    """Add to the bucket counts of one metric"""
+    for bucket, count in sorted(buckets.items()):
+        stmt = pg_insert(TriageDailyHistogram).values(day=day, route=route, metric=metric, bucket=bucket, count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TriageDailyHistogram.day, TriageDailyHistogram.route,
+                            TriageDailyHistogram.metric, TriageDailyHistogram.bucket],
+            set_={"count": TriageDailyHistogram.count + count},
+        )
+        db.execute(stmt)
+
+
+def _is_replay(email_id: Optional[str]) -> bool:
+    return bool(email_id) and email_id.startswith(REPLAY_ID_PREFIX)
+
+
+def record_received(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """
+    Roll up approval rows inserted today
+
+    Args:
+        db: Session whose transaction also inserts the rows
+        rows: Column values per inserted row, keyed by ApprovalQueue attribute name
+    """
+    today = date.today()
+    by_route: Dict[str, List[Optional[float]]] = defaultdict(list)
+    for row in rows:
+        if _is_replay(row.get('email_id')):
+            continue
+        by_route[row.get('route') or ''].append(row.get('confidence'))
+    for route, confidences in sorted(by_route.items()):
+        known = [confidence for confidence in confidences if confidence is not None]
+        _add_stats(db, today, route, received=len(confidences),
+                   confidence_sum=sum(known), confidence_count=len(known))
+        _add_histogram(db, today, route, CONFIDENCE, Counter(confidence_bucket(c) for c in known))
+
+
+def record_resolved(db: Session, approval: ApprovalQueue, status: str) -> None:
+    """
+    Roll up a queue row being approved, rejected or redirected
+
+    Call before flagging the row; rows that were already resolved are not counted again.
+
+    Args:
+        db: Session whose transaction also resolves the row
+        approval: The row being resolved
+        status: One of RESOLUTION_STATUSES
+    """
+    if approval.approved or approval.rejected or _is_replay(approval.email_id):
+        return
+    now = datetime.now()
+    route = approval.route or ''
+    increments: Dict[str, float] = {status: 1}
+    # Time to approval, for sent replies and forwards. received_at is Graph's UTC time, stored naive
+    if status != 'rejected' and isinstance(approval.received_at, datetime):
+        utc_now = datetime.now(timezone.utc).replace(tzinfo=None)
+        seconds = max((utc_now - approval.received_at).total_seconds(), 0)
+        increments.update(latency_seconds_sum=seconds, latency_count=1)
+        _add_histogram(db, now.date(), route, LATENCY, Counter([latency_bucket(seconds)]))
+    _add_stats(db, now.date(), route, **increments)
+
+
+def histogram_percentile(metric: str, buckets: Dict[int, int], percentile: float) -> Optional[float]:
+    """
+    Estimate a percentile from bucket counts, interpolating inside the bucket
+
+    Args:
+        metric: CONFIDENCE or LATENCY (decides the bucket bounds)
+        buckets: Count per bucket
+        percentile: 0-100
+    Returns:
+        Estimated value, None if there are no observations
+    """
+    total = sum(buckets.values())
+    if not total:
+        return None
+    target = total * percentile / 100
+    seen = 0
+    for bucket in sorted(buckets):
+        count = buckets[bucket]
+        if seen + count >= target:
+            lower, upper = bucket_bounds(metric, bucket)
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return bucket_bounds(metric, max(buckets))[1]
+
+
+def analytics_summary(db: Session, since: date, until: date, route: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Route mix, resolution rates, confidence distribution and time to approval
+
+    Args:
+        db: Session to query with
+        since: First day included
+        until: Last day included
+        route: Only this route
+    Returns:
+        {'daily': per-day rows, 'routes': totals, rates, histogram and percentiles per route}
+    """
+    stats_query = select(TriageDailyStats).where(TriageDailyStats.day.between(since, until))
+    histogram_query = select(TriageDailyHistogram).where(TriageDailyHistogram.day.between(since, until))
+    if route:
+        stats_query = stats_query.where(TriageDailyStats.route == route)
+        histogram_query = histogram_query.where(TriageDailyHistogram.route == route)
+
+    daily = []
+    totals: Dict[str, Counter] = defaultdict(Counter)
+    for row in db.scalars(stats_query.order_by(TriageDailyStats.day, TriageDailyStats.route)):
+        daily.append({
+            'day': row.day.isoformat(), 'route': row.route, 'received': row.received,
+            'approved': row.approved, 'rejected': row.rejected, 'redirected': row.redirected,
+        })
+        for name in ('received', 'approved', 'rejected', 'redirected', 'confidence_sum',
+                     'confidence_count', 'latency_seconds_sum', 'latency_count'):
+            totals[row.route][name] += getattr(row, name) or 0
+
+    histograms: Dict[str, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+    for row in db.scalars(histogram_query):
+        histograms[row.route][row.metric][row.bucket] += row.count
+
+    routes = {}
+    for name in sorted(totals.keys() | histograms.keys()):
+        total = totals[name]
+        resolved = sum(total[status] for status in RESOLUTION_STATUSES)
+        confidence = histograms[name][CONFIDENCE]
+        latency = histograms[name][LATENCY]
+        routes[name] = {
+            'received': total['received'],
+            'resolved': resolved,
+            **{status: total[status] for status in RESOLUTION_STATUSES},
+            **{f"{status}_rate": total[status] / resolved if resolved else None for status in RESOLUTION_STATUSES},
+            'avg_confidence': total['confidence_sum'] / total['confidence_count'] if total['confidence_count'] else None,
+            'confidence_histogram': [
+                {'from': bucket / CONFIDENCE_BUCKETS, 'to': (bucket + 1) / CONFIDENCE_BUCKETS, 'count': confidence[bucket]}
+                for bucket in range(CONFIDENCE_BUCKETS)
+            ],
+            'time_to_approval_seconds': {
+                'count': total['latency_count'],
+                'mean': total['latency_seconds_sum'] / total['latency_count'] if total['latency_count'] else None,
+                **{f"p{p}": histogram_percentile(LATENCY, latency, p) for p in PERCENTILES},
+            },
+        }
+    return {'since': since.isoformat(), 'until': until.isoformat(), 'daily': daily, 'routes': routes}
@@ -1,21 +1,196 @@
-from fastapi import HTTPException
+"""
+Bearer token validation
+get_current_user is the FastAPI dependency that guards the API routes.
+
+Tokens issued for this API (audience AZURE_AD_AUDIENCE) are verified locally:
+RS256 signature against Azure AD's signing keys (JWKS, cached and refetched
+periodically or when a new key id shows up), issuer, audience and expiry. Tokens for
+Microsoft Graph, which is what the dashboard currently sends, are signed for
+Graph only and cannot be verified by a third party, so they are checked once
+with an async Graph /me call. Either way the resulting principal is cached
+until the token expires, so repeat requests cost a dictionary lookup.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
 import httpx
+import jwt
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+load_dotenv()
+
+# Restrict sign-ins to one tenant; unset accepts any tenant (the dashboard's 'common' authority)
+TENANT_ID = os.getenv('AZURE_AD_TENANT_ID')
+# Audiences of tokens issued for this API (its client id and/or App ID URI), comma separated
+API_AUDIENCES = [audience.strip() for audience in os.getenv('AZURE_AD_AUDIENCE', '').split(',') if audience.strip()]
+JWKS_URL = os.getenv('AZURE_AD_JWKS_URL', f"https://login.microsoftonline.com/{TENANT_ID or 'common'}/discovery/v2.0/keys")
+# Signing keys are refetched this often, and at most every JWKS_MIN_REFRESH_SECONDS for an unknown key id
+JWKS_REFRESH_SECONDS = float(os.getenv('AZURE_AD_JWKS_REFRESH_SECONDS', 6 * 3600))
+JWKS_MIN_REFRESH_SECONDS = 300
+# Allowed clock difference when checking exp and nbf
+CLOCK_SKEW_SECONDS = 120
+PRINCIPAL_CACHE_SIZE = 10000
+
+GRAPH_AUDIENCES = ('00000003-0000-0000-c000-000000000000', 'https://graph.microsoft.com')
+GRAPH_ME_URL = "https://graph.microsoft.com/v1.0/me"
+# v2.0 and v1.0 token issuers, per tenant
+ISSUERS = ("https://login.microsoftonline.com/{tid}/v2.0", "https://sts.windows.net/{tid}/")
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The signed-in user behind a validated token"""
+    id: str
+    email: Optional[str]
+    name: Optional[str]
+    tenant_id: Optional[str]
+    expires_at: float
+
+
+class TokenValidator:
+    """Validates bearer tokens, caching signing keys and validated principals"""
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._keys_fetched_at = 0.0
+        self._keys_lock = asyncio.Lock()
+        # sha256(token) -> principal, in insertion order for eviction
+        self._principals: Dict[str, Principal] = {}
+
+    async def validate(self, token: str) -> Principal:
+        """
+        Validate a bearer token
+
+        Args:
+            token: Raw JWT from the Authorization header
+        Returns:
+            The token's principal
+        Raises:
+            HTTPException: 401 if the token is invalid or expired
+        """
+        cache_key = hashlib.sha256(token.encode()).hexdigest()
+        principal = self._principals.get(cache_key)
+        if principal and principal.expires_at > time.time():
+            return principal
+
+        try:
+            # Unverified: only used to pick the validation path, never trusted as is
+            claims = jwt.decode(token, options={"verify_signature": False})
+        except jwt.PyJWTError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        if claims.get("aud") in GRAPH_AUDIENCES:
+            principal = await self._validate_with_graph(token, claims)
+        else:
+            principal = await self._validate_locally(token)
+        self._remember(cache_key, principal)
+        return principal
+
+    def _remember(self, cache_key: str, principal: Principal) -> None:
+        if len(self._principals) >= PRINCIPAL_CACHE_SIZE:
+            now = time.time()
+            self._principals = {key: cached for key, cached in self._principals.items() if cached.expires_at > now}
+            while len(self._principals) >= PRINCIPAL_CACHE_SIZE:
+                del self._principals[next(iter(self._principals))]
+        self._principals[cache_key] = principal
+
+    async def _validate_locally(self, token: str) -> Principal:
+        """Verify signature, audience, issuer and expiry against the cached signing keys"""
+        if not API_AUDIENCES:
+            raise HTTPException(status_code=401, detail="Invalid token audience")
+        try:
+            key = await self._signing_key(jwt.get_unverified_header(token).get("kid"))
+            claims = jwt.decode(
+                token, key.key, algorithms=["RS256"], audience=API_AUDIENCES, leeway=CLOCK_SKEW_SECONDS,
+                options={"require": ["exp", "iss", "aud", "tid"]},
+            )
+        except jwt.PyJWTError as e:
+            raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+        self._check_tenant(claims)
+        if claims["iss"] not in (issuer.format(tid=claims["tid"]) for issuer in ISSUERS):
+            raise HTTPException(status_code=401, detail="Invalid token issuer")
+        return Principal(
+            id=claims.get("oid") or claims.get("sub"),
+            email=claims.get("preferred_username") or claims.get("upn") or claims.get("email"),
+            name=claims.get("name"),
+            tenant_id=claims["tid"],
+            expires_at=float(claims["exp"]),
+        )
+
+    async def _validate_with_graph(self, token: str, claims: dict) -> Principal:
+        """Check a Graph token by calling /me with it, once per token"""
+        expires_at = float(claims.get("exp") or 0)
+        if expires_at <= time.time() - CLOCK_SKEW_SECONDS:
+            raise HTTPException(status_code=401, detail="Token expired")
+        self._check_tenant(claims)
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(GRAPH_ME_URL, headers={"Authorization": f"Bearer {token}"})
+        except httpx.HTTPError as e:
+            print(f"Error validating token with Graph: {e}")
+            raise HTTPException(status_code=503, detail="Could not validate token")
+        if response.status_code != 200:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        user_data = response.json()
+        return Principal(
+            id=user_data.get("id"),
+            email=user_data.get("userPrincipalName"),
+            name=user_data.get("displayName"),
+            tenant_id=claims.get("tid"),
+            expires_at=expires_at,
+        )
+
+    def _check_tenant(self, claims: dict) -> None:
+        if TENANT_ID and claims.get("tid") != TENANT_ID:
+            raise HTTPException(status_code=401, detail="Token is from another tenant")
+
+    async def _signing_key(self, kid: Optional[str]) -> jwt.PyJWK:
+        """Signing key by id, refetching the key set when it is stale or the id is new (rotation)"""
+        age = time.time() - self._keys_fetched_at
+        if kid not in self._keys and age > JWKS_MIN_REFRESH_SECONDS or age > JWKS_REFRESH_SECONDS:
+            async with self._keys_lock:
+                # Another request may have refreshed while we waited
+                age = time.time() - self._keys_fetched_at
+                if kid not in self._keys and age > JWKS_MIN_REFRESH_SECONDS or age > JWKS_REFRESH_SECONDS:
+                    await self._refresh_keys()
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key {kid}")
+        return key
+
+    async def _refresh_keys(self) -> None:
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.get(JWKS_URL)
+                response.raise_for_status()
+            key_set = jwt.PyJWKSet.from_dict(response.json())
+        except Exception as e:
+            # Keep using the keys we have; they stay valid for days after a rotation starts
+            print(f"Error refreshing Azure AD signing keys: {e}")
+            if not self._keys:
+                raise HTTPException(status_code=503, detail="Could not load token signing keys")
+            return
+        self._keys = {key.key_id: key for key in key_set.keys if key.key_id}
+        self._keys_fetched_at = time.time()
+
+
+token_validator = TokenValidator()
+bearer = HTTPBearer(auto_error=False)
+
+
+async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Principal:
+    """FastAPI dependency: the validated principal of the request's bearer token"""
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return await token_validator.validate(credentials.credentials)
+
 
-def validate_azure_ad_token(token: str) -> dict:
-    """Validate by calling Microsoft Graph /me endpoint"""
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    response = httpx.get(
-        "https://graph.microsoft.com/v1.0/me",
-        headers=headers
-    )
-    
-    if response.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    
-    user_data = response.json()
-    return {
-        "email": user_data.get("userPrincipalName"),
-        "name": user_data.get("displayName"),
-        "id": user_data.get("id")
-    }
\ No newline at end of file
+async def validate_azure_ad_token(token: str) -> dict:
+    """Validate a token and return the user's email, name and id"""
+    principal = await token_validator.validate(token)
+    return {"email": principal.email, "name": principal.name, "id": principal.id}
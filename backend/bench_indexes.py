@@ -0,0 +1,150 @@
+"""
+Benchmark the hot-path queries before and after the index migrations
+Builds approval_queue and email_history in a scratch schema, loads synthetic
+rows (1M history rows by default), and runs the API's hot queries with
+EXPLAIN (ANALYZE, BUFFERS) first with only the original conversation_id
+indexes, then with the migration indexes applied. The scratch schema is
+dropped afterwards, so it is safe to point at a development database.
+
+    python bench_indexes.py --history-rows 1000000 --approval-rows 200000 --plans
+"""
+import argparse
+import random
+import re
+import statistics
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+from migrations import MIGRATIONS
+from models import ApprovalQueue, Base, EmailHistory, engine
+
+SCHEMA = "bench_indexes"
+
+# Migrations that add the indexes under test
+INDEX_MIGRATIONS = ("028_email_id_lookup_indexes", "032_approval_queue_email_id_unique", "038_hot_path_indexes")
+
+# Indexes the tables had before those migrations (besides primary keys)
+ORIGINAL_INDEXES = ("ix_approval_queue_conversation_id", "ix_email_history_conversation_id")
+
+LOAD_HISTORY = """
+INSERT INTO email_history (id, email_id, conversation_id, subject, sender_email, route, final_response,
+                           confidence, approval_status, processed_at, received_at)
+SELECT md5('h' || g)::uuid, 'hist-' || g, 'conv-h' || (g / 3), 'Subject ' || g, 'student' || (g % 5000) || '@unc.edu',
+       (ARRAY['AI_AGENT', 'HUMAN_REQUIRED', 'REDIRECT'])[1 + g % 3], repeat('reply ', 40), random(),
+       (ARRAY['approved', 'rejected', 'redirected'])[1 + g % 3],
+       now() - g * interval '1 minute', now() - g * interval '1 minute' - interval '1 hour'
+FROM generate_series(1, :rows) AS g
+"""
+
+# One row in 50 is still pending review, the rest were resolved
+LOAD_APPROVALS = """
+INSERT INTO approval_queue (id, email_id, conversation_id, subject, sender_email, body, route, generated_response,
+                            confidence, agent_used, approved, rejected, is_read, priority, created_at, updated_at, received_at)
+SELECT md5('a' || g)::uuid, 'appr-' || g, 'conv-a' || g, 'Subject ' || g, 'student' || (g % 5000) || '@unc.edu',
+       repeat('body ', 100), (ARRAY['AI_AGENT', 'HUMAN_REQUIRED', 'REDIRECT'])[1 + g % 3], repeat('draft ', 60),
+       random(), g % 3 = 0, g % 50 <> 0 AND g % 7 <> 0, g % 50 <> 0 AND g % 7 = 0, false, 1 + g % 10,
+       now() - g * interval '1 minute', now() - g * interval '1 minute', now() - g * interval '1 minute'
+FROM generate_series(1, :rows) AS g
+"""
+
+
+def hot_queries(history_rows: int, approval_rows: int) -> List[Tuple[str, str, Dict]]:
+    """The queries behind /approval-queue, /email-history and the known-email check"""
+    sample = random.Random(0)
+    known_ids = ([f"hist-{sample.randint(1, history_rows)}" for _ in range(50)]
+                 + [f"appr-{sample.randint(1, approval_rows)}" for _ in range(40)]
+                 + [f"new-{n}" for n in range(10)])
+    return [
+        ("approval queue, all pending for a route",
+         "SELECT * FROM approval_queue WHERE approved = false AND rejected = false AND route = 'AI_AGENT' "
+         "ORDER BY created_at DESC", {}),
+        ("approval queue, first page of 50",
+         "SELECT * FROM approval_queue WHERE approved = false AND rejected = false AND route = 'AI_AGENT' "
+         "ORDER BY created_at DESC, id DESC LIMIT 50", {}),
+        ("email history, first page of 50",
+         "SELECT * FROM email_history ORDER BY processed_at DESC, id DESC LIMIT 50", {}),
+        ("known email ids, batch of 100",
+         "SELECT email_id FROM approval_queue WHERE email_id = ANY(:ids) AND approved IS false AND rejected IS false "
+         "UNION SELECT email_id FROM email_history WHERE email_id = ANY(:ids)", {"ids": known_ids}),
+    ]
+
+
+def explain(conn, sql: str, params: Dict, repeat: int) -> Tuple[float, str]:
+    """Run EXPLAIN ANALYZE `repeat` times; returns the median execution time (ms) and the last plan"""
+    timings = []
+    plan = ""
+    for _ in range(repeat):
+        lines = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params).scalars().all()
+        plan = "\n".join(lines)
+        match = re.search(r"Execution Time: ([\d.]+) ms", plan)
+        timings.append(float(match.group(1)) if match else float("nan"))
+    return statistics.median(timings), plan
+
+
+def run_queries(conn, queries, repeat: int, show_plans: bool, label: str) -> Dict[str, float]:
+    results = {}
+    for name, sql, params in queries:
+        median_ms, plan = explain(conn, sql, params, repeat)
+        results[name] = median_ms
+        if show_plans:
+            print(f"\n--- {label}: {name} ({median_ms:.2f} ms) ---\n{plan}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark hot-path queries with and without the migration indexes")
+    parser.add_argument('--history-rows', type=int, default=1_000_000)
+    parser.add_argument('--approval-rows', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per query, the median is reported")
+    parser.add_argument('--plans', action='store_true', help="Print every query plan")
+    parser.add_argument('--keep', action='store_true', help=f"Keep the {SCHEMA} schema afterwards")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        # Only the scratch schema is visible, so unqualified names (and the migrations) land there
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        try:
+            Base.metadata.create_all(conn, tables=[ApprovalQueue.__table__, EmailHistory.__table__])
+            # email_history is partitioned; one catch-all partition keeps the synthetic rows loadable
+            conn.execute(text("CREATE TABLE email_history_default PARTITION OF email_history DEFAULT"))
+            # Indexes on partitions go away with their parent index
+            indexes = conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = :schema AND indexname NOT LIKE '%_pkey' "
+                "AND tablename IN ('approval_queue', 'email_history')"
+            ), {"schema": SCHEMA}).scalars().all()
+            for index in indexes:
+                if index not in ORIGINAL_INDEXES:
+                    conn.execute(text(f'DROP INDEX "{index}"'))
+
+            print(f"Loading {args.history_rows} email_history and {args.approval_rows} approval_queue rows...")
+            conn.execute(text(LOAD_HISTORY), {"rows": args.history_rows})
+            conn.execute(text(LOAD_APPROVALS), {"rows": args.approval_rows})
+            conn.execute(text("ANALYZE approval_queue"))
+            conn.execute(text("ANALYZE email_history"))
+
+            queries = hot_queries(args.history_rows, args.approval_rows)
+            before = run_queries(conn, queries, args.repeat, args.plans, "before")
+
+            for name, statements in MIGRATIONS:
+                if name in INDEX_MIGRATIONS:
+                    for statement in statements:
+                        conn.execute(text(statement))
+            conn.execute(text("ANALYZE approval_queue"))
+            conn.execute(text("ANALYZE email_history"))
+            after = run_queries(conn, queries, args.repeat, args.plans, "after")
+        finally:
+            if not args.keep:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+    print(f"\n{'query':<45} {'before ms':>12} {'after ms':>12} {'speedup':>9}")
+    for name, _, _ in queries:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<45} {before[name]:>12.2f} {after[name]:>12.2f} {speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Bulk approve, reject and redirect
+Clearing many queue items at once goes through one API call. Every item that
+can be resolved is counted, flagged, written to email_history and, for
+approvals and redirects, queued in the Graph outbox, all in a single
+transaction; the outbox dispatcher then delivers the replies and forwards in
+batched Graph calls. Each item gets its own result, so one bad item does not
+fail the rest.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from analytics import record_resolved
+from models import (ApprovalQueue, BulkApproveRequest, BulkRedirectRequest, BulkRejectRequest,
+                    EmailHistory)
+from outbox import FORWARD, REPLY, enqueue_delivery
+from queue_counts import count_resolved
+
+
+@dataclass
+class BulkItem:
+    """One item of a bulk request and its outcome"""
+    approval_id: str
+    response: Optional[str] = None
+    redirect_to: Optional[str] = None
+    approval: Optional[ApprovalQueue] = None
+    status_code: int = 200
+    message: str = ""
+    delivery_id: Optional[uuid.UUID] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def fail(self, status_code: int, message: str) -> None:
+        self.status_code = status_code
+        self.message = message
+        self.delivery_id = None
+
+
+async def _load_approvals(session: AsyncSession, items: List[BulkItem]) -> None:
+    """
+    Attach each item's pending approval row, failing items that are invalid, missing or already resolved
+
+    The rows stay locked until the transaction ends, so a concurrent single or
+    bulk request on the same approvals waits and then finds them resolved.
+    Locking in id order keeps two bulk requests from deadlocking.
+    """
+    ids: Dict[uuid.UUID, BulkItem] = {}
+    for item in items:
+        try:
+            approval_id = uuid.UUID(item.approval_id)
+        except ValueError:
+            item.fail(400, "Invalid approval id")
+            continue
+        if approval_id in ids:
+            item.fail(400, "Duplicate approval id")
+            continue
+        ids[approval_id] = item
+
+    if ids:
+        result = await session.execute(
+            select(ApprovalQueue).where(ApprovalQueue.id.in_(ids)).order_by(ApprovalQueue.id)
+            .with_for_update().execution_options(populate_existing=True)
+        )
+        for approval in result.scalars():
+            ids[approval.id].approval = approval
+    for item in ids.values():
+        if item.approval is None:
+            item.fail(404, "Approval not found")
+        elif item.approval.approved or item.approval.rejected:
+            # Never send the same reply twice when a bulk request is retried
+            item.fail(409, "Approval already resolved")
+
+
+def _record_resolved(db: Session, items: List[BulkItem], status: str,
+                     delivery: Optional[Callable[[BulkItem], tuple]]) -> None:
+    for item in items:
+        count_resolved(db, item.approval)
+        record_resolved(db, item.approval, status)
+        if delivery:
+            item.delivery_id = enqueue_delivery(db, item.approval, *delivery(item)).id
+            item.status_code = 202
+
+
+def _history_row(approval: ApprovalQueue, status: str, final_response: Optional[str]) -> EmailHistory:
+    return EmailHistory(
+        email_id=approval.email_id,
+        mailbox=approval.mailbox,
+        conversation_id=approval.conversation_id,
+        conversation_index=approval.conversation_index,
+        subject=approval.subject,
+        sender_email=approval.sender_email,
+        route=approval.route,
+        redirect_department=approval.redirect_department,
+        received_at=approval.received_at,
+        final_response=final_response,
+        confidence=approval.confidence,
+        approval_status=status,
+        processed_at=datetime.now()
+    )
+
+
+async def _commit_resolved(session: AsyncSession, items: List[BulkItem], status: str,
+                           apply: Callable[[BulkItem, datetime], Optional[str]],
+                           delivery: Optional[Callable[[BulkItem], tuple]] = None) -> None:
+    """
+    Flag every valid item, write its history row and queue its delivery, all in one transaction
+
+    Args:
+        session: Session the approvals were loaded with
+        items: All items; only the ok ones are written
+        status: approval_status for history and the analytics rollup
+        apply: Flags an item's approval row and returns the final_response for history
+        delivery: (action, mailbox, payload) for enqueue_delivery, None when nothing is sent
+    """
+    done = [item for item in items if item.ok]
+    if not done:
+        return
+    try:
+        # Counters and rollups only count rows that are still pending, so record before flagging
+        await session.run_sync(_record_resolved, done, status, delivery)
+        now = datetime.now()
+        session.add_all([_history_row(item.approval, status, apply(item, now)) for item in done])
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        print(f"Error saving bulk {status} results: {e}")
+        for item in done:
+            item.fail(500, f"Could not save result: {e}")
+
+
+def _results(items: List[BulkItem], status: str) -> Dict[str, Any]:
+    results = []
+    for item in items:
+        result = {
+            "approval_id": item.approval_id,
+            "status": status if item.ok else "error",
+            "status_code": item.status_code,
+            "message": item.message,
+        }
+        if item.delivery_id:
+            result["delivery_id"] = str(item.delivery_id)
+        results.append(result)
+    succeeded = sum(item.ok for item in items)
+    return {"results": results, "succeeded": succeeded, "failed": len(items) - succeeded}
+
+
+async def bulk_approve(session: AsyncSession, request: BulkApproveRequest, user_mailbox: Optional[str]) -> Dict[str, Any]:
+    """
+    Approve many emails and queue their (edited) replies
+
+    Args:
+        session: Request session
+        request: Approval ids with optional staff edits
+        user_mailbox: Signed-in user's address, for approvals from their own mailbox
+    Returns:
+        {"results": per-item outcome in request order, "succeeded": n, "failed": n}
+    """
+    items = [BulkItem(item.approval_id, response=item.staff_edits or None) for item in request.items]
+    await _load_approvals(session, items)
+    for item in items:
+        if item.ok:
+            item.response = item.response or item.approval.generated_response
+            if not item.response:
+                item.fail(400, "No response to send")
+            elif not (item.approval.mailbox or user_mailbox):
+                item.fail(400, "No mailbox to send from")
+
+    def apply(item: BulkItem, now: datetime) -> str:
+        item.approval.approved = True
+        item.approval.approved_at = now
+        item.approval.final_response = item.response
+        return item.response
+
+    await _commit_resolved(session, items, 'approved', apply,
+                           lambda item: (REPLY, item.approval.mailbox or user_mailbox, {"body": item.response}))
+    return _results(items, "queued")
+
+
+async def bulk_reject(session: AsyncSession, request: BulkRejectRequest) -> Dict[str, Any]:
+    """
+    Reject many approvals (no Graph calls)
+
+    Returns:
+        {"results": per-item outcome in request order, "succeeded": n, "failed": n}
+    """
+    items = [BulkItem(approval_id) for approval_id in request.approval_ids]
+    await _load_approvals(session, items)
+
+    def apply(item: BulkItem, now: datetime) -> None:
+        item.approval.rejected = True
+        item.approval.rejected_at = now
+        return None
+
+    await _commit_resolved(session, items, 'rejected', apply)
+    return _results(items, "rejected")
+
+
+async def bulk_redirect(session: AsyncSession, request: BulkRedirectRequest, user_mailbox: Optional[str]) -> Dict[str, Any]:
+    """
+    Redirect many emails and queue their forwards to the departments
+
+    Args:
+        session: Request session
+        request: Approval ids, each with its department address and comment
+        user_mailbox: Signed-in user's address, for emails in their own mailbox
+    Returns:
+        {"results": per-item outcome in request order, "succeeded": n, "failed": n}
+    """
+    items = [BulkItem(item.approval_id, response=item.comment, redirect_to=item.redirect_department_email)
+             for item in request.items]
+    await _load_approvals(session, items)
+    for item in items:
+        if item.ok and not item.redirect_to:
+            item.fail(400, "No department email to redirect to")
+        elif item.ok and not (item.approval.mailbox or user_mailbox):
+            item.fail(400, "No mailbox to forward from")
+
+    def apply(item: BulkItem, now: datetime) -> str:
+        item.approval.approved = True
+        item.approval.approved_at = now
+        item.approval.final_response = item.response
+        return f"Redirected to {item.redirect_to} with comment {item.response}"
+
+    await _commit_resolved(session, items, 'redirected', apply,
+                           lambda item: (FORWARD, item.approval.mailbox or user_mailbox,
+                                         {"to": item.redirect_to, "comment": item.response or ""}))
+    return _results(items, "queued")
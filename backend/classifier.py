@@ -4,6 +4,7 @@ Classifies student billing emails and determines if they're FAQ-eligible
 """
 import json
 import os
+import asyncio
 from typing import Dict, Optional, Any
 from openai import AzureOpenAI
 from dotenv import load_dotenv
@@ -37,6 +38,62 @@ class EmailClassifier:
         
         self.llm = llm
     
+    async def classify_email(self, email: Email, thread_messages: list[dict[str, Any]], email_reader) -> Optional[EmailClassification]:
+        """
+        Classify a single email (or its thread) into 'AI_AGENT', 'HUMAN_REQUIRED' or 'REDIRECT'
+        
+        Args:
+            email: Email object to classify
+            thread_messages: Messages in the email's conversation thread
+            email_reader: EmailReader instance for formatting thread context
+        
+        Returns:
+            EmailClassification, or None if the llm call or its output failed
+        """
+        # Format context based on whether it's a thread or single email
+        if thread_messages and len(thread_messages) > 1:
+            # Multi-message thread - use full thread context for accurate classification
+            user_content = email_reader.format_thread_classification_context(thread_messages, email.id)
+        else:
+            # Single email - just use subject and body
+            usercontent = "=== EMAIL TO CLASSIFY (SINGLE MESSAGE) ===\n"
+            usercontent += f"From: {email.sender} <{email.sender_email}>\n"
+            usercontent += f"Date: {email.received_at}\n"
+            usercontent += f"Subject: {email.subject}\n"
+            usercontent += f"Body: {email.body}\n"
+            usercontent += "=== END OF EMAIL ===\n"
+            user_content = usercontent
+        
+        print(f'Thread context: {user_content}')
+        
+        try:
+            # The OpenAI client is synchronous, run it off the event loop so
+            # several classifications can be in flight at once
+            response = await asyncio.to_thread(
+                self.llm.chat.completions.create,
+                model="gpt-5-chat",
+                messages=[
+                    {"role": "system", "content": triage_prompt},
+                    {"role": "user", "content": user_content}
+                ]
+            )
+            # Parse the JSON string response
+            result = json.loads(response.choices[0].message.content)
+            if result['route'] not in ('AI_AGENT', 'HUMAN_REQUIRED', 'REDIRECT'):
+                print(f"Unknown route from classifier: {result['route']}")
+                return None
+            return EmailClassification(
+                email_id=email.id,
+                email=email,
+                route=result['route'],
+                redirect_department=result.get('department') if result['route'] == 'REDIRECT' else None,
+                confidence=result['confidence'],
+                reason=result['reason']
+            )
+        except Exception as e:
+            print(f"Error classifying email: {e}")
+            return None
+
     async def classify_emails(self, emails: list[Email], email_threads_dict: dict[str, list[dict[str, Any]]], email_reader) -> tuple[list[EmailClassification], list[EmailClassification], list[EmailClassification]]:
         """
         Classify emails, the llm will return a list of dictionaries, each dictionary is a classification result for an 
@@ -50,71 +107,19 @@ class EmailClassifier:
         Returns:
             tuple[list[EmailClassification], list[EmailClassification], list[EmailClassification]]
         """
-        prompt = triage_prompt
         agent_emails = []
         human_emails = []
         redirect_emails = []
         
         for email in emails:
-            thread_messages = email_threads_dict.get(email.id, [])
-            
-            # Format context based on whether it's a thread or single email
-            if thread_messages and len(thread_messages) > 1:
-                # Multi-message thread - use full thread context for accurate classification
-                user_content = email_reader.format_thread_classification_context(thread_messages, email.id)
-            else:
-                # Single email - just use subject and body
-                usercontent = "=== EMAIL TO CLASSIFY (SINGLE MESSAGE) ===\n"
-                usercontent += f"From: {email.sender} <{email.sender_email}>\n"
-                usercontent += f"Date: {email.received_at}\n"
-                usercontent += f"Subject: {email.subject}\n"
-                usercontent += f"Body: {email.body}\n"
-                usercontent += "=== END OF EMAIL ===\n"
-                user_content = usercontent
-            
-            print(f'Thread context: {user_content}')
-            
-            try:
-                response = self.llm.chat.completions.create(
-                    model="gpt-5-chat",
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": user_content}
-                    ]
-                )
-                # Parse the JSON string response
-                result = json.loads(response.choices[0].message.content)
-                if result['route'] == 'AI_AGENT':
-                    agent_emails.append(
-                        EmailClassification(
-                            email_id=email.id,
-                            email=email,
-                            route='AI_AGENT',
-                            confidence=result['confidence'],
-                            reason=result['reason']
-                        )
-                    )
-                elif result['route'] == 'HUMAN_REQUIRED':
-                    human_emails.append(
-                    EmailClassification(
-                        email_id=email.id,
-                        email=email,
-                        route='HUMAN_REQUIRED',
-                        confidence=result['confidence'],
-                        reason=result['reason']
-                    ))
-                elif result['route'] == 'REDIRECT':
-                    redirect_emails.append(EmailClassification(
-                        email_id=email.id,
-                        email=email,
-                        route='REDIRECT',
-                        redirect_department=result['department'],
-                        confidence=result['confidence'],
-                        reason=result['reason']
-                    ))
-                
-            except Exception as e:
-                print(f"Error classifying email: {e}")
+            classification = await self.classify_email(email, email_threads_dict.get(email.id, []), email_reader)
+            if classification is None:
                 continue
+            if classification.route == 'AI_AGENT':
+                agent_emails.append(classification)
+            elif classification.route == 'HUMAN_REQUIRED':
+                human_emails.append(classification)
+            elif classification.route == 'REDIRECT':
+                redirect_emails.append(classification)
 
         return human_emails, agent_emails, redirect_emails
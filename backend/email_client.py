@@ -13,26 +13,45 @@ from azure.identity import ClientSecretCredential
 import asyncio
 import httpx
 import re
+from urllib.parse import quote
 from models import Email
 from fastapi import HTTPException
 
+# Graph accepts at most 20 sub-requests per $batch call
+GRAPH_BATCH_LIMIT = 20
+GRAPH_BATCH_RETRIES = 3
+
+
 class EmailClient:
     """
     Refactored to use the User's Access Token directly.
     """
     
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, mailbox: Optional[str] = None):
         """
         Initialize with the token sent from the Frontend.
+
+        Args:
+            access_token: Graph access token
+            mailbox: Shared mailbox (user id or address) to work on; None means the signed-in user's own mailbox
         """
         self.access_token = access_token
+        self.mailbox = mailbox
         self.base_url = "https://graph.microsoft.com/v1.0"
+        # /users/{id} targets a shared mailbox, /me the token owner's
+        self.mailbox_path = f"/users/{mailbox}" if mailbox else "/me"
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json",
             "Prefer": 'outlook.body-content-type="text"'
         }
 
+    def for_mailbox(self, mailbox: Optional[str]) -> "EmailClient":
+        """Return a client with the same token that targets another mailbox"""
+        if mailbox == self.mailbox:
+            return self
+        return EmailClient(access_token=self.access_token, mailbox=mailbox)
+
     async def get_unread_emails(self, max_results: int = 10) -> list[Email]:
         async with httpx.AsyncClient() as client:
             params = {
@@ -42,7 +61,7 @@ class EmailClient:
                 '$select': 'id,subject,bodyPreview,from,receivedDateTime,isRead,body,conversationId,conversationIndex'
             }
             
-            response = await client.get(f"{self.base_url}/me/messages", headers=self.headers, params=params)
+            response = await client.get(f"{self.base_url}{self.mailbox_path}/messages", headers=self.headers, params=params)
             
             # Handle the 401 we debugged earlier
             if response.status_code == 401:
@@ -70,7 +89,8 @@ class EmailClient:
                     sender=sender_info.get('name', 'Unknown'),
                     sender_email=sender_info.get('address', 'unknown'),
                     received_at=msg.get('receivedDateTime'),
-                    is_read=msg.get('isRead')
+                    is_read=msg.get('isRead'),
+                    mailbox=self.mailbox
                 ))
             
             
@@ -80,7 +100,7 @@ class EmailClient:
         async with httpx.AsyncClient() as client:
             payload = {"isRead": True}
             response = await client.patch(
-                f"{self.base_url}/me/messages/{email_id}", 
+                f"{self.base_url}{self.mailbox_path}/messages/{email_id}", 
                 headers=self.headers, 
                 json=payload
             )
@@ -107,7 +127,7 @@ class EmailClient:
         }
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(
-                f"{self.base_url}/me/messages/{email_id}/forward",
+                f"{self.base_url}{self.mailbox_path}/messages/{email_id}/forward",
                 headers=self.headers,
                 json=request_body,
             )
@@ -127,7 +147,7 @@ class EmailClient:
         """
         Send TRUE REPLY to an existing email - maintains thread connection
         
-        Uses /me/messages/{id}/reply endpoint instead of sendMail
+        Uses {mailbox}/messages/{id}/reply endpoint instead of sendMail
         Automatically sets: In-Reply-To, References, Thread-Index headers
         """
         # First, get the original message to validate it exists and get thread info
@@ -150,7 +170,7 @@ class EmailClient:
         
         async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(
-                f"{self.base_url}/me/messages/{original_email_id}/reply",
+                f"{self.base_url}{self.mailbox_path}/messages/{original_email_id}/reply",
                 headers=self.headers,
                 json=payload
             )
@@ -162,6 +182,89 @@ class EmailClient:
                 "thread_id": original_msg.get("conversationId")
             }
     
+    def create_reply_request(self, request_id: str, email_id: str, body: str, importance: str = "normal") -> dict[str, Any]:
+        """$batch sub-request that saves the reply send_reply would send as a draft; the response body is the draft"""
+        return self._batch_request(request_id, "POST", f"/messages/{email_id}/createReply", {
+            "message": {
+                "importance": importance.lower(),
+                "body": {"contentType": "html", "content": self._format_as_html(body)}
+            }
+        })
+
+    def create_forward_request(self, request_id: str, email_id: str, redirect_department_email: str,
+                               comment: str = "") -> dict[str, Any]:
+        """$batch sub-request that saves the forward forward_email would send as a draft"""
+        return self._batch_request(request_id, "POST", f"/messages/{email_id}/createForward", {
+            "comment": comment,
+            "toRecipients": [{"emailAddress": {"address": redirect_department_email}}],
+        })
+
+    def send_draft_request(self, request_id: str, draft_id: str) -> dict[str, Any]:
+        """$batch sub-request that sends a draft; a draft can only be sent once (then it is 404)"""
+        return self._batch_request(request_id, "POST", f"/messages/{draft_id}/send")
+
+    def find_sent_request(self, request_id: str, internet_message_id: str) -> dict[str, Any]:
+        """$batch sub-request that looks for a sent message in Sent Items by its internetMessageId"""
+        message_filter = quote("internetMessageId eq '{}'".format(internet_message_id.replace("'", "''")))
+        return self._batch_request(request_id, "GET",
+                                   f"/mailFolders/sentitems/messages?$filter={message_filter}&$select=id&$top=1")
+
+    def mark_read_request(self, request_id: str, email_id: str) -> dict[str, Any]:
+        """$batch sub-request equivalent to mark_as_read"""
+        return self._batch_request(request_id, "PATCH", f"/messages/{email_id}", {"isRead": True})
+
+    def _batch_request(self, request_id: str, method: str, path: str,
+                       body: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        request = {"id": request_id, "method": method, "url": f"{self.mailbox_path}{path}"}
+        if body is not None:
+            request["headers"] = {"Content-Type": "application/json"}
+            request["body"] = body
+        return request
+
+    async def send_batch(self, requests: list[dict[str, Any]], client: Optional[httpx.AsyncClient] = None,
+                         retries: int = GRAPH_BATCH_RETRIES) -> dict[str, dict[str, Any]]:
+        """
+        Run up to GRAPH_BATCH_LIMIT sub-requests in one Graph $batch call
+
+        Sub-requests throttled by Graph (429/503) are sent again after Retry-After,
+        up to `retries` times.
+
+        Args:
+            requests: Sub-requests from the *_request builders
+            client: HTTP client to reuse; a new one is opened if None
+            retries: Number of resends for throttled sub-requests
+        Returns:
+            {"status": int, "body": parsed body or text} per sub-request id
+        """
+        if len(requests) > GRAPH_BATCH_LIMIT:
+            raise ValueError(f"A Graph batch holds at most {GRAPH_BATCH_LIMIT} requests")
+        if client is None:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                return await self.send_batch(requests, client, retries)
+
+        results: dict[str, dict[str, Any]] = {}
+        pending = requests
+        for attempt in range(retries + 1):
+            response = await client.post(f"{self.base_url}/$batch", headers=self.headers, json={"requests": pending})
+            if response.status_code != 200:
+                # The whole batch was refused, so every sub-request failed the same way
+                for request in pending:
+                    results[request["id"]] = {"status": response.status_code, "body": response.text}
+                return results
+
+            retry_after = 0
+            throttled = set()
+            for item in response.json().get("responses", []):
+                results[item["id"]] = {"status": int(item["status"]), "body": item.get("body")}
+                if int(item["status"]) in (429, 503):
+                    throttled.add(item["id"])
+                    retry_after = max(retry_after, int((item.get("headers") or {}).get("Retry-After", 1)))
+            pending = [request for request in pending if request["id"] in throttled]
+            if not pending or attempt == retries:
+                break
+            await asyncio.sleep(retry_after)
+        return results
+
     def _format_as_html(self, body: str) -> str:
         """Convert plain text to HTML with proper formatting"""
         # Check if already HTML
@@ -210,7 +313,7 @@ class EmailClient:
             }
             print(f"🔍 Fetching thread for conversationId: {conversation_id[:50]}...")
             response = await client.get(
-                f"{self.base_url}/me/messages",
+                f"{self.base_url}{self.mailbox_path}/messages",
                 headers=self.headers,
                 params=params
             )
@@ -309,7 +412,7 @@ class EmailClient:
         """Helper: Fetch single message by ID"""
         async with httpx.AsyncClient() as client:
             response = await client.get(
-                f"{self.base_url}/me/messages/{message_id}",
+                f"{self.base_url}{self.mailbox_path}/messages/{message_id}",
                 headers=self.headers
             )
             if response.status_code == 200:
@@ -1,105 +1,249 @@
 #This file abstracts the email preprocessing like fetching, sending to the azure client and returns the result of fetch-triage
-#TODO: add a function to check if the email is already in the approval queue or history
+#Emails flow through a staged pipeline: fetch thread -> classify -> generate -> persist
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, AsyncGenerator, Dict, Any
+from typing import Optional, AsyncGenerator, Dict, Any, List
 import asyncio
 import json
+import os
+import uuid
 
-from models import ApprovalQueue, EmailHistory, db
+from models import SessionLocal
 from email_client import EmailClient
 from models import Email
+from classifier import EmailClassification
+from pipeline import Pipeline, Stage, PipelineOutcome
+from mailboxes import FairScheduler
+from priority_scorer import PriorityScorer
+from analytics import record_received
+from queue_counts import count_inserted
+from repository import known_email_ids, exhausted_email_ids, insert_approvals_checkpointed, record_failure, clear_failures, claim_emails, release_claims
+
+# Worker counts per stage; persist stays at 1 because all writes share one session
+FETCH_WORKERS = int(os.getenv('TRIAGE_FETCH_WORKERS', 8))
+CLASSIFY_WORKERS = int(os.getenv('TRIAGE_CLASSIFY_WORKERS', 4))
+GENERATE_WORKERS = int(os.getenv('TRIAGE_GENERATE_WORKERS', 3))
+STAGE_QUEUE_SIZE = int(os.getenv('TRIAGE_STAGE_QUEUE_SIZE', 16))
+PERSIST_BATCH_SIZE = int(os.getenv('TRIAGE_PERSIST_BATCH_SIZE', 25))
+# Emails that failed this many runs are left for staff instead of being retried (0 = always retry)
+MAX_TRIAGE_ATTEMPTS = int(os.getenv('TRIAGE_MAX_ATTEMPTS', 3))
+# How long a run's claim on an email holds if the run dies without releasing it
+CLAIM_TTL_SECONDS = int(os.getenv('TRIAGE_CLAIM_TTL_SECONDS', 900))
+
+ROUTE_COUNT_KEYS = {"AI_AGENT": "ai_agent", "HUMAN_REQUIRED": "human", "REDIRECT": "redirect"}
+
+# Compiled once per process and shared by every run
+priority_scorer = PriorityScorer()
+
+
+@dataclass
+class TriageItem:
+    """State carried by one email through the pipeline stages"""
+    email: Email
+    priority: int = 1
+    thread_messages: List[Dict[str, Any]] = field(default_factory=list)
+    classification: Optional[EmailClassification] = None
+    generated_response: Optional[str] = None
+    error: Optional[str] = None  # why a stage dropped the item, recorded as a failure
+
 
 class EmailEngine:
 
-    def __init__(self,emails, email_client,agent,classifier) -> None:
+    def __init__(self,emails, email_client,agent,classifier, thread_messages: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> None:
         self.email_client= email_client
         self.agent = agent
         self.emails = emails
-        self.email_threads_dict = {}
+        # Threads captured at ingestion time (work queue items) skip the Graph fetch
+        self.preloaded_threads = thread_messages or {}
         self.classifier = classifier
-        self.counts = {"processed": 0, "skipped": 0, "human": 0, "redirect": 0, "ai_agent": 0}
-    
+        self.priorities: Dict[str, int] = {}
+        # Why prepare_emails dropped an email: held by another run, already queued or processed,
+        # or out of retry attempts
+        self.claimed_elsewhere: set = set()
+        self.known_ids: set = set()
+        self.exhausted_ids: set = set()
+        self.run_id = uuid.uuid4()
+        self.counts = {"processed": 0, "skipped": 0, "failed": 0, "human": 0, "redirect": 0, "ai_agent": 0}
+        self.pipeline = Pipeline([
+            Stage("fetch_thread", self._fetch_thread_stage, workers=FETCH_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+            Stage("classify", self._classify_stage, workers=CLASSIFY_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+            Stage("generate", self._generate_stage, workers=GENERATE_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+            Stage("persist", self._persist_stage, workers=1, queue_size=STAGE_QUEUE_SIZE, batch_size=PERSIST_BATCH_SIZE),
+        ])
+
+
+    def prepare_emails(self) -> int:
+        """
+        Claim the batch for this run, then drop emails that need no work
+
+        Claiming first means an email another run persisted and released is seen
+        as known here, and an email another run is still working on is never
+        claimed, so each email is processed by exactly one run. Blocking: async
+        callers run it with asyncio.to_thread.
+
+        Returns:
+            Number of emails skipped
+        """
+        try:
+            skipped = self.claim_emails() + self.filter_known_emails()
+        except Exception:
+            self.release_claims()
+            raise
+        self.prioritize_emails()
+        return skipped
+
+    def prioritize_emails(self) -> None:
+        '''
+        Order the batch so urgent emails (financial holds, blocked registration, ...)
+        reach the classify and generate stages first
+
+        Emails are sorted by priority within each mailbox, then shared mailboxes are
+        interleaved so a flooded inbox does not starve the others.
+        '''
+        self.priorities = priority_scorer.score_batch(self.emails)
+        by_priority = sorted(self.emails, key=lambda email: self.priorities[email.id], reverse=True)
+        self.emails = FairScheduler().schedule(by_priority)
+
+    def claim_emails(self) -> int:
+        """
+        Keep only the emails this run managed to claim
+
+        Returns:
+            Number of emails skipped because another run holds them
+        """
+        with SessionLocal() as session:
+            claimed = claim_emails(session, [email.id for email in self.emails], self.run_id, CLAIM_TTL_SECONDS)
+            session.commit()
+        before = len(self.emails)
+        self.claimed_elsewhere = {email.id for email in self.emails if email.id not in claimed}
+        self.emails = [email for email in self.emails if email.id in claimed]
+        skipped = before - len(self.emails)
+        self.counts["skipped"] += skipped
+        return skipped
 
-    def is_duplicate(self, email_id: str) -> bool:
-        """Check if email already exists in pending queue or history"""
-        existing_pending = db.query(ApprovalQueue).filter_by(email_id=email_id, rejected=False, approved=False).first()
-        existing_processed = db.query(EmailHistory).filter_by(email_id=email_id).first()
-        return existing_pending is not None or existing_processed is not None
+    def release_claims(self) -> None:
+        """Release this run's claims so other runs see the emails as free (or, once persisted, as known)"""
+        try:
+            with SessionLocal() as session:
+                release_claims(session, self.run_id)
+                session.commit()
+        except Exception as e:
+            # Claims expire on their own after CLAIM_TTL_SECONDS
+            print(f"⚠️ Could not release claims for run {self.run_id}: {e}")
+
+    def filter_known_emails(self) -> int:
+        """
+        Drop emails that are already pending or processed before any Graph or LLM work,
+        along with emails that have used up their retry attempts
+
+        Returns:
+            Number of emails skipped
+        """
+        email_ids = [email.id for email in self.emails]
+        with SessionLocal() as session:
+            self.known_ids = known_email_ids(session, email_ids)
+            self.exhausted_ids = exhausted_email_ids(session, email_ids, MAX_TRIAGE_ATTEMPTS) - self.known_ids
+        known = self.known_ids | self.exhausted_ids
+        new_emails = []
+        seen = set()
+        for email in self.emails:
+            if email.id in known or email.id in seen:
+                continue
+            seen.add(email.id)
+            new_emails.append(email)
+        skipped = len(self.emails) - len(new_emails)
+        self.emails = new_emails
+        self.counts["skipped"] += skipped
+        return skipped
 
 
-    # Fetch all threads in parallel
     async def fetch_thread(self, email):
         if not email.conversation_id:
             return email.id, []
         try:
-            msgs = await self.email_client.get_conversation_messages(email.conversation_id)
+            msgs = await self.email_client.for_mailbox(email.mailbox).get_conversation_messages(email.conversation_id)
             return email.id, msgs
         except Exception as e:
             print(f"⚠️ Thread fetch failed for {email.id}: {e}")
             return email.id, []
-    
+
 
     async def process_emails(self):
         """Non-streaming version for regular endpoint"""
-        results = await asyncio.gather(*[self.fetch_thread(email) for email in self.emails])
-        self.email_threads_dict = dict(results)
+        await asyncio.to_thread(self.prepare_emails)
+        async for _ in self.run_pipeline():
+            pass
+        return self._get_result()
 
-        human_emails, agent_emails, redirect_emails = await self.classifier.classify_emails(self.emails, self.email_threads_dict, self.email_client)
+    async def process_emails_stream(self) -> AsyncGenerator[str, None]:
+        """Streaming version that yields SSE progress events, one per finished email"""
+        async for event in self.process_emails_events():
+            yield self._sse_event(event)
 
-        self.process_redirect_emails(redirect_emails)
-        self.process_human_emails(human_emails)
-        await self.process_agent_emails(agent_emails)
+    async def process_emails_events(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Yield progress events as dicts, ending with a 'done' or 'error' event"""
+        try:
+            skipped = await asyncio.to_thread(self.prepare_emails)
+            total = len(self.emails)
+            yield {
+                'progress': 15,
+                'step': f'Triaging {total} new email(s), skipped {skipped} already queued or in progress...'
+            }
 
-        self.counts["processed"] = self.counts["redirect"] + self.counts["human"] + self.counts["ai_agent"]
-        if self.counts["processed"] > 0:
-            db.commit()
+            finished = 0
+            async for outcome in self.run_pipeline():
+                finished += 1
+                email = outcome.item.email
+                event = {
+                    'progress': 15 + int((finished / max(total, 1)) * 80),
+                    'step': f'{self._describe_outcome(outcome)} ({finished}/{total})',
+                    'email_id': email.id,
+                    'subject': email.subject,
+                }
+                if outcome.item.classification is not None:
+                    event['route'] = outcome.item.classification.route
+                yield event
 
-        return self._get_result()
+            yield {
+                'status': 'done', 'progress': 100, 'step': 'Complete!',
+                'results': self.counts, 'metrics': self.pipeline.get_metrics()
+            }
 
-    async def process_emails_stream(self) -> AsyncGenerator[str, None]:
-        """Streaming version that yields SSE progress events"""
+        except Exception as e:
+            yield {'status': 'error', 'message': str(e)}
+
+    async def run_pipeline(self) -> AsyncGenerator[PipelineOutcome, None]:
+        """Run every email through the pipeline, updating counts as emails leave it"""
         try:
-            # Step 1: Fetch threads
-            yield self._sse_event({'progress': 15, 'step': 'Fetching conversation threads...'})
-            results = await asyncio.gather(*[self.fetch_thread(email) for email in self.emails])
-            self.email_threads_dict = dict(results)
-
-            # Step 2: Classify
-            yield self._sse_event({'progress': 30, 'step': 'Classifying emails...'})
-            human_emails, agent_emails, redirect_emails = await self.classifier.classify_emails(
-                self.emails, self.email_threads_dict, self.email_client
-            )
-            
-            yield self._sse_event({
-                'progress': 50, 
-                'step': f'Classified: {len(agent_emails)} AI, {len(human_emails)} human, {len(redirect_emails)} redirect'
-            })
-
-            # Step 3: Process redirect emails
-            yield self._sse_event({'progress': 55, 'step': 'Processing redirect emails...'})
-            self.process_redirect_emails(redirect_emails)
-
-            # Step 4: Process human emails
-            yield self._sse_event({'progress': 65, 'step': 'Processing human-required emails...'})
-            self.process_human_emails(human_emails)
-
-            # Step 5: Process AI agent emails with per-email progress
-            total_agent = len(agent_emails)
-            for i, classification in enumerate(agent_emails):
-                progress = 70 + int((i / max(total_agent, 1)) * 25)
-                yield self._sse_event({'progress': progress, 'step': f'Generating AI response {i+1}/{total_agent}...'})
-                await self._process_single_agent_email(classification)
-
-            # Commit and complete
-            self.counts["processed"] = self.counts["redirect"] + self.counts["human"] + self.counts["ai_agent"]
-            if self.counts["processed"] > 0:
-                db.commit()
-
-            yield self._sse_event({'status': 'done', 'progress': 100, 'step': 'Complete!', 'results': self.counts})
+            async for outcome in self.pipeline.run(
+                TriageItem(email=email, priority=self.priorities.get(email.id, 1)) for email in self.emails
+            ):
+                if outcome.item is None:
+                    raise RuntimeError(f"Could not read the emails to triage: {outcome.error}")
+                error = outcome.error or outcome.item.error
+                if error is not None:
+                    self.counts["failed"] += 1
+                    await asyncio.to_thread(self._record_failure, outcome.item, outcome.stage, error)
+                yield outcome
+        finally:
+            await asyncio.to_thread(self.release_claims)
+        self.counts["processed"] = self.counts["redirect"] + self.counts["human"] + self.counts["ai_agent"]
 
+    def _record_failure(self, item: TriageItem, stage: str, error: str) -> None:
+        '''Record a failed email in its own commit so it survives whatever happens next'''
+        try:
+            with SessionLocal() as session:
+                record_failure(session, item.email.id, stage, error, item.email.subject)
+                session.commit()
         except Exception as e:
-            db.rollback()
-            yield self._sse_event({'status': 'error', 'message': str(e)})
+            print(f"⚠️ Could not record failure for {item.email.id}: {e}")
+
+    def _describe_outcome(self, outcome: PipelineOutcome) -> str:
+        if outcome.completed:
+            return f"Queued {outcome.item.classification.route}: {outcome.item.email.subject[:40]}"
+        if outcome.error is not None:
+            return f"Failed at {outcome.stage}: {outcome.item.email.subject[:40]}"
+        return f"Skipped at {outcome.stage}: {outcome.item.email.subject[:40]}"
 
     def _sse_event(self, data: Dict[str, Any]) -> str:
         """Format data as SSE event"""
@@ -114,120 +258,111 @@ class EmailEngine:
             "ai_agent": self.counts["ai_agent"],
             "human_required": self.counts["human"],
             "redirect": self.counts["redirect"],
-            "skipped": self.counts["skipped"]
+            "skipped": self.counts["skipped"],
+            "failed": self.counts["failed"],
+            "metrics": self.pipeline.get_metrics()
         }
-    
 
-    def process_redirect_emails(self, redirect_emails):
+    async def _fetch_thread_stage(self, item: TriageItem) -> TriageItem:
+        '''Attach the conversation thread to the item'''
+        if item.email.id in self.preloaded_threads:
+            item.thread_messages = self.preloaded_threads[item.email.id]
+            return item
+        _, item.thread_messages = await self.fetch_thread(item.email)
+        return item
+
+    async def _classify_stage(self, item: TriageItem) -> Optional[TriageItem]:
+        '''Classify the email; unclassifiable emails are dropped'''
+        item.classification = await self.classifier.classify_email(item.email, item.thread_messages, self.email_client)
+        if item.classification is None:
+            item.error = "Classification failed"
+            return None
+        return item
+
+    async def _generate_stage(self, item: TriageItem) -> Optional[TriageItem]:
         '''
-        Process redirect emails and add to the approval queue  
-        
+        Generate an AI draft for AI_AGENT emails, other routes pass straight through
+
         Args:
-            redirect_emails: list of EmailClassification objects
+            item: TriageItem with a classification
         Returns:
-            None
+            The item, or None if the agent produced no response (email is not queued)
         '''
-        for classification in redirect_emails:
-            email = classification.email
-            if self.is_duplicate(email.id):
-                self.counts["skipped"] += 1
-                continue
-            
-            db.add(ApprovalQueue(
-                email_id=email.id,
-                conversation_id=email.conversation_id,
-                conversation_index=email.conversation_index,
-                subject=email.subject,
-                sender_email=email.sender_email,
-                body=email.body,
-                route='REDIRECT',
-                received_at=email.received_at,
-                redirect_department=classification.redirect_department,
-                confidence=classification.confidence,
-                agent_used=False,
-                approved=False,
-                created_at=datetime.now()
-            ))
-            self.counts["redirect"] += 1
-        
-    def process_human_emails(self, human_emails):
+        if item.classification.route != 'AI_AGENT':
+            return item
+
+        # Fetch full thread context for the AI agent
+        thread_context = ""
+        if item.thread_messages:
+            print(f"Thread messages: length {len(item.thread_messages)}")
+            thread_context = self.email_client.format_thread_context(item.thread_messages, item.email.id)
 
+        # Generate AI response with thread context
+        response = await self.agent.query_agent(item.email.subject, item.email.body, thread_context)
+        if not response or not response.get('response'):
+            item.error = (response or {}).get('error') or "Agent returned no response"
+            return None
+        item.generated_response = response['response']
+        return item
+
+    async def _persist_stage(self, items: List[TriageItem]) -> List[TriageItem]:
         '''
-        Process human emails and add to the approval queue
-        
+        Write a micro-batch of items to the approval queue and commit it
+
+        Each micro-batch is its own checkpoint, so drafts generated so far are kept
+        even if a later email or batch fails.
+
         Args:
-            human_emails: list of EmailClassification objects
+            items: Classified (and, for AI_AGENT, generated) items
         Returns:
-            None
+            Items that were inserted; rows that already existed are skipped and
+            rows that failed to insert are dropped with their error
         '''
-        for classification in human_emails:
-            email = classification.email
-            if self.is_duplicate(email.id):
+        # Blocking driver calls (multi-row INSERT, savepoints) run off the event loop
+        inserted, errors = await asyncio.to_thread(self._write_approvals, [self._approval_values(item) for item in items])
+
+        persisted = []
+        for item in items:
+            if item.email.id in errors:
+                item.error = errors[item.email.id]
+                continue
+            if item.email.id not in inserted:
                 self.counts["skipped"] += 1
                 continue
-            
-            db.add(ApprovalQueue(
-                email_id=email.id,
-                conversation_id=email.conversation_id,
-                conversation_index=email.conversation_index,
-                subject=email.subject,
-                sender_email=email.sender_email,
-                body=email.body,
-                received_at=email.received_at,
-                route='HUMAN_REQUIRED',
-                confidence=classification.confidence,
-                agent_used=False,
-                approved=False,
-                created_at=datetime.now()
-            ))
-            self.counts["human"] += 1
-
-    async def process_agent_emails(self, agent_emails):
-        '''
-        Process agent emails and add to the approval queue
-        
-        Args:
-            agent_emails: list of EmailClassification objects
-        Returns:
-            None  
-        '''
-        for classification in agent_emails:
-            await self._process_single_agent_email(classification)
-
-    async def _process_single_agent_email(self, classification):
-        '''Process a single agent email classification'''
-        email = classification.email
-        if self.is_duplicate(email.id):
-            self.counts["skipped"] += 1
-            return
-        
-        # Fetch full thread context for the AI agent
-        thread_context = ""
-        thread_messages = self.email_threads_dict.get(email.id, [])
-        if thread_messages:
-            print(f"Thread messages: length {len(thread_messages)}")
-            thread_context = self.email_client.format_thread_context(thread_messages, email.id)
-        
-        # Generate AI response with thread context
-        response = await self.agent.query_agent(email.subject, email.body, thread_context)
-        
-        if response and response.get('response'):
-            db.add(ApprovalQueue(
-                email_id=email.id,
-                conversation_id=email.conversation_id,
-                conversation_index=email.conversation_index,
-                subject=email.subject,
-                sender_email=email.sender_email,
-                body=email.body,
-                route='AI_AGENT',
-                received_at=email.received_at,
-                generated_response=response['response'],
-                confidence=classification.confidence,
-                agent_used=True,
-                approved=False,
-                created_at=datetime.now()
-            ))
-            self.counts["ai_agent"] += 1
-
+            self.counts[ROUTE_COUNT_KEYS[item.classification.route]] += 1
+            persisted.append(item)
+        return persisted
 
+    def _write_approvals(self, rows: List[Dict[str, Any]]) -> tuple[Dict[str, uuid.UUID], Dict[str, str]]:
+        '''Insert approval rows, clear their failures and update the counters in one short-lived session'''
+        with SessionLocal() as session:
+            inserted, errors = insert_approvals_checkpointed(session, rows)
+            clear_failures(session, inserted.keys())
+            new_rows = [row for row in rows if row['email_id'] in inserted]
+            count_inserted(session, new_rows)
+            record_received(session, new_rows)
+            session.commit()
+        return inserted, errors
 
+    def _approval_values(self, item: TriageItem) -> Dict[str, Any]:
+        '''Build the ApprovalQueue column values for a classified item'''
+        email = item.email
+        classification = item.classification
+        return dict(
+            email_id=email.id,
+            mailbox=email.mailbox,
+            conversation_id=email.conversation_id,
+            conversation_index=email.conversation_index,
+            subject=email.subject,
+            sender_email=email.sender_email,
+            body=email.body,
+            route=classification.route,
+            received_at=email.received_at,
+            redirect_department=classification.redirect_department,
+            generated_response=item.generated_response,
+            confidence=classification.confidence,
+            priority=item.priority,
+            agent_used=classification.route == 'AI_AGENT',
+            approved=False,
+            created_at=datetime.now()
+        )
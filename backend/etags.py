@@ -0,0 +1,49 @@
+"""
+ETags for list endpoints
+Postgres bumps a per-table counter in table_versions at the end of every
+statement that writes approval_queue or email_history (migration 046). The
+counter is the ETag, so answering If-None-Match is one primary-key lookup and
+an unchanged list costs a header-only 304 instead of a query and a body.
+"""
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import TableVersion
+
+# Browsers may keep the response but must revalidate it on every use
+CACHE_CONTROL = "no-cache"
+
+
+async def table_etag(session: AsyncSession, table: str) -> str:
+    """
+    Weak ETag for the current version of a table
+
+    Read it before the rows: if the table changes in between, the response
+    carries the older version and the next request simply fetches again.
+    """
+    version = (await session.execute(select(TableVersion.version).where(TableVersion.name == table))).scalar()
+    return f'W/"{table}-{version or 0}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag"""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored on both sides
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
@@ -0,0 +1,297 @@
+"""
+Monthly partitions and archival for email_history
+email_history is range-partitioned by month on processed_at, so history queries
+only scan the partitions their time range covers. HistoryMaintainer keeps the
+next few months' partitions created and, once a month falls out of the retention
+window, exports its partition to a gzipped JSONL file and drops it. Archived
+months stay searchable with search_archives.
+
+    python history_archive.py maintain
+    python history_archive.py search refund --since 2024-03-01 --until 2024-04-01
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+PARENT_TABLE = "email_history"
+# Partitions created ahead of the current month
+PARTITION_MONTHS_AHEAD = int(os.getenv('HISTORY_PARTITION_MONTHS_AHEAD', 3))
+# Months kept in the database (the current month included); 0 keeps everything
+HISTORY_RETENTION_MONTHS = int(os.getenv('HISTORY_RETENTION_MONTHS', 24))
+HISTORY_ARCHIVE_DIR = Path(os.getenv('HISTORY_ARCHIVE_DIR', Path(__file__).parent / 'archive'))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv('HISTORY_MAINTENANCE_INTERVAL_SECONDS', 6 * 3600))
+
+# Arbitrary key for the advisory lock that keeps maintenance to one process at a time
+MAINTENANCE_LOCK_ID = 4102
+
+_PARTITION_NAME = re.compile(rf'^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$')
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month `months` after `month`"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Month covered by a partition or archive name, None if it is not a monthly one"""
+    match = _PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Create the partitions for the current month and the next `months_ahead` months
+
+    Args:
+        engine: Engine for the database holding email_history
+        months_ahead: Number of future months to create
+    Returns:
+        Names of the partitions that did not exist yet
+    """
+    current = month_start(datetime.now())
+    with engine.begin() as conn:
+        existing = set(list_partitions(conn))
+        created = []
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(month)
+            if name in existing:
+                continue
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF {PARENT_TABLE} '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            ))
+            created.append(name)
+    if created:
+        print(f"Created email_history partitions: {', '.join(created)}")
+    return created
+
+
+def list_partitions(conn) -> List[str]:
+    """Names of the partitions currently attached to email_history, oldest first"""
+    return sorted(conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = :parent AND parent.relnamespace = to_regnamespace(current_schema())"
+    ), {"parent": PARENT_TABLE}).scalars())
+
+
+def archive_partition(engine: Engine, name: str, archive_dir: Path = HISTORY_ARCHIVE_DIR) -> int:
+    """
+    Export a partition to <archive_dir>/<name>.jsonl.gz, then detach and drop it
+
+    The file is written completely before the partition is touched, and the
+    partition is only dropped if it still holds exactly the exported rows.
+
+    Args:
+        engine: Engine for the database holding email_history
+        name: Partition to archive
+        archive_dir: Directory for the archive files
+    Returns:
+        Number of rows archived
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    path = archive_dir / f"{name}.jsonl.gz"
+    partial = archive_dir / f"{name}.jsonl.gz.partial"
+
+    exported = 0
+    with engine.connect() as conn:
+        # Server-side cursor, so a month of history is never held in memory at once
+        result = conn.execution_options(stream_results=True, yield_per=1000).execute(
+            text(f'SELECT * FROM "{name}" ORDER BY processed_at, id')
+        )
+        with gzip.open(partial, 'wt', encoding='utf-8') as archive:
+            for row in result.mappings():
+                record = dict(row)
+                # Derived from the other columns, and rebuilt if the rows are ever restored
+                record.pop('search_vector', None)
+                archive.write(json.dumps(record, default=str) + '\n')
+                exported += 1
+    os.replace(partial, path)
+
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION "{name}"'))
+        remaining = conn.execute(text(f'SELECT count(*) FROM "{name}"')).scalar_one()
+        if remaining != exported:
+            raise RuntimeError(f"{name} changed while it was archived ({remaining} rows, {exported} exported)")
+        conn.execute(text(f'DROP TABLE "{name}"'))
+        # Detaching fires no triggers, so invalidate the history ETags here
+        conn.execute(text("UPDATE table_versions SET version = version + 1 WHERE name = :name"), {"name": PARENT_TABLE})
+    print(f"Archived {exported} email_history rows from {name} to {path}")
+    return exported
+
+
+def archive_expired_partitions(engine: Engine, retention_months: int = HISTORY_RETENTION_MONTHS,
+                               archive_dir: Path = HISTORY_ARCHIVE_DIR) -> List[str]:
+    """
+    Archive every partition older than the retention window
+
+    Args:
+        engine: Engine for the database holding email_history
+        retention_months: Months kept in the database, 0 keeps everything
+        archive_dir: Directory for the archive files
+    Returns:
+        Names of the partitions archived
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(datetime.now()), -(retention_months - 1))
+    with engine.connect() as conn:
+        expired = [name for name in list_partitions(conn)
+                   if partition_month(name) is not None and partition_month(name) < cutoff]
+    for name in expired:
+        archive_partition(engine, name, archive_dir)
+    return expired
+
+
+def maintain(engine: Engine) -> Dict[str, List[str]]:
+    """
+    Create upcoming partitions and archive expired ones
+
+    Runs under an advisory lock, so concurrent API processes and workers skip
+    the run instead of exporting the same partition twice.
+    """
+    with engine.connect() as lock_conn:
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+            return {"created": [], "archived": []}
+        try:
+            return {"created": ensure_partitions(engine), "archived": archive_expired_partitions(engine)}
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+            lock_conn.commit()
+
+
+class HistoryMaintainer:
+    """Runs maintain() periodically in the background until stopped"""
+
+    def __init__(self, engine: Engine, interval: float = MAINTENANCE_INTERVAL_SECONDS) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.running = False
+
+    async def run(self) -> None:
+        self.running = True
+        while self.running:
+            try:
+                await asyncio.to_thread(maintain, self.engine)
+            except Exception as e:
+                print(f"Error in email_history maintenance: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self) -> None:
+        self.running = False
+
+
+def _archive_files(archive_dir: Path, since: Optional[datetime], until: Optional[datetime]) -> List[Path]:
+    """Archive files whose month overlaps [since, until), newest first"""
+    files = []
+    for path in archive_dir.glob(f"{PARENT_TABLE}_*.jsonl.gz"):
+        month = partition_month(path.name[:-len('.jsonl.gz')])
+        if month is None:
+            continue
+        if since and add_months(month, 1) <= month_start(since):
+            continue
+        if until and month > until.date():
+            continue
+        files.append((month, path))
+    return [path for _, path in sorted(files, reverse=True)]
+
+
+def read_archive(path: Path) -> Iterator[Dict[str, Any]]:
+    """Records of one archive file, in processed_at order"""
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            yield json.loads(line)
+
+
+def search_archives(query: Optional[str] = None, sender: Optional[str] = None,
+                    route: Optional[str] = None, status: Optional[str] = None,
+                    since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    limit: int = 100, archive_dir: Path = HISTORY_ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """
+    Search archived history, newest month first
+
+    Only the files for months in [since, until) are opened.
+
+    Args:
+        query: Case-insensitive text to find in the subject, sender or final response
+        sender: Case-insensitive text to find in the sender address
+        route: Exact route (AI_AGENT, HUMAN_REQUIRED, REDIRECT)
+        status: Exact approval_status
+        since: Earliest processed_at
+        until: Latest processed_at (exclusive)
+        limit: Maximum number of records
+        archive_dir: Directory holding the archive files
+    Returns:
+        Matching records as stored in the archive
+    """
+    query = query.lower() if query else None
+    sender = sender.lower() if sender else None
+    matches = []
+    for path in _archive_files(archive_dir, since, until):
+        for record in read_archive(path):
+            processed_at = datetime.fromisoformat(record['processed_at'])
+            if (since and processed_at < since) or (until and processed_at >= until):
+                continue
+            if route and record.get('route') != route:
+                continue
+            if status and record.get('approval_status') != status:
+                continue
+            if sender and sender not in (record.get('sender_email') or '').lower():
+                continue
+            if query and not any(query in (record.get(field) or '').lower()
+                                 for field in ('subject', 'sender_email', 'final_response')):
+                continue
+            matches.append(record)
+            if len(matches) >= limit:
+                return matches
+    return matches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="email_history partition maintenance and archive search")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('maintain', help="Create upcoming partitions and archive expired ones")
+    search = commands.add_parser('search', help="Search archived history")
+    search.add_argument('query', nargs='?')
+    search.add_argument('--sender')
+    search.add_argument('--route')
+    search.add_argument('--status')
+    search.add_argument('--since', type=datetime.fromisoformat)
+    search.add_argument('--until', type=datetime.fromisoformat)
+    search.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'maintain':
+        from models import engine
+        print(maintain(engine))
+    else:
+        for record in search_archives(args.query, args.sender, args.route, args.status,
+                                      args.since, args.until, args.limit):
+            print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Background triage jobs
+Triage runs are recorded in triage_jobs and executed by an in-process worker,
+so closing the browser tab no longer abandons the run. Every progress event is
+stored in triage_job_events and can be replayed from any event id.
+"""
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, Optional
+
+from models import SessionLocal, TriageJob, TriageJobEvent
+from email_client import EmailClient
+from email_engine import EmailEngine
+from mailboxes import fetch_unread_emails
+
+# Seconds between SSE keep-alive comments while a job is quiet
+KEEPALIVE_SECONDS = 15
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+def serialize_job(job: TriageJob) -> Dict[str, Any]:
+    """Convert a TriageJob row to a JSON-friendly dict"""
+    return {
+        'id': str(job.id),
+        'status': job.status,
+        'progress': job.progress,
+        'step': job.step,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'last_event_id': job.last_event_seq,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class TriageJobRunner:
+    """
+    In-process worker for triage jobs
+
+    Graph access tokens are only kept in memory for the lifetime of the job;
+    jobs are bookkept with their own short-lived sessions so job progress can be
+    committed without touching the engine's pending work. Those sessions are
+    synchronous, so they run in a thread (asyncio.to_thread) off the event loop.
+    """
+
+    def __init__(self, agent, classifier, workers: int = 1) -> None:
+        self.agent = agent
+        self.classifier = classifier
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tokens: Dict[uuid.UUID, str] = {}
+        self._updates: Dict[uuid.UUID, asyncio.Condition] = {}
+        self._last_seq: Dict[uuid.UUID, int] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Fail jobs orphaned by a previous process and start the workers"""
+        await asyncio.to_thread(self._fail_orphaned_jobs)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _fail_orphaned_jobs(self) -> None:
+        with SessionLocal() as session:
+            orphaned = session.query(TriageJob).filter(TriageJob.status.in_(('queued', 'running'))).all()
+            for job in orphaned:
+                job.status = 'error'
+                job.error = 'Interrupted by a server restart, start a new run to continue'
+                job.finished_at = datetime.now()
+            session.commit()
+
+    async def enqueue(self, access_token: str) -> Dict[str, Any]:
+        """
+        Record a new triage job and hand it to the workers
+
+        Args:
+            access_token: Graph token used to read the mailbox for this run
+        Returns:
+            Serialized job
+        """
+        job_data = await asyncio.to_thread(self._create_job)
+        job_id = uuid.UUID(job_data['id'])
+        self._tokens[job_id] = access_token
+        self._updates[job_id] = asyncio.Condition()
+        self._queue.put_nowait(job_id)
+        return job_data
+
+    def _create_job(self) -> Dict[str, Any]:
+        with SessionLocal() as session:
+            job = TriageJob(status='queued', progress=0, step='Queued', last_event_seq=0)
+            session.add(job)
+            session.commit()
+            return serialize_job(job)
+
+    async def get_job(self, job_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._load_job, job_id)
+
+    def _load_job(self, job_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as session:
+            job = session.get(TriageJob, job_id)
+            return serialize_job(job) if job else None
+
+    def _load_events(self, job_id: uuid.UUID, last_event_id: int) -> tuple[list, bool]:
+        """Events after last_event_id as (seq, data) pairs, and whether the job has finished"""
+        with SessionLocal() as session:
+            events = session.query(TriageJobEvent.seq, TriageJobEvent.data).filter(
+                TriageJobEvent.job_id == job_id,
+                TriageJobEvent.seq > last_event_id
+            ).order_by(TriageJobEvent.seq).all()
+            job = session.get(TriageJob, job_id)
+            finished = job is None or job.status in FINISHED_STATUSES
+        return [(seq, data) for seq, data in events], finished
+
+    async def stream_events(self, job_id: uuid.UUID, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """
+        Yield SSE frames for a job's events after last_event_id until the job finishes
+
+        Args:
+            job_id: Job to follow
+            last_event_id: Last event the client has seen (from the Last-Event-ID header)
+        """
+        condition = self._updates.get(job_id)
+        while True:
+            events, finished = await asyncio.to_thread(self._load_events, job_id, last_event_id)
+            for seq, data in events:
+                last_event_id = seq
+                yield f"id: {seq}\ndata: {data}\n\n"
+            if finished:
+                return
+
+            if condition is not None and job_id not in self._updates:
+                # The worker let go of the job but its end is not stored yet; the condition won't fire again
+                condition = None
+            if condition is None:
+                # Job belongs to another process: fall back to polling
+                await asyncio.sleep(1)
+                continue
+            try:
+                async with condition:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self._last_seq.get(job_id, 0) > last_event_id or job_id not in self._updates),
+                        timeout=KEEPALIVE_SECONDS
+                    )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            access_token = self._tokens.pop(job_id, None)
+            error = "Triage run stopped before finishing"
+            try:
+                await self._execute(job_id, access_token)
+            except Exception as e:
+                print(f"Triage job {job_id} failed: {e}")
+                error = str(e)
+                try:
+                    await self._emit(job_id, {'status': 'error', 'message': error})
+                except Exception as emit_error:
+                    print(f"Could not record the failure of triage job {job_id}: {emit_error}")
+            finally:
+                # A job must never stay 'running': its stream would wait forever
+                try:
+                    await asyncio.to_thread(self._fail_unfinished_job, job_id, error)
+                except Exception as e:
+                    print(f"Could not mark triage job {job_id} as failed: {e}")
+                condition = self._updates.pop(job_id, None)
+                self._last_seq.pop(job_id, None)
+                if condition is not None:
+                    async with condition:
+                        condition.notify_all()
+
+    def _fail_unfinished_job(self, job_id: uuid.UUID, error: str) -> None:
+        """Mark the job as failed unless a done or error event already finished it"""
+        with SessionLocal() as session:
+            job = session.get(TriageJob, job_id)
+            if job is None or job.status in FINISHED_STATUSES:
+                return
+            job.status = 'error'
+            job.error = error
+            job.finished_at = datetime.now()
+            session.commit()
+
+    async def _execute(self, job_id: uuid.UUID, access_token: Optional[str]) -> None:
+        if not access_token:
+            raise ValueError("No access token available for this job")
+
+        await self._emit(job_id, {'status': 'fetching', 'progress': 5, 'step': 'Fetching unread emails...'})
+        email_client = EmailClient(access_token=access_token)
+        emails, mailbox_errors = await fetch_unread_emails(access_token)
+        for mailbox, error in mailbox_errors.items():
+            await self._emit(job_id, {'status': 'mailbox_error', 'mailbox': mailbox, 'progress': 5,
+                                      'message': f'Could not read mailbox {mailbox}: {error}'})
+        if not emails:
+            await self._emit(job_id, {'status': 'empty', 'message': 'You are all caught up! 🎉', 'progress': 100,
+                                      'mailbox_errors': mailbox_errors})
+            return
+
+        total = len(emails)
+        await self._emit(job_id, {'status': 'found', 'count': total, 'progress': 10, 'step': f'Found {total} unread email(s)',
+                                  'mailbox_errors': mailbox_errors})
+
+        email_engine = EmailEngine(emails=emails, email_client=email_client, agent=self.agent, classifier=self.classifier)
+        async for event in email_engine.process_emails_events():
+            await self._emit(job_id, event)
+
+    async def _emit(self, job_id: uuid.UUID, data: Dict[str, Any]) -> None:
+        """Store an event, fold it into the job row and wake up subscribers"""
+        seq = await asyncio.to_thread(self._store_event, job_id, data)
+        if seq is None:
+            return
+        self._last_seq[job_id] = seq
+
+        condition = self._updates.get(job_id)
+        if condition is not None:
+            async with condition:
+                condition.notify_all()
+
+    def _store_event(self, job_id: uuid.UUID, data: Dict[str, Any]) -> Optional[int]:
+        """Insert the event and update the job row; returns the event's seq, None if the job is gone"""
+        status = data.get('status')
+        with SessionLocal() as session:
+            job = session.get(TriageJob, job_id)
+            if job is None:
+                return None
+            job.last_event_seq = (job.last_event_seq or 0) + 1
+            session.add(TriageJobEvent(job_id=job_id, seq=job.last_event_seq, data=json.dumps(data)))
+
+            if job.started_at is None:
+                job.started_at = datetime.now()
+            job.status = 'running'
+            if 'progress' in data:
+                job.progress = data['progress']
+            if data.get('step') or data.get('message'):
+                job.step = data.get('step') or data.get('message')
+            if status in ('done', 'empty'):
+                job.status = 'done'
+                job.result = json.dumps(data.get('results', {}))
+                job.finished_at = datetime.now()
+            elif status == 'error':
+                job.status = 'error'
+                job.error = data.get('message')
+                job.finished_at = datetime.now()
+            session.commit()
+            return job.last_event_seq
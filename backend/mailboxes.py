@@ -0,0 +1,126 @@
+"""
+Mailbox configuration and fair scheduling across shared inboxes
+SHARED_MAILBOXES lists the shared inboxes to triage (comma separated user ids
+or addresses, e.g. "cashier@unc.edu,refunds@unc.edu"). The signed-in user's own
+mailbox is included unless TRIAGE_OWN_MAILBOX=false.
+"""
+import asyncio
+import os
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from email_client import EmailClient
+from models import Email
+
+load_dotenv()
+
+SHARED_MAILBOXES = [mailbox.strip() for mailbox in os.getenv('SHARED_MAILBOXES', '').split(',') if mailbox.strip()]
+INCLUDE_OWN_MAILBOX = os.getenv('TRIAGE_OWN_MAILBOX', 'true').lower() == 'true'
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    """Parse MAILBOX_WEIGHTS, e.g. "refunds@unc.edu=2,cashier@unc.edu=1" """
+    weights = {}
+    for entry in raw.split(','):
+        if '=' not in entry:
+            continue
+        mailbox, weight = entry.split('=', 1)
+        try:
+            weights[mailbox.strip()] = max(float(weight), 0.1)
+        except ValueError:
+            print(f"Ignoring invalid mailbox weight: {entry}")
+    return weights
+
+
+MAILBOX_WEIGHTS = _parse_weights(os.getenv('MAILBOX_WEIGHTS', ''))
+
+
+def configured_mailboxes() -> List[Optional[str]]:
+    """Mailboxes to triage; None stands for the signed-in user's own mailbox"""
+    mailboxes: List[Optional[str]] = [None] if INCLUDE_OWN_MAILBOX else []
+    mailboxes.extend(SHARED_MAILBOXES)
+    return mailboxes
+
+
+async def fetch_unread_emails(access_token: str, mailboxes: Optional[List[Optional[str]]] = None,
+                              max_results: int = 10) -> Tuple[List[Email], Dict[str, str]]:
+    """
+    Fetch unread emails from every mailbox concurrently
+
+    A shared mailbox that fails (e.g. the user has no access to it) is skipped
+    so the other inboxes are still triaged, and reported back to the caller.
+
+    Args:
+        access_token: Graph token of the signed-in user
+        mailboxes: Mailboxes to read, defaults to configured_mailboxes()
+        max_results: Maximum unread emails per mailbox
+    Returns:
+        (emails from all mailboxes, each tagged with its mailbox,
+         {mailbox: error} for the shared mailboxes that could not be read)
+    """
+    if mailboxes is None:
+        mailboxes = configured_mailboxes()
+    clients = [EmailClient(access_token=access_token, mailbox=mailbox) for mailbox in mailboxes]
+    results = await asyncio.gather(
+        *[client.get_unread_emails(max_results=max_results) for client in clients],
+        return_exceptions=True
+    )
+    emails = []
+    failures: Dict[str, str] = {}
+    for mailbox, result in zip(mailboxes, results):
+        if isinstance(result, Exception):
+            # A failing own mailbox is a real error (bad token etc.), shared ones are best effort
+            if mailbox is None:
+                raise result
+            print(f"⚠️ Could not read mailbox {mailbox}: {result}")
+            failures[mailbox] = str(result) or type(result).__name__
+            continue
+        emails.extend(result)
+    return emails, failures
+
+
+class FairScheduler:
+    """
+    Weighted deficit round robin over per-mailbox queues
+
+    Orders a batch so every mailbox gets its share of the pipeline's Graph and
+    LLM capacity in turn, instead of one flooded inbox going first and the
+    others waiting behind it. Work conserving: a mailbox with nothing left
+    gives its turn to the others.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None) -> None:
+        self.weights = MAILBOX_WEIGHTS if weights is None else weights
+
+    def weight(self, mailbox: Optional[str]) -> float:
+        return self.weights.get(mailbox or '', 1.0)
+
+    def schedule(self, emails: Iterable[Email]) -> List[Email]:
+        """
+        Interleave emails across mailboxes, keeping each mailbox's own order
+
+        Args:
+            emails: Emails from any number of mailboxes
+        Returns:
+            The same emails in fair processing order
+        """
+        queues: "OrderedDict[Optional[str], deque]" = OrderedDict()
+        for email in emails:
+            queues.setdefault(email.mailbox, deque()).append(email)
+        if len(queues) <= 1:
+            return [email for queue in queues.values() for email in queue]
+
+        deficits = {mailbox: 0.0 for mailbox in queues}
+        ordered = []
+        while queues:
+            for mailbox in list(queues):
+                queue = queues[mailbox]
+                deficits[mailbox] += self.weight(mailbox)
+                while queue and deficits[mailbox] >= 1:
+                    ordered.append(queue.popleft())
+                    deficits[mailbox] -= 1
+                if not queue:
+                    del queues[mailbox]
+        return ordered
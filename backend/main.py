@@ -2,12 +2,13 @@
 FastAPI Backend for UNC Cashier Email Triage
 Main triage endpoint and API routes
 """
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import uuid
 import os
 import json
 from dotenv import load_dotenv
@@ -19,21 +20,64 @@ import asyncio
 # Import our modules
 from email_client import EmailClient
 from classifier import EmailClassifier
-from agent_handler import AzureAIFoundryAgent
+from agent_handler import AzureAIFoundryAgent, AgentThreadPool
 from fastapi.middleware.cors import CORSMiddleware
-from models import ApprovalQueue, EmailHistory, db
+from models import ApprovalQueue, EmailHistory, TriageFailure, get_async_db, async_engine, engine
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from azure.azure_ai_client import AzureAIClient
 from email_engine import EmailEngine
 from models import EmailTriageRequest, TriageResponse, ApproveResponse, RejectResponse, RedirectEmailRequest
+from models import BulkApproveRequest, BulkRedirectRequest, BulkRejectRequest
 from redirect_handler import RedirectHandler
+from jobs import TriageJobRunner
+from worker import TriageWorker, ingest_emails
+from mailboxes import fetch_unread_emails, configured_mailboxes
+from repository import work_item_counts
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_page
+from history_archive import HistoryMaintainer, search_archives
+from queue_counts import QueueCountReconciler, count_resolved, queue_counts
+from search import QUEUE_STATUSES, SORTS, SOURCES, search_history, search_queue, snippet
+from analytics import analytics_summary, record_resolved
+from queue_events import QueueEventBroker
+from etags import etag_matches, not_modified, set_etag, table_etag
+from streaming import stream_json
+from bulk_actions import bulk_approve, bulk_redirect, bulk_reject
+from auth import Principal, get_current_user
+from outbox import (OutboxDispatcher, REPLY, delivery_status, enqueue_delivery, failed_deliveries, find_delivery,
+                    requeue_delivery)
 load_dotenv()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Approvals only queue their replies, so without a working dispatcher they would never be sent
+    outbox_dispatcher.check_credentials()
     app.state.http_client = httpx.AsyncClient(timeout=10.0)
+    if thread_pool is not None:
+        await thread_pool.start()
+    await job_runner.start()
+    worker_tasks = [asyncio.create_task(worker.run()) for worker in triage_workers]
+    worker_tasks.append(asyncio.create_task(history_maintainer.run()))
+    worker_tasks.append(asyncio.create_task(queue_count_reconciler.run()))
+    worker_tasks.append(asyncio.create_task(outbox_dispatcher.run()))
+    await queue_events.start()
     yield
+    await queue_events.stop()
+    history_maintainer.stop()
+    queue_count_reconciler.stop()
+    outbox_dispatcher.stop()
+    for worker in triage_workers:
+        worker.stop()
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    await job_runner.stop()
+    await outbox_dispatcher.close()
+    if thread_pool is not None:
+        await thread_pool.stop()
     await app.state.http_client.aclose()
+    await async_engine.dispose()
 
 app = FastAPI(
     title="Heelper AI API",
@@ -50,13 +94,80 @@ app.add_middleware(
 )
 
 security = HTTPBearer()
+# Every route except / and /health requires a valid Azure AD token
+AUTHENTICATED = [Depends(get_current_user)]
 # Initialize services
 
 logging.basicConfig(level=logging.WARNING)
 
 azure_ai_client = AzureAIClient()
 classifier = EmailClassifier(llm=azure_ai_client.get_llm())
-agent = AzureAIFoundryAgent(project_client=azure_ai_client.project_client)
+
+# Optional warm pool of Foundry threads (disabled when AGENT_THREAD_POOL_SIZE is 0)
+AGENT_THREAD_POOL_SIZE = int(os.getenv('AGENT_THREAD_POOL_SIZE', 0))
+thread_pool = AgentThreadPool(
+    project_client=azure_ai_client.project_client,
+    size=AGENT_THREAD_POOL_SIZE,
+    idle_ttl=float(os.getenv('AGENT_THREAD_POOL_TTL_SECONDS', 900))
+) if AGENT_THREAD_POOL_SIZE > 0 else None
+agent = AzureAIFoundryAgent(project_client=azure_ai_client.project_client, thread_pool=thread_pool)
+job_runner = TriageJobRunner(agent=agent, classifier=classifier, workers=int(os.getenv('TRIAGE_JOB_WORKERS', 1)))
+# Work-queue workers inside the API process; more can run anywhere with `python worker.py`
+triage_workers = [
+    TriageWorker(agent=agent, classifier=classifier)
+    for _ in range(int(os.getenv('TRIAGE_INPROCESS_WORKERS', 0)))
+]
+# Creates upcoming email_history partitions and archives expired ones
+history_maintainer = HistoryMaintainer(engine)
+# Corrects drift in the pending counters behind /approval-queue/counts
+queue_count_reconciler = QueueCountReconciler()
+# Shared LISTEN connection behind /approval-queue/stream
+queue_events = QueueEventBroker()
+# Delivers queued replies and forwards; any number of processes can run one
+outbox_dispatcher = OutboxDispatcher()
+
+
+APPROVAL_SUMMARY_COLUMNS = (
+    ApprovalQueue.id, ApprovalQueue.email_id, ApprovalQueue.mailbox, ApprovalQueue.subject,
+    ApprovalQueue.sender_email, ApprovalQueue.route, ApprovalQueue.redirect_department,
+    ApprovalQueue.received_at, ApprovalQueue.confidence, ApprovalQueue.priority, ApprovalQueue.created_at,
+    snippet(ApprovalQueue.body).label('snippet'),
+)
+
+HISTORY_SUMMARY_COLUMNS = (
+    EmailHistory.id, EmailHistory.email_id, EmailHistory.conversation_id, EmailHistory.mailbox,
+    EmailHistory.subject, EmailHistory.sender_email, EmailHistory.route, EmailHistory.confidence,
+    EmailHistory.approval_status, EmailHistory.received_at, EmailHistory.processed_at,
+    snippet(EmailHistory.final_response).label('snippet'),
+)
+
+
+HISTORY_EXPORT_COLUMNS = (
+    EmailHistory.id, EmailHistory.email_id, EmailHistory.conversation_id, EmailHistory.conversation_index,
+    EmailHistory.mailbox, EmailHistory.subject, EmailHistory.sender_email, EmailHistory.route,
+    EmailHistory.redirect_department, EmailHistory.final_response, EmailHistory.confidence,
+    EmailHistory.approval_status, EmailHistory.received_at, EmailHistory.processed_at,
+)
+
+
+def isoformat(value: Optional[datetime]) -> Optional[str]:
+    """ISO string for a nullable timestamp"""
+    return value.isoformat() if value else None
+
+
+async def get_approval(session: AsyncSession, approval_id: str, for_update: bool = False) -> Optional[ApprovalQueue]:
+    """
+    Load an approval row by id; None if it does not exist or the id is malformed
+
+    for_update locks the row until the transaction ends, so concurrent requests
+    resolving the same approval run one after the other and the later ones see
+    it resolved.
+    """
+    try:
+        return await session.get(ApprovalQueue, uuid.UUID(approval_id),
+                                 with_for_update=for_update, populate_existing=for_update)
+    except ValueError:
+        return None
 
 
 @app.get("/")
@@ -69,47 +180,39 @@ async def root():
     }
 
 
-@app.post("/approve-response")
-async def approve_response(request: ApproveResponse, access_token: HTTPAuthorizationCredentials = Depends(security)):
+@app.post("/approve-response", status_code=202, dependencies=AUTHENTICATED)
+async def approve_response(request: ApproveResponse, user: Principal = Depends(get_current_user),
+                           session: AsyncSession = Depends(get_async_db)):
     """
-    Staff reviews and approves/edits response
+    Staff reviews and approves/edits response.
+    The reply is queued in the outbox in the same transaction and sent in the background;
+    follow it with /approval/{approval_id}/delivery.
     """
     try:
-        approval = db.query(ApprovalQueue).filter_by(id=request.approval_id).first()
+        approval = await get_approval(session, request.approval_id, for_update=True)
         
         if not approval:
             raise HTTPException(status_code=404, detail="Approval not found")
+
+        # A repeated click returns the reply already queued instead of sending another
+        delivery = await session.run_sync(find_delivery, approval.id, REPLY)
+        if delivery:
+            return {"status": delivery.status, "approval_id": request.approval_id, "delivery_id": str(delivery.id)}
+        if approval.approved or approval.rejected:
+            raise HTTPException(status_code=409, detail="Approval already resolved")
         
         # Use staff edits if provided, otherwise use AI-generated response
         final_response = request.staff_edits if request.staff_edits else approval.generated_response
         
         if not final_response:
             raise HTTPException(status_code=400, detail="No response to send")
-        
-        # Send via Microsoft Graph
-        email_client = EmailClient(access_token=access_token.credentials)
-        print(f"Sending email to {approval.sender_email} with subject {approval.subject} and body {final_response}")
-        # Send reply using approval record data
-        send_result = await email_client.send_reply(
-            original_email_id=approval.email_id,
-            body=final_response
-        )
-
-        if not send_result.get("success"):
-            raise HTTPException(status_code=500, detail=f"Failed to send email: {send_result.get('message')}")
-        #mark the email as read
-
-        print(f"Marking email as read {approval.email_id}")
-        mark_read_result = await email_client.mark_as_read(approval.email_id)
-        if not mark_read_result:
-            raise HTTPException(status_code=500, detail="Failed to mark email as read")
-
-        print(f"Email marked as read {approval.email_id}")
-
-
-
+        mailbox = approval.mailbox or user.email
+        if not mailbox:
+            raise HTTPException(status_code=400, detail="No mailbox to send from")
 
         # Update approval record
+        await session.run_sync(count_resolved, approval)
+        await session.run_sync(record_resolved, approval, 'approved')
         approval.approved = True
         approval.approved_at = datetime.now()
         approval.final_response = final_response
@@ -117,6 +220,7 @@ async def approve_response(request: ApproveResponse, access_token: HTTPAuthoriza
         #Add the email to email history
         email_history = EmailHistory(
             email_id=approval.email_id,
+            mailbox=approval.mailbox,
             subject=approval.subject,
             sender_email=approval.sender_email,
             route=approval.route,
@@ -125,26 +229,34 @@ async def approve_response(request: ApproveResponse, access_token: HTTPAuthoriza
             approval_status='approved',
             processed_at=datetime.now()
         )
-        db.add(email_history)
+        session.add(email_history)
 
-        print(f"Email history added {email_history.email_id}")
-        db.commit()
+        delivery = await session.run_sync(enqueue_delivery, approval, REPLY, mailbox, {"body": final_response})
+        await session.commit()
+        outbox_dispatcher.wake()
+        print(f"Reply to {approval.sender_email} queued for delivery {delivery.id}")
         
-        return {"status": "sent", "approval_id": request.approval_id}
+        return {"status": "queued", "approval_id": request.approval_id, "delivery_id": str(delivery.id)}
     
+    except HTTPException:
+        raise
     except Exception as e:
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/redirect-email")
-async def redirect_email(request: RedirectEmailRequest, access_token: HTTPAuthorizationCredentials = Depends(security)):
+@app.post("/redirect-email", status_code=202, dependencies=AUTHENTICATED)
+async def redirect_email(request: RedirectEmailRequest, user: Principal = Depends(get_current_user),
+                         session: AsyncSession = Depends(get_async_db)):
     """
-    Redirects an email to the appropriate department
+    Redirects an email to the appropriate department.
+    The forward is queued in the outbox and sent in the background.
     """
     print(f"Redirecting email {request.approval_id} to {request.redirect_department_email} with comment {request.comment}")
     try:
-        redirect_handler = RedirectHandler(email_client=EmailClient(access_token=access_token.credentials))
+        redirect_handler = RedirectHandler(session=session, user_mailbox=user.email)
         result = await redirect_handler.redirect_email(request)
+        outbox_dispatcher.wake()
         return result
     except HTTPException as e:
         raise HTTPException(status_code=e.status_code, detail=e.detail)
@@ -152,35 +264,213 @@ async def redirect_email(request: RedirectEmailRequest, access_token: HTTPAuthor
         print(f"Error in redirect_email: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/approval-queue")
-async def get_approval_queue(route: str = "AI_AGENT"):
+
+@app.post("/bulk-approve-response", status_code=202, dependencies=AUTHENTICATED)
+async def bulk_approve_response(request: BulkApproveRequest, user: Principal = Depends(get_current_user),
+                                session: AsyncSession = Depends(get_async_db)):
+    """
+    Approve many emails at once: all approvals are saved and their replies queued
+    in one transaction, then sent in the background. Returns a result per item.
+    """
+    try:
+        result = await bulk_approve(session, request, user.email)
+        outbox_dispatcher.wake()
+        return result
+    except Exception as e:
+        print(f"Error in bulk_approve_response: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/bulk-reject-response", dependencies=AUTHENTICATED)
+async def bulk_reject_response(request: BulkRejectRequest, session: AsyncSession = Depends(get_async_db)):
+    """
+    Reject many emails at once, in one transaction. Returns a result per item.
+    """
+    try:
+        return await bulk_reject(session, request)
+    except Exception as e:
+        print(f"Error in bulk_reject_response: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/bulk-redirect-email", status_code=202, dependencies=AUTHENTICATED)
+async def bulk_redirect_email(request: BulkRedirectRequest, user: Principal = Depends(get_current_user),
+                              session: AsyncSession = Depends(get_async_db)):
+    """
+    Redirect many emails at once: all redirects are saved and their forwards queued
+    in one transaction, then sent in the background. Returns a result per item.
+    """
+    try:
+        result = await bulk_redirect(session, request, user.email)
+        outbox_dispatcher.wake()
+        return result
+    except Exception as e:
+        print(f"Error in bulk_redirect_email: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/approval-queue", dependencies=AUTHENTICATED)
+async def get_approval_queue(request: Request, response: Response,
+                             route: str = "AI_AGENT", mailbox: Optional[str] = None,
+                             cursor: Optional[str] = None,
+                             limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                             session: AsyncSession = Depends(get_async_db)):
     """
     Get pending emails that need to be approved, from most recent to oldest.
     Filter by route (AI_AGENT, REDIRECT, or HUMAN_REQUIRED). Defaults to AI_AGENT.
+    Optionally filter by shared mailbox.
+    Paginated: pass the returned next_cursor as cursor to get the next page.
+    Sends an ETag; answers 304 to If-None-Match while the queue is unchanged.
     """
     try:
-        results = db.query(ApprovalQueue).filter_by(approved=False, rejected=False, route=route).order_by(ApprovalQueue.created_at.desc()).all()
+        etag = await table_etag(session, ApprovalQueue.__tablename__)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
+        query = select(*APPROVAL_SUMMARY_COLUMNS).where(
+            ApprovalQueue.approved == False, ApprovalQueue.rejected == False, ApprovalQueue.route == route
+        )
+        if mailbox:
+            query = query.where(ApprovalQueue.mailbox == mailbox)
+        try:
+            results, next_cursor = await fetch_page(session, query, ApprovalQueue.created_at, ApprovalQueue.id, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Convert to dict for JSON serialization
-        return [{
+        # Summary only, the full body and draft come from /approval/{id}
+        items = [{
             'id': str(result.id),
             'email_id': result.email_id,
+            'mailbox': result.mailbox,
             'subject': result.subject,
             'sender_email': result.sender_email,
-            'body': result.body,
-            'generated_response': result.generated_response,
+            'snippet': result.snippet,
             'route': result.route,
             'redirect_department': result.redirect_department,
-            'received_at': result.received_at.isoformat() if result.received_at else None,
+            'received_at': isoformat(result.received_at),
             'confidence': result.confidence,
-            'created_at': result.created_at.isoformat() if result.created_at else None
+            'priority': result.priority,
+            'created_at': isoformat(result.created_at)
         } for result in results]
+        return {'items': items, 'next_cursor': next_cursor}
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/approval-queue/stream", dependencies=AUTHENTICATED)
+async def stream_approval_queue():
+    """
+    SSE stream of approval queue changes (inserts, resolutions, deletes) as small JSON deltas.
+    On {"op": "resync"} the client should reload the queue, since events may have been missed.
+    """
+    return StreamingResponse(queue_events.stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/approval-queue/counts", dependencies=AUTHENTICATED)
+async def get_approval_queue_counts(request: Request, response: Response, mailbox: Optional[str] = None,
+                                    session: AsyncSession = Depends(get_async_db)):
+    """
+    Number of pending emails per route, read from the maintained counters.
+    Optionally for one shared mailbox only. Conditional on the approval queue ETag.
+    """
+    try:
+        etag = await table_etag(session, ApprovalQueue.__tablename__)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return await session.run_sync(queue_counts, mailbox)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/approval/{approval_id}", dependencies=AUTHENTICATED)
+async def get_approval_detail(approval_id: str, session: AsyncSession = Depends(get_async_db)):
+    """
+    Get one queued email with its full body and generated draft
+    """
+    try:
+        approval = await get_approval(session, approval_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not approval:
+        raise HTTPException(status_code=404, detail="Approval not found")
+
+    return {
+        'id': str(approval.id),
+        'email_id': approval.email_id,
+        'conversation_id': approval.conversation_id,
+        'mailbox': approval.mailbox,
+        'subject': approval.subject,
+        'sender_email': approval.sender_email,
+        'body': approval.body,
+        'generated_response': approval.generated_response,
+        'final_response': approval.final_response,
+        'route': approval.route,
+        'redirect_department': approval.redirect_department,
+        'received_at': isoformat(approval.received_at),
+        'confidence': approval.confidence,
+        'priority': approval.priority,
+        'approved': approval.approved,
+        'rejected': approval.rejected,
+        'delivery_error': approval.delivery_error,
+        'created_at': isoformat(approval.created_at)
+    }
+
+
+@app.get("/approval/{approval_id}/delivery", dependencies=AUTHENTICATED)
+async def get_approval_delivery(approval_id: str, session: AsyncSession = Depends(get_async_db)):
+    """
+    Delivery status of an approved or redirected email's reply/forward:
+    pending, leased (being sent), delivered or failed, with attempts and the last error
+    """
+    try:
+        delivery = await session.run_sync(find_delivery, uuid.UUID(approval_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid approval id")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Nothing queued for this approval")
+    return delivery_status(delivery)
+
+
+@app.post("/approval/{approval_id}/delivery/retry", status_code=202, dependencies=AUTHENTICATED)
+async def retry_approval_delivery(approval_id: str, session: AsyncSession = Depends(get_async_db)):
+    """
+    Queue a failed reply/forward again, e.g. once the mailbox or permissions are fixed.
+    Clears the approval's delivery_error; poll /approval/{approval_id}/delivery for the result.
+    """
+    try:
+        delivery = await session.run_sync(requeue_delivery, uuid.UUID(approval_id))
+        await session.commit()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid approval id")
+    except Exception as e:
+        await session.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    if not delivery:
+        raise HTTPException(status_code=404, detail="No failed delivery for this approval")
+    outbox_dispatcher.wake()
+    return delivery_status(delivery)
+
+
+@app.get("/deliveries/failed", dependencies=AUTHENTICATED)
+async def get_failed_deliveries(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                session: AsyncSession = Depends(get_async_db)):
+    """
+    Replies and forwards the outbox gave up on, most recent first, to retry or handle by hand
+    """
+    try:
+        return {'deliveries': await session.run_sync(failed_deliveries, limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/fetch-triage-emails")
+@app.post("/fetch-triage-emails", dependencies=AUTHENTICATED)
 async def fetch_triage_emails(request: HTTPAuthorizationCredentials = Depends(security)):
     """
     Fetch emails, classify them, generate AI responses for eligible emails,
@@ -194,9 +484,10 @@ async def fetch_triage_emails(request: HTTPAuthorizationCredentials = Depends(se
     
     try:
         email_client = EmailClient(access_token=access_token)
-        emails = await email_client.get_unread_emails()
+        emails, mailbox_errors = await fetch_unread_emails(access_token)
         email_engine = EmailEngine(emails=emails, email_client=email_client, agent=agent, classifier=classifier)
         result = await email_engine.process_emails()
+        result["mailbox_errors"] = mailbox_errors
         return result
 
 
@@ -204,63 +495,121 @@ async def fetch_triage_emails(request: HTTPAuthorizationCredentials = Depends(se
         print(f"Error fetching user emails: {e}")
         raise HTTPException(status_code=e.response.status_code, detail=f"Graph API error: {e.response.text}")
     except Exception as e:
-        db.rollback()  # Rollback on any error
         print(f"Error in fetch-triage-emails: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/fetch-triage-stream")
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+
+
+@app.get("/fetch-triage-stream", dependencies=AUTHENTICATED)
 async def fetch_triage_stream(request: HTTPAuthorizationCredentials = Depends(security)):
     """
     SSE endpoint for real-time triage progress updates.
-    Uses EmailEngine's streaming method.
+    Starts a background triage job and follows its events; the job keeps
+    running if the client disconnects and can be resumed via /triage-jobs/{id}/events.
     """
     access_token = request.credentials
     if not access_token:
         raise HTTPException(status_code=401, detail="access_token is required")
 
+    job = await job_runner.enqueue(access_token)
+    job_id = uuid.UUID(job['id'])
+
     async def event_generator():
-        try:
-            yield f"data: {json.dumps({'status': 'fetching', 'progress': 5, 'step': 'Fetching unread emails...'})}\n\n"
-            
-            email_client = EmailClient(access_token=access_token)
-            emails = await email_client.get_unread_emails()
-            
-            if not emails:
-                yield f"data: {json.dumps({'status': 'empty', 'message': 'You are all caught up! 🎉', 'progress': 100})}\n\n"
-                return
-            
-            total = len(emails)
-            yield f"data: {json.dumps({'status': 'found', 'count': total, 'progress': 10, 'step': f'Found {total} unread email(s)'})}\n\n"
-            
-            # Use EmailEngine's streaming method
-            email_engine = EmailEngine(emails=emails, email_client=email_client, agent=agent, classifier=classifier)
-            async for event in email_engine.process_emails_stream():
-                yield event
-                
-        except Exception as e:
-            db.rollback()
-            yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
+        yield f"data: {json.dumps({'status': 'queued', 'job_id': job['id'], 'progress': 0, 'step': 'Starting...'})}\n\n"
+        async for event in job_runner.stream_events(job_id):
+            yield event
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/triage-jobs", status_code=202, dependencies=AUTHENTICATED)
+async def create_triage_job(request: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Enqueue a triage run and return its job id immediately
+    """
+    access_token = request.credentials
+    if not access_token:
+        raise HTTPException(status_code=401, detail="access_token is required")
+    return await job_runner.enqueue(access_token)
 
+
+@app.get("/triage-jobs/{job_id}", dependencies=AUTHENTICATED)
+async def get_triage_job(job_id: uuid.UUID):
+    """
+    Get the status and progress of a triage job
+    """
+    job = await job_runner.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/triage-jobs/{job_id}/events", dependencies=AUTHENTICATED)
+async def stream_triage_job_events(job_id: uuid.UUID, last_event_id: Optional[int] = Header(None, alias="Last-Event-ID")):
+    """
+    SSE stream of a triage job's progress events.
+    Reconnecting clients send Last-Event-ID and only receive the events they missed.
+    """
+    if not await job_runner.get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
     return StreamingResponse(
-        event_generator(),
+        job_runner.stream_events(job_id, last_event_id or 0),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+        headers=SSE_HEADERS
     )
 
 
 
 
-@app.post("/reject-response")
-async def reject_response(request: RejectResponse):
+@app.post("/triage-work-items", status_code=202, dependencies=AUTHENTICATED)
+async def enqueue_triage_work_items(request: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Fetch unread emails and their threads, and enqueue them as work items
+    for the triage workers (in this process or on other nodes).
+    """
+    access_token = request.credentials
+    if not access_token:
+        raise HTTPException(status_code=401, detail="access_token is required")
+
+    try:
+        email_client = EmailClient(access_token=access_token)
+        emails, mailbox_errors = await fetch_unread_emails(access_token)
+        result = await ingest_emails(emails, email_client)
+        return {"status": "queued", "found": len(emails), **result, "mailbox_errors": mailbox_errors}
+    except httpx.HTTPStatusError as e:
+        raise HTTPException(status_code=e.response.status_code, detail=f"Graph API error: {e.response.text}")
+    except Exception as e:
+        print(f"Error in enqueue_triage_work_items: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/triage-work-items/stats", dependencies=AUTHENTICATED)
+async def get_triage_work_item_stats(session: AsyncSession = Depends(get_async_db)):
+    """
+    Number of work items per status (pending, leased, done, failed)
+    """
+    try:
+        return await session.run_sync(work_item_counts)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/reject-response", dependencies=AUTHENTICATED)
+async def reject_response(request: RejectResponse, session: AsyncSession = Depends(get_async_db)):
     """
     Rejects an email by marking it as rejected
     """
     try:
-        approval = db.query(ApprovalQueue).filter_by(id=request.approval_id).first()
+        approval = await get_approval(session, request.approval_id, for_update=True)
         if not approval:
             raise HTTPException(status_code=404, detail="Approval not found")
+        if approval.approved or approval.rejected:
+            raise HTTPException(status_code=409, detail="Approval already resolved")
         
+        await session.run_sync(count_resolved, approval)
+        await session.run_sync(record_resolved, approval, 'rejected')
         approval.rejected = True
         approval.rejected_at = datetime.now()
         
@@ -268,6 +617,7 @@ async def reject_response(request: RejectResponse):
 
         email_history = EmailHistory(
             email_id=approval.email_id,
+            mailbox=approval.mailbox,
             subject=approval.subject,
             sender_email=approval.sender_email,
             route=approval.route,
@@ -278,13 +628,13 @@ async def reject_response(request: RejectResponse):
             approval_status='rejected',
             processed_at=datetime.now()
         )
-        db.add(email_history)
+        session.add(email_history)
 
         print(f"Email history added {email_history.email_id}")
 
         print(f"Approval record updated {approval.email_id}")
 
-        db.commit()
+        await session.commit()
 
         print(f"Email marked as rejected {approval.email_id}")
 
@@ -293,26 +643,29 @@ async def reject_response(request: RejectResponse):
             "message": "Email marked as rejected",
             "approval_id": request.approval_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await session.rollback()
         print(f"Error in reject_response: {e}")
         raise HTTPException(status_code=500, detail=str(e))   
 class DeleteApprovalRequest(BaseModel):
     approval_id: str
 
 
-@app.delete("/delete-approval/{approval_id}")
-async def delete_approval(approval_id: str):
+@app.delete("/delete-approval/{approval_id}", dependencies=AUTHENTICATED)
+async def delete_approval(approval_id: str, session: AsyncSession = Depends(get_async_db)):
     """
     Deletes an email from the approval queue without processing it
     """
     try:
-        approval = db.query(ApprovalQueue).filter_by(id=approval_id).first()
+        approval = await get_approval(session, approval_id, for_update=True)
         if not approval:
             raise HTTPException(status_code=404, detail="Approval not found")
         
-        db.delete(approval)
-        db.commit()
+        await session.run_sync(count_resolved, approval)
+        await session.delete(approval)
+        await session.commit()
         
         return {
             "status": "success",
@@ -320,38 +673,233 @@ async def delete_approval(approval_id: str):
             "approval_id": approval_id
         }
     except Exception as e:
-        db.rollback()
+        await session.rollback()
         print(f"Error in delete_approval: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/email-history")
-async def get_email_history():
+@app.get("/email-history", dependencies=AUTHENTICATED)
+async def get_email_history(request: Request, response: Response, cursor: Optional[str] = None,
+                            limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            session: AsyncSession = Depends(get_async_db)):
     """
     Get email history - all processed emails (approved/rejected)
     Ordered from most recent to oldest
+    Paginated: pass the returned next_cursor as cursor to get the next page.
+    Sends an ETag; answers 304 to If-None-Match while history is unchanged.
     """
     try:
-        results = db.query(EmailHistory).order_by(EmailHistory.processed_at.desc()).all()
+        etag = await table_etag(session, EmailHistory.__tablename__)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
+        try:
+            results, next_cursor = await fetch_page(session, select(*HISTORY_SUMMARY_COLUMNS), EmailHistory.processed_at, EmailHistory.id, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return [{
+        items = [{
             'id': str(result.id),
             'email_id': result.email_id,
             'conversation_id': result.conversation_id,
+            'mailbox': result.mailbox,
             'subject': result.subject,
             'sender_email': result.sender_email,
             'route': result.route,
-            'final_response': result.final_response,
+            'snippet': result.snippet,
             'confidence': result.confidence,
             'approval_status': result.approval_status,
-            'received_at': result.received_at.isoformat() if result.received_at else None,
-            'processed_at': result.processed_at.isoformat() if result.processed_at else None
+            'received_at': isoformat(result.received_at),
+            'processed_at': isoformat(result.processed_at)
         } for result in results]
+        return {'items': items, 'next_cursor': next_cursor}
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/email-history/export", dependencies=AUTHENTICATED)
+async def export_email_history(request: Request, route: Optional[str] = None, status: Optional[str] = None,
+                               since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """
+    Download processed emails with their full final responses as one JSON array, oldest first.
+    Streamed from a server-side cursor (gzip or brotli if accepted), so any amount of history
+    is sent with bounded memory. since/until bound processed_at and only scan those months.
+    """
+    query = select(*HISTORY_EXPORT_COLUMNS).order_by(EmailHistory.processed_at, EmailHistory.id)
+    if route:
+        query = query.where(EmailHistory.route == route)
+    if status:
+        query = query.where(EmailHistory.approval_status == status)
+    if since:
+        query = query.where(EmailHistory.processed_at >= since)
+    if until:
+        query = query.where(EmailHistory.processed_at < until)
+    return stream_json(request, query, lambda row: row._asdict(), filename="email-history.json")
+
+
+@app.get("/email-history/archive", dependencies=AUTHENTICATED)
+async def search_email_history_archive(q: Optional[str] = None, sender: Optional[str] = None,
+                                       route: Optional[str] = None, status: Optional[str] = None,
+                                       since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                       limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    """
+    Search history that was archived out of the database, newest first.
+    Only the archive files for months between since and until are read.
+    """
+    try:
+        items = await asyncio.to_thread(search_archives, q, sender, route, status, since, until, limit)
+        return {'items': items}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/email-history/{history_id}", dependencies=AUTHENTICATED)
+async def get_email_history_item(history_id: str, session: AsyncSession = Depends(get_async_db)):
+    """
+    Get one processed email with its full final response
+    """
+    try:
+        # The primary key is (id, processed_at), so look up by id alone
+        result = (await session.scalars(select(EmailHistory).where(EmailHistory.id == uuid.UUID(history_id)))).first()
+    except ValueError:
+        result = None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Email history entry not found")
+
+    return {
+        'id': str(result.id),
+        'email_id': result.email_id,
+        'conversation_id': result.conversation_id,
+        'mailbox': result.mailbox,
+        'subject': result.subject,
+        'sender_email': result.sender_email,
+        'route': result.route,
+        'redirect_department': result.redirect_department,
+        'final_response': result.final_response,
+        'confidence': result.confidence,
+        'approval_status': result.approval_status,
+        'received_at': isoformat(result.received_at),
+        'processed_at': isoformat(result.processed_at)
+    }
+
+
+@app.get("/search", dependencies=AUTHENTICATED)
+async def search_emails(q: str = Query(..., min_length=1), source: str = "history",
+                        route: Optional[str] = None, status: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        sort: str = "relevance", cursor: Optional[str] = None,
+                        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        session: AsyncSession = Depends(get_async_db)):
+    """
+    Full-text search over email history (source=history) or the approval queue (source=queue).
+    q accepts quoted phrases, OR and -word. Filter by route, status (history: approval_status;
+    queue: pending, approved or rejected) and since/until. sort is relevance or recent.
+    Paginated: pass the returned next_cursor as cursor to get the next page.
+    """
+    if source not in SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(SOURCES)}")
+    if sort not in SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+    if source == 'queue' and status and status not in QUEUE_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(QUEUE_STATUSES)}")
+
+    try:
+        if source == 'history':
+            query, sort_column = search_history(q, route, status, since, until, sort)
+            id_column = EmailHistory.id
+        else:
+            query, sort_column = search_queue(q, route, status, since, until, sort)
+            id_column = ApprovalQueue.id
+        try:
+            results, next_cursor = await fetch_page(session, query, sort_column, id_column, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        items = []
+        for result in results:
+            item = {
+                'id': str(result.id),
+                'source': source,
+                'email_id': result.email_id,
+                'mailbox': result.mailbox,
+                'subject': result.subject,
+                'sender_email': result.sender_email,
+                'snippet': result.snippet,
+                'route': result.route,
+                'confidence': result.confidence,
+                'received_at': isoformat(result.received_at),
+                'rank': result.rank,
+            }
+            if source == 'history':
+                item['approval_status'] = result.approval_status
+                item['processed_at'] = isoformat(result.processed_at)
+            else:
+                item['status'] = 'approved' if result.approved else 'rejected' if result.rejected else 'pending'
+                item['created_at'] = isoformat(result.created_at)
+            items.append(item)
+        return {'items': items, 'next_cursor': next_cursor}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/analytics", dependencies=AUTHENTICATED)
+async def get_analytics(since: Optional[date] = None, until: Optional[date] = None, route: Optional[str] = None,
+                        session: AsyncSession = Depends(get_async_db)):
+    """
+    Triage analytics from the daily rollups: route mix, approval/rejection/redirect rates,
+    confidence distribution and p50/p90/p99 time from receipt to approval per route.
+    Defaults to the last 30 days.
+    """
+    until = until or date.today()
+    since = since or until - timedelta(days=29)
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    try:
+        return await session.run_sync(analytics_summary, since, until, route)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/triage-failures", dependencies=AUTHENTICATED)
+async def get_triage_failures(session: AsyncSession = Depends(get_async_db)):
+    """
+    Get emails whose triage failed, most recent first.
+    Failed emails are retried on the next run until TRIAGE_MAX_ATTEMPTS is reached.
+    """
+    try:
+        results = (await session.scalars(select(TriageFailure).order_by(TriageFailure.updated_at.desc()))).all()
+
+        return [{
+            'email_id': result.email_id,
+            'subject': result.subject,
+            'stage': result.stage,
+            'error': result.error,
+            'attempts': result.attempts,
+            'created_at': result.created_at.isoformat() if result.created_at else None,
+            'updated_at': result.updated_at.isoformat() if result.updated_at else None
+        } for result in results]
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/mailboxes", dependencies=AUTHENTICATED)
+async def get_mailboxes():
+    """
+    Mailboxes this deployment triages ('me' is the signed-in user's own)
+    """
+    return [mailbox or 'me' for mailbox in configured_mailboxes()]
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
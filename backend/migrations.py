@@ -0,0 +1,313 @@
+"""
+Schema migrations for existing databases
+Base.metadata.create_all only creates missing tables, so changes to tables that
+already exist (indexes, constraints, column changes) are listed here and applied
+once each by init_db. Every statement is written to be safe to re-run.
+Statements can use :local_tz, the time zone of the app's naive datetime.now()
+values (created_at, approved_at, ...); received_at comes from Graph in UTC.
+"""
+import os
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+
+def _local_timezone() -> str:
+    """Name of this host's time zone (TZ, else /etc/localtime), UTC if it cannot be told"""
+    name = os.getenv('TZ', '').lstrip(':')
+    if not name and os.path.islink('/etc/localtime'):
+        name = os.readlink('/etc/localtime').partition('zoneinfo/')[2]
+    return name or 'UTC'
+
+
+MIGRATIONS = [
+    ("028_email_id_lookup_indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_approval_queue_email_id ON approval_queue (email_id)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_email_id ON email_history (email_id)",
+    ]),
+    ("032_approval_queue_email_id_unique", [
+        # Keep one row per email: a resolved row if there is one, otherwise the oldest
+        """
+        DELETE FROM approval_queue WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY email_id
+                    ORDER BY (COALESCE(approved, false) OR COALESCE(rejected, false)) DESC, created_at ASC, id ASC
+                ) AS rn
+                FROM approval_queue
+                WHERE email_id IS NOT NULL
+            ) ranked
+            WHERE rn > 1
+        )
+        """,
+        "DROP INDEX IF EXISTS ix_approval_queue_email_id",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_approval_queue_email_id ON approval_queue (email_id)",
+    ]),
+    ("034_mailbox_columns", [
+        "ALTER TABLE approval_queue ADD COLUMN IF NOT EXISTS mailbox VARCHAR(255)",
+        "ALTER TABLE email_history ADD COLUMN IF NOT EXISTS mailbox VARCHAR(255)",
+        "ALTER TABLE triage_work_items ADD COLUMN IF NOT EXISTS mailbox VARCHAR(255)",
+        "CREATE INDEX IF NOT EXISTS ix_approval_queue_mailbox ON approval_queue (mailbox)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_mailbox ON email_history (mailbox)",
+    ]),
+    ("035_priority_columns", [
+        "ALTER TABLE approval_queue ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 1",
+        "ALTER TABLE triage_work_items ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 1",
+        "CREATE INDEX IF NOT EXISTS ix_approval_queue_priority ON approval_queue (priority)",
+    ]),
+    ("038_hot_path_indexes", [
+        # Predicate must match the endpoint's filter (approved = false AND rejected = false)
+        # for the planner to use the partial index
+        "CREATE INDEX IF NOT EXISTS ix_approval_queue_pending_route_created "
+        "ON approval_queue (route, created_at DESC, id DESC) WHERE approved = false AND rejected = false",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_processed_at ON email_history (processed_at DESC, id DESC)",
+        "ANALYZE approval_queue",
+        "ANALYZE email_history",
+    ]),
+    ("041_partition_email_history", [
+        # Rebuild email_history as a table partitioned by month on processed_at, with one
+        # partition per month that has rows plus the next few; skipped if already partitioned
+        """
+        DO $$
+        DECLARE
+            part_month date;
+            last_month date;
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'email_history' AND relkind = 'r'
+                       AND relnamespace = to_regnamespace(current_schema())) THEN
+                UPDATE email_history SET processed_at = COALESCE(received_at, now()) WHERE processed_at IS NULL;
+                ALTER TABLE email_history RENAME TO email_history_unpartitioned;
+                ALTER TABLE email_history_unpartitioned RENAME CONSTRAINT email_history_pkey TO email_history_unpartitioned_pkey;
+                CREATE TABLE email_history (
+                    LIKE email_history_unpartitioned INCLUDING DEFAULTS,
+                    PRIMARY KEY (id, processed_at)
+                ) PARTITION BY RANGE (processed_at);
+
+                part_month := date_trunc('month', COALESCE((SELECT min(processed_at) FROM email_history_unpartitioned), now()));
+                last_month := date_trunc('month', now()) + interval '3 months';
+                WHILE part_month <= last_month LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF email_history FOR VALUES FROM (%L) TO (%L)',
+                        'email_history_' || to_char(part_month, 'YYYY_MM'), part_month, part_month + interval '1 month'
+                    );
+                    part_month := part_month + interval '1 month';
+                END LOOP;
+
+                INSERT INTO email_history SELECT * FROM email_history_unpartitioned;
+                DROP TABLE email_history_unpartitioned;
+            END IF;
+        END $$
+        """,
+        # Indexes on the parent are created on every partition, current and future
+        "CREATE INDEX IF NOT EXISTS ix_email_history_conversation_id ON email_history (conversation_id)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_email_id ON email_history (email_id)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_mailbox ON email_history (mailbox)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_processed_at ON email_history (processed_at DESC, id DESC)",
+        "ANALYZE email_history",
+    ]),
+    ("042_seed_approval_queue_counts", [
+        # The counters table itself is created by create_all; start it from the current queue
+        """
+        INSERT INTO approval_queue_counts (route, mailbox, pending, updated_at)
+        SELECT COALESCE(route, ''), COALESCE(mailbox, ''), count(*), now()
+        FROM approval_queue
+        WHERE approved = false AND rejected = false
+        GROUP BY COALESCE(route, ''), COALESCE(mailbox, '')
+        ON CONFLICT (route, mailbox) DO UPDATE SET pending = EXCLUDED.pending, updated_at = EXCLUDED.updated_at
+        """,
+    ]),
+    ("043_full_text_search", [
+        # Stored generated columns rewrite both tables once; email_history's partitions inherit theirs
+        """
+        ALTER TABLE approval_queue ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(sender_email, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(generated_response, '')), 'D')
+        ) STORED
+        """,
+        """
+        ALTER TABLE email_history ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(sender_email, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(final_response, '')), 'C')
+        ) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_approval_queue_search ON approval_queue USING gin (search_vector)",
+        "CREATE INDEX IF NOT EXISTS ix_email_history_search ON email_history USING gin (search_vector)",
+    ]),
+    ("044_seed_triage_rollups", [
+        # The rollup tables are created by create_all; fill them from existing rows. Bucket
+        # formulas match analytics.confidence_bucket (20 steps) and latency_bucket (base 1.1)
+        """
+        INSERT INTO triage_daily_stats (day, route, received, approved, rejected, redirected,
+                                        confidence_sum, confidence_count, latency_seconds_sum, latency_count)
+        SELECT day, route, sum(received), sum(approved), sum(rejected), sum(redirected),
+               sum(confidence_sum), sum(confidence_count), sum(latency_seconds_sum), sum(latency_count)
+        FROM (
+            SELECT created_at::date AS day, COALESCE(route, '') AS route, 1 AS received,
+                   0 AS approved, 0 AS rejected, 0 AS redirected,
+                   COALESCE(confidence, 0) AS confidence_sum, (confidence IS NOT NULL)::int AS confidence_count,
+                   0.0 AS latency_seconds_sum, 0 AS latency_count
+            FROM approval_queue WHERE created_at IS NOT NULL
+            UNION ALL
+            SELECT processed_at::date, COALESCE(route, ''), 0,
+                   (approval_status IN ('approved', 'edited'))::int, (approval_status = 'rejected')::int,
+                   (approval_status = 'redirected')::int, 0, 0, 0.0, 0
+            FROM email_history
+            UNION ALL
+            SELECT approved_at::date, COALESCE(route, ''), 0, 0, 0, 0, 0, 0,
+                   GREATEST(EXTRACT(EPOCH FROM (approved_at AT TIME ZONE :local_tz) - (received_at AT TIME ZONE 'UTC')), 0), 1
+            FROM approval_queue WHERE approved AND approved_at IS NOT NULL AND received_at IS NOT NULL
+        ) rows
+        GROUP BY day, route
+        ON CONFLICT (day, route) DO NOTHING
+        """,
+        """
+        INSERT INTO triage_daily_histograms (day, route, metric, bucket, count)
+        SELECT created_at::date, COALESCE(route, ''), 'confidence',
+               LEAST(GREATEST(floor(confidence * 20)::int, 0), 19), count(*)
+        FROM approval_queue WHERE confidence IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, route, metric, bucket) DO NOTHING
+        """,
+        """
+        INSERT INTO triage_daily_histograms (day, route, metric, bucket, count)
+        SELECT approved_at::date, COALESCE(route, ''), 'latency_seconds',
+               floor(ln(GREATEST(EXTRACT(EPOCH FROM (approved_at AT TIME ZONE :local_tz)
+                                               - (received_at AT TIME ZONE 'UTC')), 0) + 1) / ln(1.1))::int, count(*)
+        FROM approval_queue WHERE approved AND approved_at IS NOT NULL AND received_at IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, route, metric, bucket) DO NOTHING
+        """,
+    ]),
+    ("045_approval_queue_notify", [
+        # Small JSON deltas for /approval-queue/stream; NOTIFY payloads must stay under 8000 bytes,
+        # so long text is cut and the body is reduced to a snippet
+        """
+        CREATE OR REPLACE FUNCTION notify_approval_queue_change() RETURNS trigger AS $$
+        DECLARE
+            changed approval_queue;
+            payload jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed := OLD;
+            ELSE
+                changed := NEW;
+            END IF;
+            -- Only changes the dashboard shows: new rows, resolutions, route changes and deletes
+            IF TG_OP = 'UPDATE' AND NEW.approved IS NOT DISTINCT FROM OLD.approved
+               AND NEW.rejected IS NOT DISTINCT FROM OLD.rejected AND NEW.route IS NOT DISTINCT FROM OLD.route THEN
+                RETURN NULL;
+            END IF;
+            payload := jsonb_build_object(
+                'op', lower(TG_OP), 'id', changed.id, 'email_id', changed.email_id,
+                'route', changed.route, 'mailbox', changed.mailbox,
+                'status', CASE WHEN changed.approved THEN 'approved' WHEN changed.rejected THEN 'rejected' ELSE 'pending' END
+            );
+            IF TG_OP <> 'DELETE' AND NOT COALESCE(changed.approved, false) AND NOT COALESCE(changed.rejected, false) THEN
+                payload := payload || jsonb_build_object(
+                    'subject', left(changed.subject, 200), 'sender_email', changed.sender_email,
+                    'snippet', regexp_replace(left(changed.body, 200), '\s+', ' ', 'g'),
+                    'redirect_department', changed.redirect_department, 'received_at', changed.received_at,
+                    'confidence', changed.confidence, 'priority', changed.priority, 'created_at', changed.created_at
+                );
+            END IF;
+            PERFORM pg_notify('approval_queue_events', payload::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS approval_queue_notify ON approval_queue",
+        "CREATE TRIGGER approval_queue_notify AFTER INSERT OR UPDATE OR DELETE ON approval_queue "
+        "FOR EACH ROW EXECUTE FUNCTION notify_approval_queue_change()",
+    ]),
+    ("046_table_versions", [
+        # The table itself is created by create_all. Statement-level, so a bulk insert is one bump;
+        # the UPDATE is part of the writing transaction, so readers never see a version ahead of its rows
+        "INSERT INTO table_versions (name, version) VALUES ('approval_queue', 0), ('email_history', 0) "
+        "ON CONFLICT (name) DO NOTHING",
+        """
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS approval_queue_version ON approval_queue",
+        "CREATE TRIGGER approval_queue_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON approval_queue "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+        "DROP TRIGGER IF EXISTS email_history_version ON email_history",
+        "CREATE TRIGGER email_history_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON email_history "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()",
+    ]),
+    ("050_graph_outbox_internet_message_id", [
+        "ALTER TABLE graph_outbox ADD COLUMN IF NOT EXISTS internet_message_id TEXT",
+    ]),
+    ("051_work_item_available_at", [
+        "ALTER TABLE triage_work_items ADD COLUMN IF NOT EXISTS available_at TIMESTAMP",
+    ]),
+    ("052_approval_queue_delivery_error", [
+        "ALTER TABLE approval_queue ADD COLUMN IF NOT EXISTS delivery_error TEXT",
+    ]),
+    ("053_triage_latency_utc", [
+        # Latencies used to subtract UTC received_at from local approved_at; rebuild them from
+        # approval_queue with both sides in UTC (replays are never rolled up, as in analytics)
+        "UPDATE triage_daily_stats SET latency_seconds_sum = 0, latency_count = 0",
+        "DELETE FROM triage_daily_histograms WHERE metric = 'latency_seconds'",
+        """
+        INSERT INTO triage_daily_stats (day, route, received, approved, rejected, redirected,
+                                        confidence_sum, confidence_count, latency_seconds_sum, latency_count)
+        SELECT approved_at::date, COALESCE(route, ''), 0, 0, 0, 0, 0, 0,
+               sum(GREATEST(EXTRACT(EPOCH FROM (approved_at AT TIME ZONE :local_tz) - (received_at AT TIME ZONE 'UTC')), 0)),
+               count(*)
+        FROM approval_queue
+        WHERE approved AND approved_at IS NOT NULL AND received_at IS NOT NULL AND email_id NOT LIKE 'replay-%'
+        GROUP BY 1, 2
+        ON CONFLICT (day, route) DO UPDATE SET latency_seconds_sum = EXCLUDED.latency_seconds_sum,
+                                               latency_count = EXCLUDED.latency_count
+        """,
+        """
+        INSERT INTO triage_daily_histograms (day, route, metric, bucket, count)
+        SELECT approved_at::date, COALESCE(route, ''), 'latency_seconds',
+               floor(ln(GREATEST(EXTRACT(EPOCH FROM (approved_at AT TIME ZONE :local_tz)
+                                               - (received_at AT TIME ZONE 'UTC')), 0) + 1) / ln(1.1))::int, count(*)
+        FROM approval_queue
+        WHERE approved AND approved_at IS NOT NULL AND received_at IS NOT NULL AND email_id NOT LIKE 'replay-%'
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, route, metric, bucket) DO UPDATE SET count = EXCLUDED.count
+        """,
+    ]),
+]
+
+
+def run_migrations(engine: Engine) -> list[str]:
+    """
+    Apply migrations that have not been recorded in schema_migrations yet
+
+    Args:
+        engine: SQLAlchemy engine for the target database
+    Returns:
+        Names of the migrations applied by this call
+    """
+    applied_now = []
+    params = {'local_tz': _local_timezone()}
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "name VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+        ))
+        applied = set(conn.execute(text("SELECT name FROM schema_migrations")).scalars())
+
+    for name, statements in MIGRATIONS:
+        if name in applied:
+            continue
+        # Each migration runs in its own transaction so a failure leaves earlier ones applied
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement), params)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        print(f"Applied migration {name}")
+        applied_now.append(name)
+    return applied_now
@@ -0,0 +1,470 @@
+"""
+Transactional outbox for replies and forwards
+Approving or redirecting an email only writes a graph_outbox row, in the same
+transaction as the approval_queue update and the history row, and returns
+202. OutboxDispatcher (in the API process, or standalone with
+`python outbox.py`) leases due rows with FOR UPDATE SKIP LOCKED and delivers
+them through Graph $batch calls with an app-only token, in three recorded
+steps: create the reply/forward as a draft, send the draft, mark the original
+read. A draft can only be sent once, so a retry after a crash resends nothing;
+a send that finds the draft gone only counts once the message is found in Sent
+Items. Failed steps are retried with exponential backoff; a row that runs out
+of attempts is flagged on its approval and history row (delivery_error,
+'delivery_failed') until requeue_delivery puts it back in line.
+
+Needs AZURE_AD_TENANT_ID, AZURE_AD_CLIENT_ID and AZURE_AD_CLIENT_SECRET (the
+app registration AzureAIClient uses) with the Mail.Send and Mail.ReadWrite
+application permissions.
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from azure.identity.aio import ClientSecretCredential
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from email_client import GRAPH_BATCH_LIMIT, EmailClient
+from models import ApprovalQueue, EmailHistory, GraphOutbox, SessionLocal
+
+load_dotenv()
+
+REPLY = 'reply'
+FORWARD = 'forward'
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 120))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+# Retry delays double from OUTBOX_RETRY_SECONDS up to OUTBOX_MAX_RETRY_SECONDS
+OUTBOX_RETRY_SECONDS = 10
+OUTBOX_MAX_RETRY_SECONDS = 3600
+# $batch calls in flight at once; Graph allows 4 concurrent requests per mailbox
+GRAPH_BATCH_CONCURRENCY = int(os.getenv('GRAPH_BATCH_CONCURRENCY', 4))
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
+# A draft Graph no longer has and that was never sent; a requeue starts from a new draft
+DRAFT_LOST = "draft not found and not in Sent Items"
+# History status of each action once delivered, and once given up on
+RESOLVED_STATUS = {REPLY: 'approved', FORWARD: 'redirected'}
+DELIVERY_FAILED = 'delivery_failed'
+
+
+def idempotency_key(action: str, approval_id: uuid.UUID) -> str:
+    return f"{action}:{approval_id}"
+
+
+def enqueue_delivery(db: Session, approval: ApprovalQueue, action: str, mailbox: str,
+                     payload: Dict[str, Any]) -> GraphOutbox:
+    """
+    Add an outbox row for an approval, in the session's current transaction
+
+    Args:
+        db: Session whose transaction also resolves the approval
+        approval: The approval being replied to or forwarded
+        action: REPLY or FORWARD
+        mailbox: Address of the mailbox holding the email
+        payload: {"body"} for REPLY, {"to", "comment"} for FORWARD
+    Returns:
+        The new row, or the existing one if this approval was already queued
+    """
+    key = idempotency_key(action, approval.id)
+    stmt = pg_insert(GraphOutbox).values(
+        id=uuid.uuid4(), idempotency_key=key, approval_id=approval.id, action=action, mailbox=mailbox,
+        email_id=approval.email_id, payload=json.dumps(payload), status='pending', attempts=0,
+        next_attempt_at=datetime.now(),
+    ).on_conflict_do_nothing(index_elements=[GraphOutbox.idempotency_key]).returning(GraphOutbox)
+    delivery = db.scalars(stmt).first()
+    return delivery or db.scalars(select(GraphOutbox).where(GraphOutbox.idempotency_key == key)).one()
+
+
+def find_delivery(db: Session, approval_id: uuid.UUID, action: Optional[str] = None) -> Optional[GraphOutbox]:
+    """The outbox row of an approval (of that action if given), None if it was never approved or redirected"""
+    stmt = select(GraphOutbox).where(GraphOutbox.approval_id == approval_id)
+    if action:
+        stmt = stmt.where(GraphOutbox.action == action)
+    return db.scalars(stmt.order_by(GraphOutbox.created_at.desc())).first()
+
+
+def delivery_status(delivery: GraphOutbox) -> Dict[str, Any]:
+    return {
+        'id': str(delivery.id),
+        'approval_id': str(delivery.approval_id),
+        'action': delivery.action,
+        'status': delivery.status,
+        'attempts': delivery.attempts,
+        'last_error': delivery.last_error,
+        'sent_at': delivery.sent_at.isoformat() if delivery.sent_at else None,
+        'marked_read': delivery.marked_read,
+        'next_attempt_at': delivery.next_attempt_at.isoformat() if delivery.status == 'pending' and delivery.next_attempt_at else None,
+        'delivered_at': delivery.delivered_at.isoformat() if delivery.delivered_at else None,
+    }
+
+
+def lease_deliveries(db: Session, owner: str, limit: int, lease_seconds: int) -> List[GraphOutbox]:
+    """
+    Lease up to `limit` due outbox rows, oldest first
+
+    Like lease_work_items: SKIP LOCKED keeps concurrent dispatchers apart, and rows
+    whose lease expired (a crashed dispatcher) are picked up again. The caller commits.
+    """
+    now = datetime.now()
+    due = (
+        select(GraphOutbox.id)
+        .where(or_(
+            and_(GraphOutbox.status == 'pending', GraphOutbox.next_attempt_at <= now),
+            and_(GraphOutbox.status == 'leased', GraphOutbox.lease_expires_at < now),
+        ))
+        .order_by(GraphOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(GraphOutbox)
+        .where(GraphOutbox.id.in_(due.scalar_subquery()))
+        .values(status='leased', lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=GraphOutbox.attempts + 1, updated_at=now)
+        .returning(GraphOutbox)
+    )
+    return list(db.scalars(stmt).all())
+
+
+def save_progress(db: Session, owner: str, deliveries: List[GraphOutbox], errors: Dict[uuid.UUID, str],
+                  warnings: Optional[Dict[uuid.UUID, str]] = None, max_attempts: int = OUTBOX_MAX_ATTEMPTS) -> None:
+    """
+    Record the steps done and release the lease: delivered, back to pending with backoff, or failed
+
+    A row whose reply or forward was sent is never failed: if only marking the
+    original read keeps failing, it ends as delivered with marked_read false
+    and the error kept as a warning in last_error. Only rows this dispatcher
+    still holds are written. The caller commits.
+    """
+    warnings = warnings or {}
+    now = datetime.now()
+    for delivery in deliveries:
+        values: Dict[str, Any] = {
+            'draft_id': delivery.draft_id, 'internet_message_id': delivery.internet_message_id,
+            'sent_at': delivery.sent_at, 'marked_read': delivery.marked_read,
+            'lease_owner': None, 'lease_expires_at': None, 'updated_at': now,
+        }
+        error = errors.get(delivery.id)
+        if error is None:
+            values.update(status='delivered', delivered_at=now, last_error=warnings.get(delivery.id))
+        elif delivery.attempts >= max_attempts and delivery.sent_at:
+            values.update(status='delivered', delivered_at=now, last_error=f"Sent, but not marked read: {error}")
+        elif delivery.attempts >= max_attempts:
+            values.update(status='failed', last_error=error)
+            print(f"⚠️ Giving up on {delivery.action} for approval {delivery.approval_id}: {error}")
+            _flag_failed(db, delivery, error)
+        else:
+            delay = min(OUTBOX_RETRY_SECONDS * 2 ** (delivery.attempts - 1), OUTBOX_MAX_RETRY_SECONDS)
+            values.update(status='pending', last_error=error, next_attempt_at=now + timedelta(seconds=delay))
+        db.execute(
+            update(GraphOutbox)
+            .where(GraphOutbox.id == delivery.id, GraphOutbox.lease_owner == owner)
+            .values(**values)
+        )
+
+
+def _flag_failed(db: Session, delivery: GraphOutbox, error: str) -> None:
+    """Show a given-up delivery on its approval and history row, where reviewers look"""
+    db.execute(update(ApprovalQueue).where(ApprovalQueue.id == delivery.approval_id).values(delivery_error=error))
+    db.execute(
+        update(EmailHistory)
+        .where(EmailHistory.email_id == delivery.email_id,
+               EmailHistory.approval_status == RESOLVED_STATUS.get(delivery.action))
+        .values(approval_status=DELIVERY_FAILED)
+    )
+
+
+def failed_deliveries(db: Session, limit: int) -> List[Dict[str, Any]]:
+    """Given-up outbox rows with their approval, most recent first"""
+    rows = db.execute(
+        select(GraphOutbox, ApprovalQueue.subject, ApprovalQueue.sender_email)
+        .join(ApprovalQueue, ApprovalQueue.id == GraphOutbox.approval_id)
+        .where(GraphOutbox.status == 'failed')
+        .order_by(GraphOutbox.updated_at.desc())
+        .limit(limit)
+    ).all()
+    return [{**delivery_status(delivery), 'subject': subject, 'sender_email': sender_email}
+            for delivery, subject, sender_email in rows]
+
+
+def requeue_delivery(db: Session, approval_id: uuid.UUID) -> Optional[GraphOutbox]:
+    """
+    Put an approval's failed outbox row back in line and clear its flags
+
+    The draft is kept unless it was lost unsent, so a retry never sends twice.
+    The caller commits and wakes the dispatcher.
+
+    Returns:
+        The requeued row, None if the approval has no failed delivery
+    """
+    delivery = db.scalars(
+        select(GraphOutbox)
+        .where(GraphOutbox.approval_id == approval_id, GraphOutbox.status == 'failed')
+        .with_for_update()
+    ).first()
+    if delivery is None:
+        return None
+    now = datetime.now()
+    values: Dict[str, Any] = {'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'updated_at': now,
+                              'lease_owner': None, 'lease_expires_at': None}
+    if delivery.last_error and DRAFT_LOST in delivery.last_error:
+        values.update(draft_id=None, internet_message_id=None)
+    delivery = db.scalars(
+        update(GraphOutbox).where(GraphOutbox.id == delivery.id).values(**values).returning(GraphOutbox)
+    ).one()
+    db.execute(update(ApprovalQueue).where(ApprovalQueue.id == approval_id).values(delivery_error=None))
+    db.execute(
+        update(EmailHistory)
+        .where(EmailHistory.email_id == delivery.email_id, EmailHistory.approval_status == DELIVERY_FAILED)
+        .values(approval_status=RESOLVED_STATUS.get(delivery.action))
+    )
+    return delivery
+
+
+def _graph_error(result: Optional[Dict[str, Any]]) -> str:
+    if not result:
+        return "No response from Graph"
+    body = result.get("body")
+    if isinstance(body, dict) and isinstance(body.get("error"), dict):
+        return body["error"].get("message") or body["error"].get("code") or str(body)
+    return str(body) if body else f"Graph returned {result.get('status')}"
+
+
+def _succeeded(result: Optional[Dict[str, Any]]) -> bool:
+    return bool(result) and 200 <= result["status"] < 300
+
+
+class OutboxDispatcher:
+    """Delivers outbox rows through Graph until stopped"""
+
+    def __init__(self, owner: Optional[str] = None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 lease_seconds: int = OUTBOX_LEASE_SECONDS, poll_interval: float = OUTBOX_POLL_SECONDS) -> None:
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.running = False
+        self._wake = asyncio.Event()
+        self._credential: Optional[ClientSecretCredential] = None
+        self.tenant_id = os.getenv('AZURE_AD_TENANT_ID')
+        self.client_id = os.getenv('AZURE_AD_CLIENT_ID')
+        self.client_secret = os.getenv('AZURE_AD_CLIENT_SECRET')
+
+    def wake(self) -> None:
+        """Look for due rows now instead of at the next poll (call after committing new rows)"""
+        self._wake.set()
+
+    def check_credentials(self) -> None:
+        """Raise ValueError if the app registration settings are missing"""
+        missing_vars = [name for name, value in (('AZURE_AD_TENANT_ID', self.tenant_id),
+                                                 ('AZURE_AD_CLIENT_ID', self.client_id),
+                                                 ('AZURE_AD_CLIENT_SECRET', self.client_secret)) if not value]
+        if missing_vars:
+            raise ValueError(f"Missing required Azure environment variables: {', '.join(missing_vars)}")
+
+    async def run(self) -> None:
+        # The API's lifespan already checked; this covers `python outbox.py`
+        try:
+            self.check_credentials()
+        except ValueError as e:
+            # Nothing could be delivered, so leave the rows pending instead of leasing them
+            print(f"ERROR: Outbox dispatcher not started: {e}")
+            raise
+        self.running = True
+        while self.running:
+            try:
+                leased = await self.run_once()
+            except Exception as e:
+                print(f"Error in outbox dispatcher: {e}")
+                leased = 0
+            if leased == 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def stop(self) -> None:
+        self.running = False
+        self._wake.set()
+
+    async def close(self) -> None:
+        if self._credential:
+            await self._credential.close()
+
+    async def run_once(self) -> int:
+        """
+        Lease one batch of due rows and deliver it
+
+        Returns:
+            Number of rows leased
+        """
+        deliveries = await asyncio.to_thread(self._lease)
+        if not deliveries:
+            return 0
+        errors: Dict[uuid.UUID, str] = {}
+        warnings: Dict[uuid.UUID, str] = {}
+        try:
+            await self._deliver(deliveries, errors, warnings)
+        except Exception as e:
+            for delivery in deliveries:
+                errors.setdefault(delivery.id, str(e))
+        await asyncio.to_thread(self._save, deliveries, errors, warnings)
+        sent = sum(1 for delivery in deliveries if delivery.id not in errors)
+        print(f"Outbox: {sent} delivered, {len(errors)} to retry")
+        return len(deliveries)
+
+    def _lease(self) -> List[GraphOutbox]:
+        with SessionLocal(expire_on_commit=False) as session:
+            deliveries = lease_deliveries(session, self.owner, self.batch_size, self.lease_seconds)
+            session.commit()
+        return deliveries
+
+    def _save(self, deliveries: List[GraphOutbox], errors: Dict[uuid.UUID, str],
+              warnings: Dict[uuid.UUID, str]) -> None:
+        with SessionLocal() as session:
+            save_progress(session, self.owner, deliveries, errors, warnings)
+            session.commit()
+
+    async def _token(self) -> str:
+        if self._credential is None:
+            self._credential = ClientSecretCredential(
+                tenant_id=self.tenant_id,
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+            )
+        # The credential caches the token until shortly before it expires
+        return (await self._credential.get_token(GRAPH_SCOPE)).token
+
+    async def _deliver(self, deliveries: List[GraphOutbox], errors: Dict[uuid.UUID, str],
+                       warnings: Dict[uuid.UUID, str]) -> None:
+        """Run each row's remaining steps, one $batch round per step"""
+        email_client = EmailClient(access_token=await self._token())
+
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            # 1. Drafts. Saved before sending, so a retry sends this draft instead of making another
+            todo = [delivery for delivery in deliveries if not delivery.draft_id]
+            results = await self._run_step(email_client, client, todo, self._draft_request)
+            for delivery in todo:
+                result = results.get(str(delivery.id))
+                if _succeeded(result) and isinstance(result.get("body"), dict) and result["body"].get("id"):
+                    delivery.draft_id = result["body"]["id"]
+                    delivery.internet_message_id = result["body"].get("internetMessageId")
+                else:
+                    errors[delivery.id] = f"Creating the {delivery.action} failed: {_graph_error(result)}"
+            if todo:
+                await asyncio.to_thread(self._save_drafts, todo)
+
+            # 2. Send
+            todo = [delivery for delivery in deliveries
+                    if delivery.id not in errors and delivery.draft_id and not delivery.sent_at]
+            results = await self._run_step(email_client, client, todo,
+                                           lambda mailbox_client, request_id, delivery:
+                                           mailbox_client.send_draft_request(request_id, delivery.draft_id))
+            gone = []
+            for delivery in todo:
+                result = results.get(str(delivery.id))
+                if _succeeded(result):
+                    delivery.sent_at = datetime.now()
+                elif result and result["status"] == 404:
+                    gone.append(delivery)
+                else:
+                    errors[delivery.id] = f"Sending the {delivery.action} failed: {_graph_error(result)}"
+
+            # A missing draft was either sent by an earlier attempt or deleted; only Sent Items can tell
+            await self._confirm_sent(email_client, client, gone, errors)
+
+            # 3. Mark the original read. 404: it was moved or deleted meanwhile, nothing left to mark
+            todo = [delivery for delivery in deliveries
+                    if delivery.id not in errors and delivery.sent_at and not delivery.marked_read]
+            results = await self._run_step(email_client, client, todo,
+                                           lambda mailbox_client, request_id, delivery:
+                                           mailbox_client.mark_read_request(request_id, delivery.email_id))
+            for delivery in todo:
+                result = results.get(str(delivery.id))
+                if _succeeded(result):
+                    delivery.marked_read = True
+                elif result and result["status"] == 404:
+                    warnings[delivery.id] = "Original email not found, so it was not marked read"
+                else:
+                    errors[delivery.id] = f"Marking the email read failed: {_graph_error(result)}"
+
+    async def _confirm_sent(self, email_client: EmailClient, client: httpx.AsyncClient,
+                            deliveries: List[GraphOutbox], errors: Dict[uuid.UUID, str]) -> None:
+        """Mark rows whose draft returned 404 as sent if their message is in Sent Items, else record an error"""
+        todo = [delivery for delivery in deliveries if delivery.internet_message_id]
+        for delivery in deliveries:
+            if not delivery.internet_message_id:
+                errors[delivery.id] = f"Sending the {delivery.action} failed: draft not found and cannot be looked up"
+        results = await self._run_step(email_client, client, todo,
+                                       lambda mailbox_client, request_id, delivery:
+                                       mailbox_client.find_sent_request(request_id, delivery.internet_message_id))
+        for delivery in todo:
+            result = results.get(str(delivery.id))
+            if _succeeded(result) and isinstance(result.get("body"), dict) and result["body"].get("value"):
+                delivery.sent_at = datetime.now()
+            elif _succeeded(result):
+                errors[delivery.id] = f"Sending the {delivery.action} failed: {DRAFT_LOST}"
+            else:
+                errors[delivery.id] = f"Checking Sent Items for the {delivery.action} failed: {_graph_error(result)}"
+
+    def _draft_request(self, mailbox_client: EmailClient, request_id: str, delivery: GraphOutbox) -> Dict[str, Any]:
+        payload = json.loads(delivery.payload or '{}')
+        if delivery.action == FORWARD:
+            return mailbox_client.create_forward_request(request_id, delivery.email_id, payload.get('to'),
+                                                         payload.get('comment') or "")
+        return mailbox_client.create_reply_request(request_id, delivery.email_id, payload.get('body') or "")
+
+    def _save_drafts(self, deliveries: List[GraphOutbox]) -> None:
+        with SessionLocal() as session:
+            for delivery in deliveries:
+                if delivery.draft_id:
+                    session.execute(
+                        update(GraphOutbox)
+                        .where(GraphOutbox.id == delivery.id, GraphOutbox.lease_owner == self.owner)
+                        .values(draft_id=delivery.draft_id, internet_message_id=delivery.internet_message_id,
+                                updated_at=datetime.now())
+                    )
+            session.commit()
+
+    async def _run_step(self, email_client: EmailClient, client: httpx.AsyncClient, deliveries: List[GraphOutbox],
+                        build) -> Dict[str, Dict[str, Any]]:
+        """Send one sub-request per row (keyed by row id) in $batch calls, GRAPH_BATCH_CONCURRENCY at a time"""
+        requests = [build(email_client.for_mailbox(delivery.mailbox), str(delivery.id), delivery)
+                    for delivery in deliveries]
+        semaphore = asyncio.Semaphore(GRAPH_BATCH_CONCURRENCY)
+        results: Dict[str, Dict[str, Any]] = {}
+
+        async def run(batch: List[Dict[str, Any]]) -> None:
+            async with semaphore:
+                try:
+                    results.update(await email_client.send_batch(batch, client))
+                except Exception as e:
+                    for request in batch:
+                        results[request["id"]] = {"status": 0, "body": f"Graph batch failed: {e}"}
+
+        await asyncio.gather(*(run(requests[start:start + GRAPH_BATCH_LIMIT])
+                               for start in range(0, len(requests), GRAPH_BATCH_LIMIT)))
+        return results
+
+
+async def main() -> None:
+    dispatcher = OutboxDispatcher()
+    print(f"Outbox dispatcher {dispatcher.owner} started")
+    try:
+        await dispatcher.run()
+    finally:
+        await dispatcher.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
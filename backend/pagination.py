@@ -0,0 +1,82 @@
+"""
+Keyset (cursor) pagination for the list endpoints
+Pages are ordered by (sort value, id) descending and the next page starts
+strictly after the last row of the previous one, so every page is one index
+range scan no matter how deep it is, and rows inserted meanwhile never shift
+or duplicate entries across pages.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, List, Optional, Tuple, Union
+
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+SortValue = Union[datetime, float]
+
+
+def encode_cursor(value: SortValue, row_id: uuid.UUID) -> str:
+    """Opaque, URL-safe token for the position after a row (sorted by a timestamp or a score)"""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value, str(row_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[SortValue, uuid.UUID]:
+    """
+    Parse a token from encode_cursor
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, (int, float)):
+            raise ValueError(value)
+        return value, uuid.UUID(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+async def fetch_page(session: AsyncSession, query: Select, sort_column, id_column,
+                     cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of `query`, highest sort value (e.g. newest) first
+
+    Args:
+        session: Session to query with
+        query: Select of the columns to return (must include both ordering columns), already filtered
+        sort_column: Column or labeled expression ordering the pages (e.g. created_at, a search rank)
+        id_column: Primary key, breaks ties between equal sort values
+        cursor: Token from the previous page, None for the first page
+        limit: Page size
+    Returns:
+        (rows, next_cursor); rows are Row objects, next_cursor is None on the last page
+    """
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        query = query.where(
+            tuple_(sort_column, id_column) < tuple_(value, row_id),
+            # Implied by the row comparison, but lets the planner skip partitions past the cursor
+            sort_column <= value,
+        )
+    # One extra row tells whether another page exists
+    query = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+    rows = list((await session.execute(query)).all())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        last_value = getattr(last, sort_column.key)
+        if last_value is not None:
+            next_cursor = encode_cursor(last_value, getattr(last, id_column.key))
+    return rows, next_cursor
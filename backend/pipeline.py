@@ -0,0 +1,203 @@
+"""
+Staged asyncio pipeline used by EmailEngine
+Stages are connected by bounded queues, so a slow stage applies backpressure
+to the ones before it while every stage keeps its own pool of workers.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline
+
+    The handler receives an item and returns the item to pass downstream,
+    or None to drop it (e.g. a duplicate or an email the agent could not answer).
+    Exceptions raised by the handler drop the item and are reported as failures.
+
+    With batch_size > 1 the handler receives a list of whatever items are already
+    waiting (up to batch_size, never waiting for more) and returns the list of
+    items to pass on; items missing from the returned list count as dropped.
+    """
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+    queue_size: int = 16
+    batch_size: int = 1
+
+
+@dataclass
+class StageMetrics:
+    """Per-stage counters collected while the pipeline runs"""
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    max_queue_depth: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        handled = self.processed + self.dropped + self.failed
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "avg_seconds": round(self.busy_seconds / handled, 3) if handled else 0.0,
+            "avg_wait_seconds": round(self.wait_seconds / handled, 3) if handled else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+# Stage name of the outcome reported when iterating the input items fails (its item is None)
+FEED_STAGE = "feed"
+
+
+@dataclass
+class PipelineOutcome:
+    """An item leaving the pipeline, either completed by the last stage or dropped by `stage`"""
+    item: Any
+    stage: str
+    completed: bool
+    error: Optional[str] = None
+
+
+@dataclass
+class _Envelope:
+    item: Any
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class Pipeline:
+    """Runs items through a list of stages, yielding each item as soon as it leaves"""
+
+    def __init__(self, stages: List[Stage]) -> None:
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        for stage in stages:
+            if stage.workers < 1 or stage.batch_size < 1:
+                raise ValueError(f"Stage '{stage.name}' needs at least one worker and a batch size of at least one")
+        self.stages = stages
+        self.metrics: Dict[str, StageMetrics] = {stage.name: StageMetrics() for stage in stages}
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metrics.as_dict() for name, metrics in self.metrics.items()}
+
+    async def run(self, items: Iterable[Any]) -> AsyncGenerator[PipelineOutcome, None]:
+        """
+        Feed items into the first stage and yield outcomes in completion order
+
+        Args:
+            items: Items for the first stage's handler
+        Yields:
+            PipelineOutcome for every item, completed or not. If iterating `items`
+            raises, the items fed so far still finish and one more outcome with
+            stage FEED_STAGE, no item and the error is yielded.
+        """
+        queues = [asyncio.Queue(maxsize=max(stage.queue_size, 1)) for stage in self.stages]
+        outcomes: asyncio.Queue = asyncio.Queue()
+        live_workers = [stage.workers for stage in self.stages]
+
+        async def feed() -> None:
+            try:
+                for item in items:
+                    await queues[0].put(_Envelope(item))
+            except asyncio.CancelledError:
+                # The run is being torn down; nobody is waiting for the sentinels
+                raise
+            except Exception as e:
+                print(f"⚠️ Feeding the pipeline failed: {e}")
+                await outcomes.put(PipelineOutcome(None, FEED_STAGE, False, str(e)))
+            # Always end the first stage, or its workers (and the run) would wait forever
+            for _ in range(self.stages[0].workers):
+                await queues[0].put(_DONE)
+
+        async def finish_stage(index: int) -> None:
+            live_workers[index] -= 1
+            if live_workers[index] == 0:
+                if index == len(self.stages) - 1:
+                    await outcomes.put(_DONE)
+                else:
+                    for _ in range(self.stages[index + 1].workers):
+                        await queues[index + 1].put(_DONE)
+
+        async def forward(index: int, item: Any) -> None:
+            if index == len(self.stages) - 1:
+                await outcomes.put(PipelineOutcome(item, self.stages[index].name, True))
+            else:
+                await queues[index + 1].put(_Envelope(item))
+
+        async def work(index: int) -> None:
+            stage = self.stages[index]
+            metrics = self.metrics[stage.name]
+            while True:
+                envelope = await queues[index].get()
+                if envelope is _DONE:
+                    await finish_stage(index)
+                    return
+
+                # Take whatever else is already waiting, up to the batch size
+                batch = [envelope]
+                done_seen = False
+                while len(batch) < stage.batch_size and not queues[index].empty():
+                    extra = queues[index].get_nowait()
+                    if extra is _DONE:
+                        done_seen = True
+                        break
+                    batch.append(extra)
+
+                metrics.max_queue_depth = max(metrics.max_queue_depth, queues[index].qsize() + len(batch))
+                started = time.perf_counter()
+                metrics.wait_seconds += sum(started - queued.enqueued_at for queued in batch)
+                items = [queued.item for queued in batch]
+                try:
+                    if stage.batch_size > 1:
+                        results = await stage.handler(items)
+                    else:
+                        result = await stage.handler(items[0])
+                        results = [] if result is None else [result]
+                except Exception as e:
+                    metrics.failed += len(items)
+                    metrics.busy_seconds += time.perf_counter() - started
+                    print(f"⚠️ Stage '{stage.name}' failed: {e}")
+                    for item in items:
+                        await outcomes.put(PipelineOutcome(item, stage.name, False, str(e)))
+                else:
+                    metrics.busy_seconds += time.perf_counter() - started
+                    if stage.batch_size > 1:
+                        passed = {id(result) for result in results}
+                        dropped = [item for item in items if id(item) not in passed]
+                    else:
+                        dropped = items if not results else []
+                    metrics.processed += len(results)
+                    metrics.dropped += len(dropped)
+                    for item in dropped:
+                        await outcomes.put(PipelineOutcome(item, stage.name, False))
+                    for result in results:
+                        await forward(index, result)
+
+                if done_seen:
+                    await finish_stage(index)
+                    return
+
+        tasks = [asyncio.create_task(feed())]
+        for index, stage in enumerate(self.stages):
+            tasks.extend(asyncio.create_task(work(index)) for _ in range(stage.workers))
+
+        try:
+            while True:
+                outcome = await outcomes.get()
+                if outcome is _DONE:
+                    break
+                yield outcome
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
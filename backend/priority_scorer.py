@@ -0,0 +1,255 @@
+"""
+Priority Scoring System for Email Triage
+Identifies urgent keywords, sender type, and sentiment
+All keyword lists are compiled into one regex shaped like a trie of the
+keywords, so an email is scanned once however many keywords there are.
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, List
+
+from models import Email
+
+
+URGENT = 'urgent'
+NEGATIVE = 'negative'
+HOLD = 'hold'
+TIME_SENSITIVE = 'time_sensitive'
+
+
+def _phrase_pattern(phrase: str) -> str:
+    """Regex for a keyword, allowing any whitespace between its words"""
+    return r'\s+'.join(re.escape(word) for word in phrase.split())
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Build an alternation of keywords factored by common prefix
+
+    'hold|holiday' becomes 'hol(?:d|iday)', so the regex engine picks a branch by
+    the next character instead of trying every keyword at every position.
+    Longer keywords win over their prefixes because the optional groups are greedy.
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [
+            (r'\s+' if char == ' ' else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class PriorityScorer:
+    """Priority scoring based on keywords, sender, and sentiment"""
+
+    # Urgent keywords that increase priority
+    URGENT_KEYWORDS = [
+        'urgent', 'asap', 'immediately', 'emergency', 'critical',
+        'overdue', 'past due', 'late', 'hold', 'blocked',
+        'cannot register', 'registration blocked', 'financial hold',
+        'deadline', 'due today', 'last day'
+    ]
+
+    # High-priority sender types
+    HIGH_PRIORITY_SENDERS = [
+        'parent', 'mother', 'father', 'guardian', 'attorney',
+        'financial aid', 'advising', 'registrar'
+    ]
+
+    # Sentiment keywords (negative sentiment = higher priority)
+    NEGATIVE_SENTIMENT = [
+        'angry', 'frustrated', 'disappointed', 'concerned',
+        'worried', 'upset', 'unacceptable', 'miles', 'ridiculous',
+        'unfair', 'discrimination', 'complaint'
+    ]
+
+    # Registration/financial hold indicators
+    HOLD_KEYWORDS = ['hold', 'blocked']
+
+    # Time-sensitive phrases
+    TIME_PHRASES = ['today', 'tomorrow', 'this week', 'as soon as possible']
+
+    # Sender address fragments for parents and guardians
+    PARENT_EMAIL_TERMS = ['parent', 'guardian', 'mom', 'dad']
+
+    def __init__(self):
+        """Compile every keyword list into a single matcher"""
+        categories: Dict[str, set] = {}
+        for category, keywords in (
+            (URGENT, self.URGENT_KEYWORDS),
+            (NEGATIVE, self.NEGATIVE_SENTIMENT),
+            (HOLD, self.HOLD_KEYWORDS),
+            (TIME_SENSITIVE, self.TIME_PHRASES),
+        ):
+            for keyword in keywords:
+                categories.setdefault(keyword, set()).add(category)
+
+        # The regex returns the longest keyword at each position, so a phrase also
+        # carries the categories of shorter keywords inside it ('financial hold' is a hold)
+        for keyword in categories:
+            for other in categories:
+                if other != keyword and re.search(rf'\b{_phrase_pattern(other)}\b', keyword):
+                    categories[keyword] |= categories[other]
+        self._categories: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(found) for keyword, found in categories.items()
+        }
+
+        # Text is lowercased before matching, which is cheaper than re.IGNORECASE
+        self._text_pattern = re.compile(r'\b(?:' + _trie_pattern(self._categories) + r')s?\b')
+        # Sender terms are matched anywhere in the name or address ('momsmith@...')
+        self._sender_pattern = re.compile(
+            '|'.join(_phrase_pattern(term) for term in sorted(self.HIGH_PRIORITY_SENDERS, key=len, reverse=True)),
+            re.IGNORECASE
+        )
+        self._parent_email_pattern = re.compile(
+            '|'.join(re.escape(term) for term in self.PARENT_EMAIL_TERMS),
+            re.IGNORECASE
+        )
+
+    def _keyword(self, match: str) -> str:
+        """Map matched text back to its keyword (normalized spacing, optional plural)"""
+        keyword = ' '.join(match.split())
+        if keyword not in self._categories and keyword.endswith('s'):
+            keyword = keyword[:-1]
+        return keyword
+
+    def match_keywords(self, text: str) -> Dict[str, List[str]]:
+        """
+        Find keywords in text with a single regex pass
+
+        Args:
+            text: Text to scan
+        Returns:
+            Distinct matched keywords per category
+        """
+        found: Dict[str, List[str]] = {URGENT: [], NEGATIVE: [], HOLD: [], TIME_SENSITIVE: []}
+        seen = set()
+        for match in self._text_pattern.finditer(text.lower()):
+            keyword = self._keyword(match.group(0))
+            if keyword in seen or keyword not in self._categories:
+                continue
+            seen.add(keyword)
+            for category in self._categories[keyword]:
+                found[category].append(keyword)
+        return found
+
+    def score(self, email_data: Dict) -> Dict:
+        """
+        Score email priority based on multiple factors
+
+        Args:
+            email_data: {
+                'subject': str,
+                'body': str,
+                'sender_type': str (optional),
+                'sender_email': str (optional)
+            }
+
+        Returns:
+            {
+                'priority_level': int (1-10),
+                'urgency_score': float (0-1),
+                'reasoning': str,
+                'factors': List[str]
+            }
+        """
+        full_text = f"{email_data.get('subject') or ''} {email_data.get('body') or ''}"
+        sender_type = email_data.get('sender_type') or ''
+        sender_email = email_data.get('sender_email') or ''
+        found = self.match_keywords(full_text)
+
+        factors = []
+        urgency_score = 0.0
+
+        # Check for urgent keywords
+        urgent_count = len(found[URGENT])
+        if urgent_count > 0:
+            urgency_score += 0.3
+            factors.append(f"{urgent_count} urgent keyword(s) found")
+
+        # Check sender type
+        if self._sender_pattern.search(sender_type) or self._sender_pattern.search(sender_email):
+            urgency_score += 0.3
+            factors.append("High-priority sender (parent/guardian/staff)")
+
+        # Check for negative sentiment
+        negative_count = len(found[NEGATIVE])
+        if negative_count > 0:
+            urgency_score += 0.2
+            factors.append(f"Negative sentiment detected ({negative_count} indicators)")
+
+        # Check for financial hold mention
+        if found[HOLD]:
+            urgency_score += 0.15
+            factors.append("Financial hold mentioned")
+
+        # Check for parent@, guardian@, etc.
+        if self._parent_email_pattern.search(sender_email):
+            urgency_score += 0.15
+            factors.append("Parent/guardian email detected")
+
+        # Check for time-sensitive phrases
+        if found[TIME_SENSITIVE]:
+            urgency_score += 0.1
+            factors.append("Time-sensitive language detected")
+
+        # Cap urgency score at 1.0
+        urgency_score = min(urgency_score, 1.0)
+
+        # Convert to priority level (1-10)
+        priority_level = max(1, int(urgency_score * 9) + 1)
+
+        # Generate reasoning
+        if not factors:
+            reasoning = "Standard priority - no urgent indicators"
+        else:
+            reasoning = "; ".join(factors)
+
+        return {
+            'priority_level': priority_level,
+            'urgency_score': urgency_score,
+            'reasoning': reasoning,
+            'factors': factors
+        }
+
+    def score_batch(self, emails: Iterable[Email]) -> Dict[str, int]:
+        """
+        Score a batch of emails
+
+        Args:
+            emails: Emails from Graph (the sender display name stands in for sender_type)
+        Returns:
+            Priority level (1-10) per email id
+        """
+        return {
+            email.id: self.score({
+                'subject': email.subject,
+                'body': email.body,
+                'sender_type': email.sender,
+                'sender_email': email.sender_email,
+            })['priority_level']
+            for email in emails
+        }
+
+    def is_urgent(self, priority_level: int, threshold: int = 7) -> bool:
+        """
+        Determine if email is urgent based on priority level
+
+        Args:
+            priority_level: Priority level (1-10)
+            threshold: Threshold for urgent (default: 7)
+
+        Returns:
+            True if urgent, False otherwise
+        """
+        return priority_level >= threshold
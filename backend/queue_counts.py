@@ -0,0 +1,148 @@
+"""
+Pending approval counts per route and mailbox
+approval_queue_counts is adjusted in the same transaction as every insert into
+approval_queue and every approve/reject/redirect/delete of a pending row, so
+reading the counts is a lookup of a handful of rows instead of counting the
+queue. QueueCountReconciler periodically recounts from approval_queue to
+correct any drift (rows changed outside these code paths, rolled-back races).
+"""
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import ApprovalQueue, ApprovalQueueCount, SessionLocal
+
+ROUTES = ('AI_AGENT', 'HUMAN_REQUIRED', 'REDIRECT')
+RECONCILE_INTERVAL_SECONDS = float(os.getenv('QUEUE_COUNT_RECONCILE_SECONDS', 900))
+
+# Counter rows use '' for the signed-in user's own mailbox (mailbox IS NULL), as it is part of the key
+CountKey = Tuple[str, str]
+
+
+def count_key(route: Optional[str], mailbox: Optional[str]) -> CountKey:
+    return (route or '', mailbox or '')
+
+
+def adjust_queue_counts(db: Session, deltas: Dict[CountKey, int]) -> None:
+    """
+    Add deltas to the pending counters in the session's current transaction
+
+    Args:
+        db: Session whose transaction also writes the approval_queue change
+        deltas: Change per (route, mailbox) key from count_key
+    """
+    now = datetime.now()
+    for (route, mailbox), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        stmt = pg_insert(ApprovalQueueCount).values(route=route, mailbox=mailbox, pending=delta, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ApprovalQueueCount.route, ApprovalQueueCount.mailbox],
+            set_={"pending": ApprovalQueueCount.pending + delta, "updated_at": now},
+        )
+        db.execute(stmt)
+
+
+def count_inserted(db: Session, rows: Iterable[Dict[str, Any]]) -> None:
+    """Count newly inserted approval rows (column values keyed by attribute name)"""
+    adjust_queue_counts(db, Counter(count_key(row.get('route'), row.get('mailbox')) for row in rows))
+
+
+def count_resolved(db: Session, approval: ApprovalQueue) -> None:
+    """
+    Take a row out of the pending counters
+
+    Call before marking it approved/rejected or deleting it; rows that were
+    already resolved are not counted twice.
+    """
+    if not approval.approved and not approval.rejected:
+        adjust_queue_counts(db, {count_key(approval.route, approval.mailbox): -1})
+
+
+def queue_counts(db: Session, mailbox: Optional[str] = None) -> Dict[str, int]:
+    """
+    Pending rows per route
+
+    Args:
+        db: Session to query with
+        mailbox: Only count this shared mailbox; None counts every mailbox
+    Returns:
+        Pending count for every route (0 when none are waiting)
+    """
+    query = select(ApprovalQueueCount.route, func.sum(ApprovalQueueCount.pending)).group_by(ApprovalQueueCount.route)
+    if mailbox:
+        query = query.where(ApprovalQueueCount.mailbox == mailbox)
+    counts = {route: 0 for route in ROUTES}
+    for route, pending in db.execute(query):
+        counts[route] = int(pending or 0)
+    return counts
+
+
+def reconcile_queue_counts(db: Session) -> Dict[CountKey, int]:
+    """
+    Recount pending rows and overwrite the counters that drifted
+
+    Writers are held off with a table lock for the duration of the count (a
+    scan of the pending rows only), so no adjustment can be counted twice or lost.
+
+    Args:
+        db: Session to run in; the caller commits
+    Returns:
+        Corrections applied per key (actual - counter)
+    """
+    db.execute(text("LOCK TABLE approval_queue_counts IN EXCLUSIVE MODE"))
+    actual = {
+        count_key(route, mailbox): pending
+        for route, mailbox, pending in db.execute(
+            select(ApprovalQueue.route, ApprovalQueue.mailbox, func.count())
+            .where(ApprovalQueue.approved == False, ApprovalQueue.rejected == False)
+            .group_by(ApprovalQueue.route, ApprovalQueue.mailbox)
+        )
+    }
+    stored = {
+        (route, mailbox): pending
+        for route, mailbox, pending in db.execute(
+            select(ApprovalQueueCount.route, ApprovalQueueCount.mailbox, ApprovalQueueCount.pending)
+        )
+    }
+    drift = {key: actual.get(key, 0) - stored.get(key, 0) for key in actual.keys() | stored.keys()}
+    drift = {key: delta for key, delta in drift.items() if delta}
+    adjust_queue_counts(db, drift)
+    if drift:
+        # The counts endpoint shares the queue's ETag, which only approval_queue writes bump
+        db.execute(text("UPDATE table_versions SET version = version + 1 WHERE name = 'approval_queue'"))
+    return drift
+
+
+class QueueCountReconciler:
+    """Runs reconcile_queue_counts periodically in the background until stopped"""
+
+    def __init__(self, interval: float = RECONCILE_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+        self.running = False
+
+    def reconcile(self) -> Dict[CountKey, int]:
+        with SessionLocal() as session:
+            drift = reconcile_queue_counts(session)
+            session.commit()
+        if drift:
+            print(f"⚠️ Corrected approval queue counters: {drift}")
+        return drift
+
+    async def run(self) -> None:
+        self.running = True
+        while self.running:
+            try:
+                await asyncio.to_thread(self.reconcile)
+            except Exception as e:
+                print(f"Error reconciling approval queue counts: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stop(self) -> None:
+        self.running = False
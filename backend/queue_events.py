@@ -0,0 +1,100 @@
+"""
+Live approval queue changes over SSE
+A trigger on approval_queue (migration 045) sends a small JSON NOTIFY on the
+approval_queue_events channel for every insert, resolution and delete.
+QueueEventBroker holds one LISTEN connection per process and fans each
+notification out to every connected dashboard, so idle dashboards cost no
+queries at all; they only receive a delta when the queue actually changes.
+"""
+import asyncio
+import json
+from typing import AsyncGenerator, Optional, Set
+
+import asyncpg
+
+from models import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+
+CHANNEL = "approval_queue_events"
+# Seconds between SSE keep-alive comments while the queue is quiet
+KEEPALIVE_SECONDS = 15
+# Events buffered per subscriber before it is told to reload instead
+SUBSCRIBER_QUEUE_SIZE = 256
+RECONNECT_SECONDS = 5
+
+# Sent when events may have been missed (slow client, lost LISTEN connection)
+RESYNC = json.dumps({"op": "resync"})
+
+
+class QueueEventBroker:
+    """One LISTEN connection shared by all /approval-queue/stream subscribers"""
+
+    def __init__(self) -> None:
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lost: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._connection and not self._connection.is_closed():
+            await self._connection.close()
+
+    async def _listen(self) -> None:
+        """Keep the LISTEN connection open, reconnecting after failures"""
+        while True:
+            try:
+                self._lost = asyncio.Event()
+                self._connection = await asyncpg.connect(
+                    user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT,
+                    database=DB_NAME, ssl='require'
+                )
+                self._connection.add_termination_listener(lambda _: self._lost.set())
+                await self._connection.add_listener(CHANNEL, self._on_notify)
+                # Anything may have changed while we were not listening
+                self._publish(RESYNC)
+                await self._lost.wait()
+                print("⚠️ Approval queue LISTEN connection lost, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in approval queue listener: {e}")
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        self._publish(payload)
+
+    def _publish(self, payload: str) -> None:
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # The client is too far behind for deltas to be useful
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        """
+        Yield SSE frames for queue changes until the client disconnects
+
+        Each frame's data is a JSON delta: {"op": "insert" | "update" | "delete", "id", "route",
+        "mailbox", "status", ...summary columns}, or {"op": "resync"} when the client should reload.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {payload}\n\n"
+        finally:
+            self._subscribers.discard(queue)
@@ -1,10 +1,14 @@
 #This file handles the redirecting of emails to the appropriate department
-#We can handle the forward of the email
-from email_client import EmailClient
-from typing import Any
+#The forward itself is queued in the outbox and sent by the outbox dispatcher
+from typing import Any, Optional
+import uuid
 from datetime import datetime
-from models import ApprovalQueue, db, EmailHistory, RedirectEmailRequest
+from models import ApprovalQueue, EmailHistory, RedirectEmailRequest
+from analytics import record_resolved
+from queue_counts import count_resolved
+from outbox import FORWARD, enqueue_delivery, find_delivery
 from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 
@@ -19,40 +23,57 @@ redirect_email_address_dict = {
 
 
 class RedirectHandler:
-    def __init__(self, email_client: EmailClient):
-        self.email_client = email_client
+    def __init__(self, session: AsyncSession, user_mailbox: Optional[str] = None):
+        self.session = session
+        # Address of the signed-in user's mailbox, for emails that are not in a shared mailbox
+        self.user_mailbox = user_mailbox
   
 
     async def redirect_email(self, redirect_request:RedirectEmailRequest ) -> dict[str, Any]:
 
         '''
         Redirects an email to the appropriate department
-        Marks the original email as read
+        Queues the forward (and marking the original as read) in the outbox
 
         updates the Approval with approved = True
         updates the Approval with approved_at = datetime.now()
         updates the Approval with final_response = comment
         adds the email to the EmailHistory table
+        all in one transaction
 
         '''
         try:
-            approval = db.query(ApprovalQueue).filter_by(id=redirect_request.approval_id).first()
+            #lock the row so a concurrent approve/redirect/reject waits and then sees it resolved
+            approval = await self.session.get(ApprovalQueue, uuid.UUID(redirect_request.approval_id),
+                                              with_for_update=True, populate_existing=True)
             if not approval:
                 raise HTTPException(status_code=404, detail="Approval not found")
-            result = await self.email_client.forward_email(approval.email_id, redirect_request.redirect_department_email, redirect_request.comment)
-            if not result.get("success"):
-                raise HTTPException(status_code=500, detail=result.get("message"))
-            #mark the original email as read
-            mark_read_result = await self.email_client.mark_as_read(approval.email_id)
-            if not mark_read_result:
-                raise HTTPException(status_code=500, detail="Failed to mark email as read")
+            #a repeated request returns the forward already queued
+            delivery = await self.session.run_sync(find_delivery, approval.id, FORWARD)
+            if delivery:
+                return {
+                    "status": delivery.status,
+                    "message": "Email redirect already queued",
+                    "approval_id": redirect_request.approval_id,
+                    "delivery_id": str(delivery.id)
+                }
+            if approval.approved or approval.rejected:
+                raise HTTPException(status_code=409, detail="Approval already resolved")
+            if not redirect_request.redirect_department_email:
+                raise HTTPException(status_code=400, detail="No department email to redirect to")
+            mailbox = approval.mailbox or self.user_mailbox
+            if not mailbox:
+                raise HTTPException(status_code=400, detail="No mailbox to forward from")
             #update the Approval with approved = True
+            await self.session.run_sync(count_resolved, approval)
+            await self.session.run_sync(record_resolved, approval, 'redirected')
             approval.approved = True
             approval.approved_at = datetime.now()
             approval.final_response = redirect_request.comment
 
             email_history = EmailHistory(
                 email_id=approval.email_id,
+                mailbox=approval.mailbox,
                 conversation_id=approval.conversation_id,
                 conversation_index=approval.conversation_index,
                 subject=approval.subject,
@@ -65,14 +86,21 @@ class RedirectHandler:
                 approval_status='redirected',
                 processed_at=datetime.now()
             )
-            db.add(email_history)
-            db.commit()
+            self.session.add(email_history)
+            delivery = await self.session.run_sync(enqueue_delivery, approval, FORWARD, mailbox, {
+                "to": redirect_request.redirect_department_email, "comment": redirect_request.comment or ""
+            })
+            await self.session.commit()
             return {
-                "status": "success",
-                "message": "Email redirected successfully",
-                "approval_id": redirect_request.approval_id
+                "status": "queued",
+                "message": "Email redirect queued",
+                "approval_id": redirect_request.approval_id,
+                "delivery_id": str(delivery.id)
             }
+        except HTTPException:
+            await self.session.rollback()
+            raise
         except Exception as e:
-            db.rollback()
+            await self.session.rollback()
             print(f"Error in redirect_email: {e}")
             raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,522 @@
+"""
+Record and replay triage runs for offline benchmarking
+A recorded run captures the Graph messages, LLM classifications and agent
+drafts of a real triage run into a JSON fixture, with PII scrubbed. Replay
+serves that fixture in place of EmailClient, EmailClassifier.llm and
+AzureAIFoundryAgent with configurable latencies, so EmailEngine throughput can
+be measured for thousands of emails without a mailbox or Azure endpoints.
+
+Record (a real run: drafts land in the approval queue as usual):
+    python replay.py record --token $GRAPH_TOKEN --out fixtures/run.json
+
+Benchmark (point DB_* at a scratch database, replayed rows use 'replay-' ids,
+which the analytics rollups ignore):
+    python replay.py bench fixtures/run.json --emails 5000 --llm-latency lognormal:1.2,0.4 --cleanup
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from analytics import REPLAY_ID_PREFIX
+from email_client import EmailClient
+from models import Email
+
+
+FIXTURE_VERSION = 1
+
+# Graph message fields that are identifiers or timestamps, never scrubbed
+_ID_FIELDS = {'id', 'conversationId', 'conversationIndex', 'receivedDateTime',
+              'conversation_id', 'conversation_index', 'received_at', 'mailbox'}
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class PIIScrubber:
+    """
+    Replace personal data in recorded text with stable placeholders
+
+    Addresses and sender names map to the same placeholder everywhere in the
+    fixture, so threads, classifier prompts and drafts stay consistent with
+    each other. Phone numbers, UNC PIDs and card/account numbers are masked.
+    """
+
+    EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+    PHONE_RE = re.compile(r'(?<!\w)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\w)')
+    PID_RE = re.compile(r'\b\d{9}\b')
+    ACCOUNT_RE = re.compile(r'\b\d(?:[ -]?\d){11,18}\b')
+
+    def __init__(self) -> None:
+        self.addresses: Dict[str, str] = {}
+        self.names: Dict[str, str] = {}
+        self._names_re: Optional[re.Pattern] = None
+
+    def add_name(self, name: Optional[str]) -> None:
+        """Register a sender display name to be replaced wherever it appears"""
+        if not name or name.lower() in ('unknown', '') or '@' in name:
+            return
+        if name not in self.names:
+            self.names[name] = f"Person {len(self.names) + 1}"
+            self._names_re = None
+
+    def _address(self, match: re.Match) -> str:
+        address = match.group(0).lower()
+        if address not in self.addresses:
+            self.addresses[address] = f"person{len(self.addresses) + 1}@example.edu"
+        return self.addresses[address]
+
+    def scrub_text(self, text: str) -> str:
+        if not text:
+            return text
+        text = self.EMAIL_RE.sub(self._address, text)
+        text = self.ACCOUNT_RE.sub('[NUMBER]', text)
+        text = self.PHONE_RE.sub('[PHONE]', text)
+        text = self.PID_RE.sub('[PID]', text)
+        if self.names:
+            if self._names_re is None:
+                by_length = sorted(self.names, key=len, reverse=True)
+                self._names_re = re.compile(r'\b(?:' + '|'.join(re.escape(name) for name in by_length) + r')\b')
+            text = self._names_re.sub(lambda match: self.names[match.group(0)], text)
+        return text
+
+    def scrub(self, value: Any, key: Optional[str] = None) -> Any:
+        """Scrub strings anywhere in a JSON-like value, leaving id and timestamp fields alone"""
+        if key in _ID_FIELDS:
+            return value
+        if isinstance(value, str):
+            return self.scrub_text(value)
+        if isinstance(value, list):
+            return [self.scrub(item) for item in value]
+        if isinstance(value, dict):
+            return {k: self.scrub(v, k) for k, v in value.items()}
+        return value
+
+
+class FixtureRecorder:
+    """Collects Graph, LLM and agent traffic of a run and writes it as a scrubbed fixture"""
+
+    def __init__(self) -> None:
+        self.emails: List[Email] = []
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.llm_calls: List[tuple] = []  # (prompt, response content)
+        self.agent_calls: List[tuple] = []  # (prompt, response dict)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def timed(self, kind: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latencies[kind].append(round(time.perf_counter() - started, 4))
+
+    def save(self, path: str) -> Dict[str, int]:
+        """
+        Scrub everything recorded and write the fixture
+
+        Args:
+            path: Output JSON file
+        Returns:
+            Number of emails, threads, LLM and agent responses written
+        """
+        scrubber = PIIScrubber()
+        for email in self.emails:
+            scrubber.add_name(email.sender)
+        for messages in self.threads.values():
+            for message in messages:
+                scrubber.add_name(message.get('from', {}).get('emailAddress', {}).get('name'))
+
+        fixture = {
+            'version': FIXTURE_VERSION,
+            'recorded_at': datetime.now().isoformat(),
+            'emails': [scrubber.scrub(asdict(email)) for email in self.emails],
+            'threads': {conversation_id: scrubber.scrub(messages) for conversation_id, messages in self.threads.items()},
+            # Keys are digests of the scrubbed prompt, which is what replay will send
+            'llm_responses': {_digest(scrubber.scrub_text(prompt)): scrubber.scrub_text(content)
+                              for prompt, content in self.llm_calls},
+            'agent_responses': {_digest(scrubber.scrub_text(prompt)): scrubber.scrub(response)
+                                for prompt, response in self.agent_calls},
+            'latencies': dict(self.latencies),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, indent=1)
+        return {
+            'emails': len(fixture['emails']),
+            'threads': len(fixture['threads']),
+            'llm_responses': len(fixture['llm_responses']),
+            'agent_responses': len(fixture['agent_responses']),
+        }
+
+
+class RecordingEmailClient(EmailClient):
+    """EmailClient that records the messages and threads it reads from Graph"""
+
+    def __init__(self, access_token: str, recorder: FixtureRecorder, mailbox: Optional[str] = None):
+        super().__init__(access_token=access_token, mailbox=mailbox)
+        self.recorder = recorder
+
+    def for_mailbox(self, mailbox: Optional[str]) -> "RecordingEmailClient":
+        if mailbox == self.mailbox:
+            return self
+        return RecordingEmailClient(self.access_token, self.recorder, mailbox=mailbox)
+
+    async def get_unread_emails(self, max_results: int = 10) -> list[Email]:
+        with self.recorder.timed('graph_messages'):
+            emails = await super().get_unread_emails(max_results=max_results)
+        self.recorder.emails.extend(emails)
+        return emails
+
+    async def get_conversation_messages(self, conversation_id: str) -> list[dict[str, Any]]:
+        with self.recorder.timed('graph_thread'):
+            messages = await super().get_conversation_messages(conversation_id)
+        if conversation_id:
+            self.recorder.threads[conversation_id] = messages
+        return messages
+
+
+class RecordingLLM:
+    """Wraps the classifier's AzureOpenAI client and records every completion"""
+
+    def __init__(self, llm, recorder: FixtureRecorder) -> None:
+        self.llm = llm
+        self.recorder = recorder
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        with self.recorder.timed('llm'):
+            response = self.llm.chat.completions.create(**kwargs)
+        prompt = kwargs['messages'][-1]['content']
+        self.recorder.llm_calls.append((prompt, response.choices[0].message.content))
+        return response
+
+
+class RecordingAgent:
+    """Wraps AzureAIFoundryAgent and records every draft"""
+
+    def __init__(self, agent, recorder: FixtureRecorder) -> None:
+        self.agent = agent
+        self.recorder = recorder
+
+    async def query_agent(self, subject: str, email_body: str, thread_context: str = "") -> Dict:
+        with self.recorder.timed('agent'):
+            response = await self.agent.query_agent(subject, email_body, thread_context)
+        if response:
+            self.recorder.agent_calls.append((_agent_prompt(subject, email_body, thread_context), response))
+        return response
+
+
+def _agent_prompt(subject: str, email_body: str, thread_context: str) -> str:
+    return thread_context or f"Subject: {subject}\nBody: {email_body}"
+
+
+class LatencyModel:
+    """
+    Latency distribution for one kind of call
+
+    Specs: 'recorded' (resample the fixture's latencies), 'none', 'fixed:S',
+    'uniform:A,B', 'normal:MEAN,STD' or 'lognormal:MEDIAN,SIGMA', in seconds.
+    """
+
+    def __init__(self, spec: str = 'recorded', recorded: Optional[List[float]] = None,
+                 scale: float = 1.0, seed: Optional[int] = None) -> None:
+        self.spec = spec
+        self.scale = scale
+        self.random = random.Random(seed)
+        self._sample = self._parse(spec, recorded or [])
+
+    def _parse(self, spec: str, recorded: List[float]) -> Callable[[], float]:
+        kind, _, args = spec.partition(':')
+        params = [float(arg) for arg in args.split(',') if arg]
+        if kind == 'none':
+            return lambda: 0.0
+        if kind == 'recorded':
+            return (lambda: self.random.choice(recorded)) if recorded else (lambda: 0.0)
+        if kind == 'fixed' and len(params) == 1:
+            return lambda: params[0]
+        if kind == 'uniform' and len(params) == 2:
+            return lambda: self.random.uniform(params[0], params[1])
+        if kind == 'normal' and len(params) == 2:
+            return lambda: self.random.gauss(params[0], params[1])
+        if kind == 'lognormal' and len(params) == 2:
+            mu = math.log(params[0])  # median = exp(mu)
+            return lambda: self.random.lognormvariate(mu, params[1])
+        raise ValueError(f"Invalid latency spec '{spec}'")
+
+    def sample(self) -> float:
+        return max(self._sample(), 0.0) * self.scale
+
+
+class ReplayFixture:
+    """A recorded fixture loaded for replay"""
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        if data.get('version') != FIXTURE_VERSION:
+            raise ValueError(f"Unsupported fixture version {data.get('version')}")
+        self.emails = [Email(**email) for email in data['emails']]
+        self.threads: Dict[str, List[Dict[str, Any]]] = data.get('threads', {})
+        self.llm_responses: Dict[str, str] = data.get('llm_responses', {})
+        self.agent_responses: Dict[str, Dict[str, Any]] = data.get('agent_responses', {})
+        self.latencies: Dict[str, List[float]] = data.get('latencies', {})
+        self.original_ids: Dict[str, str] = {}  # expanded id -> recorded id
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayFixture":
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def expand(self, count: int, tag: Optional[str] = None) -> List[Email]:
+        """
+        Build `count` emails by cycling the recorded ones under fresh ids
+
+        Ids look like replay-<tag>-<n>, so repeated benchmarks never collide
+        with each other or with real mail, and cleanup can find them.
+        """
+        if not self.emails:
+            raise ValueError("Fixture has no emails")
+        tag = tag or uuid.uuid4().hex[:8]
+        expanded = []
+        for n in range(count):
+            email = self.emails[n % len(self.emails)]
+            expanded.append(Email(**{**asdict(email), 'id': f"{REPLAY_ID_PREFIX}{tag}-{n}", 'is_read': False}))
+            self.original_ids[expanded[-1].id] = email.id
+        return expanded
+
+
+class ReplayEmailClient(EmailClient):
+    """EmailClient stand-in serving recorded threads; sends and forwards succeed without Graph"""
+
+    def __init__(self, fixture: ReplayFixture, graph_latency: LatencyModel, emails: Optional[List[Email]] = None):
+        super().__init__(access_token="")
+        self.fixture = fixture
+        self.graph_latency = graph_latency
+        self.emails = fixture.emails if emails is None else emails
+
+    def for_mailbox(self, mailbox: Optional[str]) -> "ReplayEmailClient":
+        return self
+
+    async def get_unread_emails(self, max_results: int = 10) -> list[Email]:
+        await asyncio.sleep(self.graph_latency.sample())
+        return self.emails[:max_results]
+
+    async def get_conversation_messages(self, conversation_id: str) -> list[dict[str, Any]]:
+        await asyncio.sleep(self.graph_latency.sample())
+        return self.fixture.threads.get(conversation_id, [])
+
+    # Thread messages carry the recorded ids, so mark the current message by its recorded id;
+    # the prompt then matches the recorded one and replay serves that email's own response
+    def format_thread_context(self, messages: list[dict[str, Any]], current_email_id: str) -> str:
+        return super().format_thread_context(messages, self.fixture.original_ids.get(current_email_id, current_email_id))
+
+    def format_thread_classification_context(self, messages: list[dict[str, Any]], current_email_id: str) -> str:
+        return super().format_thread_classification_context(
+            messages, self.fixture.original_ids.get(current_email_id, current_email_id)
+        )
+
+    async def mark_as_read(self, email_id: str) -> bool:
+        await asyncio.sleep(self.graph_latency.sample())
+        return True
+
+    async def send_reply(self, original_email_id: str, body: str, importance: str = "normal") -> dict[str, Any]:
+        await asyncio.sleep(self.graph_latency.sample())
+        return {"success": True, "status_code": 202, "message": "Reply sent successfully", "thread_id": None}
+
+    async def forward_email(self, email_id: str, redirect_department_email: str, comment: str = "") -> dict[str, Any]:
+        await asyncio.sleep(self.graph_latency.sample())
+        return {"success": True, "status_code": 202, "message": "Forward sent successfully"}
+
+
+class _ReplayResponses:
+    """Looks up a recorded response by prompt digest, cycling through all of them on a miss"""
+
+    def __init__(self, responses: Dict[str, Any]) -> None:
+        self.responses = responses
+        self._pool = list(responses.values())
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prompt: str) -> Any:
+        response = self.responses.get(_digest(prompt))
+        if response is not None:
+            self.hits += 1
+            return response
+        # Prompts that differ from the recording (e.g. scrubbing split a field) get any response
+        self.misses += 1
+        if not self._pool:
+            return None
+        response = self._pool[self._next % len(self._pool)]
+        self._next += 1
+        return response
+
+
+class ReplayLLM:
+    """Stand-in for EmailClassifier.llm returning recorded completions"""
+
+    def __init__(self, fixture: ReplayFixture, latency: LatencyModel) -> None:
+        self.latency = latency
+        self.responses = _ReplayResponses(fixture.llm_responses)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        # Blocking like the real client, which the classifier runs in a worker thread
+        time.sleep(self.latency.sample())
+        content = self.responses.get(kwargs['messages'][-1]['content'])
+        if content is None:
+            raise RuntimeError("Fixture has no recorded LLM responses")
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class ReplayAgent:
+    """Stand-in for AzureAIFoundryAgent returning recorded drafts"""
+
+    def __init__(self, fixture: ReplayFixture, latency: LatencyModel) -> None:
+        self.latency = latency
+        self.responses = _ReplayResponses(fixture.agent_responses)
+
+    async def query_agent(self, subject: str, email_body: str, thread_context: str = "") -> Dict:
+        await asyncio.sleep(self.latency.sample())
+        response = self.responses.get(_agent_prompt(subject, email_body, thread_context))
+        return dict(response) if response else {'response': None, 'error': 'Fixture has no recorded agent responses'}
+
+
+async def record(access_token: str, out: str, max_results: int = 10,
+                 mailboxes: Optional[Iterable[Optional[str]]] = None) -> Dict[str, Any]:
+    """
+    Run a real triage with recording wrappers and save the fixture
+
+    Args:
+        access_token: Graph token of the signed-in user
+        out: Fixture path
+        max_results: Maximum unread emails per mailbox
+        mailboxes: Mailboxes to read, defaults to the configured ones
+    Returns:
+        The run's result and the fixture summary
+    """
+    from azure.azure_ai_client import AzureAIClient
+    from classifier import EmailClassifier
+    from agent_handler import AzureAIFoundryAgent
+    from email_engine import EmailEngine
+    from mailboxes import configured_mailboxes
+
+    recorder = FixtureRecorder()
+    azure_ai_client = AzureAIClient()
+    classifier = EmailClassifier(llm=RecordingLLM(azure_ai_client.get_llm(), recorder))
+    agent = RecordingAgent(AzureAIFoundryAgent(project_client=azure_ai_client.project_client), recorder)
+    email_client = RecordingEmailClient(access_token, recorder)
+
+    emails = []
+    for mailbox in (configured_mailboxes() if mailboxes is None else mailboxes):
+        emails.extend(await email_client.for_mailbox(mailbox).get_unread_emails(max_results=max_results))
+    result = await EmailEngine(emails=emails, email_client=email_client, agent=agent, classifier=classifier).process_emails()
+    return {'result': result, 'fixture': recorder.save(out)}
+
+
+async def bench(fixture_path: str, count: int, graph_latency: str = 'recorded', llm_latency: str = 'recorded',
+                agent_latency: str = 'recorded', latency_scale: float = 1.0, seed: Optional[int] = None,
+                cleanup: bool = False) -> Dict[str, Any]:
+    """
+    Replay a fixture through EmailEngine and report throughput
+
+    Args:
+        fixture_path: Fixture written by record()
+        count: Number of emails to triage (the fixture's emails are cycled)
+        graph_latency, llm_latency, agent_latency: LatencyModel specs
+        latency_scale: Multiplier applied to every latency
+        seed: Random seed for reproducible latencies
+        cleanup: Delete the replayed rows afterwards
+    Returns:
+        Engine result, elapsed time, throughput and fixture hit rates
+    """
+    from classifier import EmailClassifier
+    from email_engine import EmailEngine
+
+    fixture = ReplayFixture.load(fixture_path)
+    tag = uuid.uuid4().hex[:8]
+    emails = fixture.expand(count, tag)
+
+    def latency(spec: str, kind: str, offset: int) -> LatencyModel:
+        return LatencyModel(spec, fixture.latencies.get(kind), latency_scale,
+                            None if seed is None else seed + offset)
+
+    email_client = ReplayEmailClient(fixture, latency(graph_latency, 'graph_thread', 0), emails)
+    llm = ReplayLLM(fixture, latency(llm_latency, 'llm', 1))
+    agent = ReplayAgent(fixture, latency(agent_latency, 'agent', 2))
+    engine = EmailEngine(emails=emails, email_client=email_client, agent=agent, classifier=EmailClassifier(llm=llm))
+
+    started = time.perf_counter()
+    try:
+        result = await engine.process_emails()
+    finally:
+        if cleanup:
+            delete_replayed_rows(tag)
+    elapsed = time.perf_counter() - started
+    return {
+        'tag': tag,
+        'emails': count,
+        'elapsed_seconds': round(elapsed, 3),
+        'emails_per_second': round(count / elapsed, 2) if elapsed else None,
+        'result': result,
+        'llm_fixture_hits': llm.responses.hits,
+        'llm_fixture_misses': llm.responses.misses,
+        'agent_fixture_hits': agent.responses.hits,
+        'agent_fixture_misses': agent.responses.misses,
+    }
+
+
+def delete_replayed_rows(tag: str) -> None:
+    """Remove the rows a benchmark run wrote"""
+    from models import SessionLocal, ApprovalQueue, TriageFailure, EmailClaim
+    from queue_counts import reconcile_queue_counts
+
+    pattern = f"{REPLAY_ID_PREFIX}{tag}-%"
+    with SessionLocal() as session:
+        for model in (ApprovalQueue, TriageFailure, EmailClaim):
+            session.query(model).filter(model.email_id.like(pattern)).delete(synchronize_session=False)
+        # The bulk delete bypasses the counters
+        reconcile_queue_counts(session)
+        session.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record and replay triage runs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="Run a real triage and save a scrubbed fixture")
+    record_parser.add_argument('--token', required=True, help="Graph access token")
+    record_parser.add_argument('--out', required=True, help="Fixture path")
+    record_parser.add_argument('--max-results', type=int, default=10, help="Unread emails per mailbox")
+
+    bench_parser = commands.add_parser('bench', help="Replay a fixture through EmailEngine")
+    bench_parser.add_argument('fixture', help="Fixture path")
+    bench_parser.add_argument('--emails', type=int, default=1000, help="Number of emails to triage")
+    bench_parser.add_argument('--graph-latency', default='recorded')
+    bench_parser.add_argument('--llm-latency', default='recorded')
+    bench_parser.add_argument('--agent-latency', default='recorded')
+    bench_parser.add_argument('--latency-scale', type=float, default=1.0)
+    bench_parser.add_argument('--seed', type=int)
+    bench_parser.add_argument('--cleanup', action='store_true', help="Delete replayed rows afterwards")
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        summary = asyncio.run(record(args.token, args.out, args.max_results))
+    else:
+        summary = asyncio.run(bench(args.fixture, args.emails, args.graph_latency, args.llm_latency,
+                                    args.agent_latency, args.latency_scale, args.seed, args.cleanup))
+    print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
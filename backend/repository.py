@@ -0,0 +1,358 @@
+"""
+Reusable database queries for the triage pipeline and API
+Functions take the session to run on rather than importing a global one.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, func, or_, select, union, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import ApprovalQueue, EmailClaim, EmailHistory, TriageFailure, TriageWorkItem
+
+
+def known_email_ids(db: Session, email_ids: Iterable[str]) -> set[str]:
+    """
+    Return the subset of email_ids that are already pending review or processed
+
+    One round trip for the whole batch, answered from the email_id indexes on
+    approval_queue and email_history.
+
+    Args:
+        db: Session to query with
+        email_ids: Graph message ids from the current fetch
+    Returns:
+        Set of email ids that should not be triaged again
+    """
+    ids = list(set(email_ids))
+    if not ids:
+        return set()
+    pending = select(ApprovalQueue.email_id).where(
+        ApprovalQueue.email_id.in_(ids),
+        ApprovalQueue.approved.is_(False),
+        ApprovalQueue.rejected.is_(False),
+    )
+    processed = select(EmailHistory.email_id).where(EmailHistory.email_id.in_(ids))
+    return set(db.execute(union(pending, processed)).scalars())
+
+
+# Multi-row INSERT is chunked to stay well under Postgres' 65535 bind parameter limit
+INSERT_CHUNK_SIZE = 1000
+
+
+def _approval_row(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill the client-side defaults so every row in a multi-row INSERT has the same columns"""
+    now = datetime.now()
+    row = {
+        "id": uuid.uuid4(),
+        "conversation_id": None,
+        "conversation_index": None,
+        "redirect_department": None,
+        "generated_response": None,
+        "is_read": False,
+        "agent_used": False,
+        "approved": False,
+        "rejected": False,
+        "received_at": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+    row.update(values)
+    return row
+
+
+def bulk_insert_approvals(db: Session, rows: List[Dict[str, Any]]) -> Dict[str, uuid.UUID]:
+    """
+    Insert approval queue rows with one multi-row INSERT ... ON CONFLICT DO NOTHING
+
+    Rows whose email_id is already queued are skipped (unique index on
+    approval_queue.email_id), so re-running a batch is harmless. The insert
+    runs in the session's current transaction; the caller commits.
+
+    Args:
+        db: Session whose transaction the rows are written in
+        rows: Column values per row, keyed by ApprovalQueue attribute name
+    Returns:
+        Dict mapping email_id -> new ApprovalQueue id, for inserted rows only
+    """
+    if not rows:
+        return {}
+    rows = [_approval_row(row) for row in rows]
+    inserted = {}
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        stmt = (
+            pg_insert(ApprovalQueue)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=[ApprovalQueue.email_id])
+            .returning(ApprovalQueue.id, ApprovalQueue.email_id)
+        )
+        for approval_id, email_id in db.execute(stmt):
+            inserted[email_id] = approval_id
+    return inserted
+
+
+def insert_approvals_checkpointed(db: Session, rows: List[Dict[str, Any]]) -> Tuple[Dict[str, uuid.UUID], Dict[str, str]]:
+    """
+    Bulk insert rows inside a savepoint, retrying row by row if the batch fails
+
+    A bad row only costs its own insert: the batch savepoint is rolled back and
+    every row is retried in its own savepoint, so the good rows still land.
+
+    Args:
+        db: Session whose transaction the rows are written in
+        rows: Column values per row, keyed by ApprovalQueue attribute name
+    Returns:
+        (inserted email_id -> approval id, failed email_id -> error message)
+    """
+    try:
+        with db.begin_nested():
+            return bulk_insert_approvals(db, rows), {}
+    except Exception as e:
+        print(f"⚠️ Bulk insert of {len(rows)} rows failed, retrying row by row: {e}")
+
+    inserted, errors = {}, {}
+    for row in rows:
+        try:
+            with db.begin_nested():
+                inserted.update(bulk_insert_approvals(db, [row]))
+        except Exception as e:
+            errors[row["email_id"]] = str(e)
+    return inserted, errors
+
+
+def record_failure(db: Session, email_id: str, stage: str, error: str, subject: Optional[str] = None) -> None:
+    """Insert or update the failure row for an email, counting attempts"""
+    now = datetime.now()
+    stmt = pg_insert(TriageFailure).values(
+        id=uuid.uuid4(), email_id=email_id, subject=subject, stage=stage, error=error,
+        attempts=1, created_at=now, updated_at=now
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TriageFailure.email_id],
+        set_={
+            "stage": stmt.excluded.stage,
+            "error": stmt.excluded.error,
+            "attempts": TriageFailure.attempts + 1,
+            "updated_at": now,
+        }
+    )
+    db.execute(stmt)
+
+
+def clear_failures(db: Session, email_ids: Iterable[str]) -> None:
+    """Forget earlier failures of emails that have now been triaged"""
+    ids = list(email_ids)
+    if ids:
+        db.execute(delete(TriageFailure).where(TriageFailure.email_id.in_(ids)))
+
+
+def exhausted_email_ids(db: Session, email_ids: Iterable[str], max_attempts: int) -> set[str]:
+    """Return emails that already failed max_attempts times and should not be retried automatically"""
+    ids = list(set(email_ids))
+    if not ids or max_attempts <= 0:
+        return set()
+    return set(db.execute(
+        select(TriageFailure.email_id).where(
+            TriageFailure.email_id.in_(ids),
+            TriageFailure.attempts >= max_attempts
+        )
+    ).scalars())
+
+
+def claim_emails(db: Session, email_ids: Iterable[str], run_id: uuid.UUID, ttl_seconds: int) -> set[str]:
+    """
+    Claim emails for a triage run; emails held by another live run are not returned
+
+    A claim is taken when no claim exists or the existing one has expired (its run
+    crashed or stalled), in one INSERT ... ON CONFLICT DO UPDATE ... WHERE statement.
+    The caller must commit for the claims to be visible to other runs.
+
+    Args:
+        db: Session to write the claims with
+        email_ids: Emails the run wants to process
+        run_id: Id of the claiming run
+        ttl_seconds: How long the claim holds if the run never releases it
+    Returns:
+        Email ids now owned by run_id
+    """
+    ids = list(set(email_ids))
+    if not ids:
+        return set()
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    stmt = pg_insert(EmailClaim).values([
+        {"email_id": email_id, "run_id": run_id, "claimed_at": now, "expires_at": expires_at}
+        for email_id in ids
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EmailClaim.email_id],
+        set_={"run_id": stmt.excluded.run_id, "claimed_at": stmt.excluded.claimed_at, "expires_at": stmt.excluded.expires_at},
+        where=(EmailClaim.expires_at < now) | (EmailClaim.run_id == stmt.excluded.run_id)
+    ).returning(EmailClaim.email_id)
+    return set(db.execute(stmt).scalars())
+
+
+def release_claims(db: Session, run_id: uuid.UUID) -> None:
+    """Drop every claim held by a run"""
+    db.execute(delete(EmailClaim).where(EmailClaim.run_id == run_id))
+
+
+def enqueue_work_items(db: Session, items: List[Dict[str, Any]]) -> int:
+    """
+    Add work items, one per email; items already waiting or leased are left alone
+
+    Items that finished earlier (status 'done') are reset to pending, since the
+    caller only enqueues emails that are not in the queue or history.
+
+    Args:
+        db: Session to write with
+        items: Dicts with email_id, JSON payload and optionally mailbox and priority
+    Returns:
+        Number of items inserted or reset
+    """
+    if not items:
+        return 0
+    now = datetime.now()
+    stmt = pg_insert(TriageWorkItem).values([
+        {"id": uuid.uuid4(), "email_id": item["email_id"], "mailbox": item.get("mailbox"),
+         "priority": item.get("priority", 1), "payload": item["payload"],
+         "status": "pending", "attempts": 0, "created_at": now, "updated_at": now}
+        for item in items
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TriageWorkItem.email_id],
+        set_={"payload": stmt.excluded.payload, "priority": stmt.excluded.priority, "status": "pending", "attempts": 0,
+              "last_error": None, "lease_owner": None, "lease_expires_at": None, "available_at": None,
+              "updated_at": now},
+        where=TriageWorkItem.status == "done"
+    ).returning(TriageWorkItem.id)
+    return len(db.execute(stmt).all())
+
+
+# Sentinel for "items from any mailbox" (None means the staff member's own mailbox)
+ANY_MAILBOX = object()
+
+
+def _available_work_item_filter(now: datetime):
+    return or_(
+        and_(TriageWorkItem.status == "pending",
+             or_(TriageWorkItem.available_at.is_(None), TriageWorkItem.available_at <= now)),
+        and_(TriageWorkItem.status == "leased", TriageWorkItem.lease_expires_at < now)
+    )
+
+
+def work_item_mailboxes(db: Session) -> List[Optional[str]]:
+    """Mailboxes that currently have work items available for leasing"""
+    return list(db.execute(
+        select(TriageWorkItem.mailbox).where(_available_work_item_filter(datetime.now())).distinct()
+    ).scalars())
+
+
+def lease_work_items(db: Session, worker_id: str, limit: int, lease_seconds: int, mailbox: Any = ANY_MAILBOX) -> List[TriageWorkItem]:
+    """
+    Lease up to `limit` pending (or expired) work items to a worker, highest priority first
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers on any node
+    never block each other or lease the same item. Expired leases (a crashed or
+    stalled worker) become available again. The caller must commit.
+
+    Args:
+        db: Session to lease with
+        worker_id: Identity of the leasing worker
+        limit: Maximum number of items to lease
+        lease_seconds: How long the lease holds without a heartbeat
+        mailbox: Only lease items from this mailbox (default: any)
+    Returns:
+        Leased work items
+    """
+    now = datetime.now()
+    available = select(TriageWorkItem.id).where(_available_work_item_filter(now))
+    if mailbox is not ANY_MAILBOX:
+        available = available.where(
+            TriageWorkItem.mailbox.is_(None) if mailbox is None else TriageWorkItem.mailbox == mailbox
+        )
+    available = (
+        available
+        .order_by(TriageWorkItem.priority.desc(), TriageWorkItem.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(TriageWorkItem)
+        .where(TriageWorkItem.id.in_(available.scalar_subquery()))
+        .values(
+            status="leased",
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=TriageWorkItem.attempts + 1,
+            updated_at=now
+        )
+        .returning(TriageWorkItem)
+    )
+    return list(db.scalars(stmt).all())
+
+
+def heartbeat_work_items(db: Session, worker_id: str, lease_seconds: int) -> int:
+    """Extend every lease held by a worker; returns the number of items still held"""
+    now = datetime.now()
+    result = db.execute(
+        update(TriageWorkItem)
+        .where(TriageWorkItem.lease_owner == worker_id, TriageWorkItem.status == "leased")
+        .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+    )
+    return result.rowcount
+
+
+def complete_work_items(db: Session, worker_id: str, email_ids: Iterable[str]) -> None:
+    """Mark items as done, only if this worker still holds their lease"""
+    ids = list(email_ids)
+    if ids:
+        db.execute(
+            update(TriageWorkItem)
+            .where(TriageWorkItem.email_id.in_(ids), TriageWorkItem.lease_owner == worker_id)
+            .values(status="done", lease_owner=None, lease_expires_at=None, updated_at=datetime.now())
+        )
+
+
+def defer_work_items(db: Session, worker_id: str, email_ids: Iterable[str], delay_seconds: int) -> None:
+    """
+    Put items back in the queue for another try after delay_seconds, without using up an attempt
+
+    For emails another triage run held when this worker got to them: that run may
+    still fail, so the item is leased again later instead of being marked done.
+    Only items this worker still holds are released.
+    """
+    ids = list(email_ids)
+    if ids:
+        now = datetime.now()
+        db.execute(
+            update(TriageWorkItem)
+            .where(TriageWorkItem.email_id.in_(ids), TriageWorkItem.lease_owner == worker_id)
+            .values(status="pending", lease_owner=None, lease_expires_at=None,
+                    available_at=now + timedelta(seconds=delay_seconds),
+                    attempts=func.greatest(TriageWorkItem.attempts - 1, 0), updated_at=now)
+        )
+
+
+def fail_work_item(db: Session, worker_id: str, email_id: str, error: str, max_attempts: int) -> None:
+    """Return a failed item to the queue, or park it as failed once it has used up its attempts"""
+    db.execute(
+        update(TriageWorkItem)
+        .where(TriageWorkItem.email_id == email_id, TriageWorkItem.lease_owner == worker_id)
+        .values(
+            status=case((TriageWorkItem.attempts >= max_attempts, "failed"), else_="pending"),
+            last_error=error,
+            lease_owner=None,
+            lease_expires_at=None,
+            updated_at=datetime.now()
+        )
+    )
+
+
+def work_item_counts(db: Session) -> Dict[str, int]:
+    """Number of work items per status"""
+    rows = db.execute(select(TriageWorkItem.status, func.count()).group_by(TriageWorkItem.status)).all()
+    return {status: count for status, count in rows}
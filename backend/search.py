@@ -0,0 +1,108 @@
+"""
+Full-text search over email history and the approval queue
+Both tables carry a generated, weighted tsvector (subject > sender > body or
+response > draft) with a GIN index, so a search is an index lookup of the
+matching rows followed by ranking only those. Queries use websearch syntax:
+quoted phrases, OR and -excluded words.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import ColumnElement, Select, func, select
+
+from models import ApprovalQueue, EmailHistory
+
+SEARCH_CONFIG = 'english'
+SOURCES = ('history', 'queue')
+SORTS = ('relevance', 'recent')
+QUEUE_STATUSES = ('pending', 'approved', 'rejected')
+
+# Lists and search results return a short, whitespace-collapsed preview instead of the full text;
+# substr only detoasts the first chunk of large bodies
+SNIPPET_LENGTH = 200
+
+
+def snippet(column: ColumnElement) -> ColumnElement:
+    """First SNIPPET_LENGTH characters of a text column, whitespace collapsed"""
+    return func.regexp_replace(func.substr(column, 1, SNIPPET_LENGTH), r'\s+', ' ', 'g')
+
+
+def search_history(text: str, route: Optional[str] = None, status: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   sort: str = 'relevance') -> Tuple[Select, ColumnElement]:
+    """
+    Build a search over email_history
+
+    Args:
+        text: Search text in websearch syntax
+        route: Only this route
+        status: Only this approval_status (approved, rejected, edited, redirected)
+        since: Earliest processed_at
+        until: Latest processed_at (exclusive)
+        sort: 'relevance' (rank, best first) or 'recent' (processed_at, newest first)
+    Returns:
+        (select, sort column) ready for pagination.fetch_page
+    """
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+    rank = func.ts_rank_cd(EmailHistory.search_vector, query).label('rank')
+    sort_column = rank if sort == 'relevance' else EmailHistory.processed_at
+    columns = [
+        EmailHistory.id, EmailHistory.email_id, EmailHistory.mailbox, EmailHistory.subject,
+        EmailHistory.sender_email, EmailHistory.route, EmailHistory.approval_status,
+        EmailHistory.confidence, EmailHistory.received_at, EmailHistory.processed_at, rank,
+        snippet(EmailHistory.final_response).label('snippet'),
+    ]
+
+    stmt = select(*columns).where(EmailHistory.search_vector.op('@@')(query))
+    if route:
+        stmt = stmt.where(EmailHistory.route == route)
+    if status:
+        stmt = stmt.where(EmailHistory.approval_status == status)
+    # Date bounds also prune email_history partitions
+    if since:
+        stmt = stmt.where(EmailHistory.processed_at >= since)
+    if until:
+        stmt = stmt.where(EmailHistory.processed_at < until)
+    return stmt, sort_column
+
+
+def search_queue(text: str, route: Optional[str] = None, status: Optional[str] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 sort: str = 'relevance') -> Tuple[Select, ColumnElement]:
+    """
+    Build a search over approval_queue
+
+    Args:
+        text: Search text in websearch syntax
+        route: Only this route
+        status: Only rows that are pending, approved or rejected
+        since: Earliest created_at
+        until: Latest created_at (exclusive)
+        sort: 'relevance' (rank, best first) or 'recent' (created_at, newest first)
+    Returns:
+        (select, sort column) ready for pagination.fetch_page
+    """
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, text)
+    rank = func.ts_rank_cd(ApprovalQueue.search_vector, query).label('rank')
+    sort_column = rank if sort == 'relevance' else ApprovalQueue.created_at
+    columns = [
+        ApprovalQueue.id, ApprovalQueue.email_id, ApprovalQueue.mailbox, ApprovalQueue.subject,
+        ApprovalQueue.sender_email, ApprovalQueue.route, ApprovalQueue.approved, ApprovalQueue.rejected,
+        ApprovalQueue.confidence, ApprovalQueue.received_at, ApprovalQueue.created_at, rank,
+        snippet(ApprovalQueue.body).label('snippet'),
+    ]
+
+    stmt = select(*columns).where(ApprovalQueue.search_vector.op('@@')(query))
+    if route:
+        stmt = stmt.where(ApprovalQueue.route == route)
+    if status == 'pending':
+        stmt = stmt.where(ApprovalQueue.approved == False, ApprovalQueue.rejected == False)
+    elif status == 'approved':
+        stmt = stmt.where(ApprovalQueue.approved == True)
+    elif status == 'rejected':
+        stmt = stmt.where(ApprovalQueue.rejected == True)
+    if since:
+        stmt = stmt.where(ApprovalQueue.created_at >= since)
+    if until:
+        stmt = stmt.where(ApprovalQueue.created_at < until)
+    return stmt, sort_column
@@ -0,0 +1,5 @@
+"""Shared test setup: the backend modules are imported as top-level modules, like the app does"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from analytics import LATENCY, latency_bucket, record_resolved
+from models import ApprovalQueue, TriageDailyHistogram, TriageDailyStats
+
+
+class FakeSession:
+    """Keeps the values of every rollup upsert"""
+
+    def __init__(self):
+        self.stats = []
+        self.histograms = []
+
+    def execute(self, stmt):
+        values = {column.key: value.value for column, value in stmt._values.items()}
+        if stmt.table.name == TriageDailyStats.__tablename__:
+            self.stats.append(values)
+        elif stmt.table.name == TriageDailyHistogram.__tablename__:
+            self.histograms.append(values)
+
+
+def approval(received_at, **values) -> ApprovalQueue:
+    values = {'email_id': "AAMk-1", 'approved': False, 'rejected': False, **values}
+    return ApprovalQueue(id=uuid.uuid4(), route="AI_AGENT", received_at=received_at, **values)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_latency_compares_utc_received_at_with_utc_now():
+    db = FakeSession()
+
+    record_resolved(db, approval(utc_now() - timedelta(minutes=5)), 'approved')
+
+    [stats] = db.stats
+    assert stats['approved'] == 1
+    assert stats['latency_count'] == 1
+    assert stats['latency_seconds_sum'] == pytest.approx(300, abs=5)
+    [histogram] = db.histograms
+    assert histogram['metric'] == LATENCY
+    assert histogram['bucket'] == latency_bucket(stats['latency_seconds_sum'])
+
+
+def test_rejections_have_no_latency():
+    db = FakeSession()
+
+    record_resolved(db, approval(utc_now()), 'rejected')
+
+    assert db.stats == [{'day': db.stats[0]['day'], 'route': 'AI_AGENT', 'rejected': 1}]
+    assert db.histograms == []
+
+
+def test_resolved_and_replayed_rows_are_not_counted():
+    db = FakeSession()
+
+    record_resolved(db, approval(utc_now(), approved=True), 'approved')
+    record_resolved(db, approval(utc_now(), email_id="replay-1-AAMk"), 'approved')
+
+    assert db.stats == [] and db.histograms == []
@@ -0,0 +1,133 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+import auth
+
+TENANT = "11111111-1111-1111-1111-111111111111"
+AUDIENCE = "api://heelper"
+KEY_ID = "test-key"
+
+private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def validator(monkeypatch):
+    monkeypatch.setattr(auth, "API_AUDIENCES", [AUDIENCE])
+    monkeypatch.setattr(auth, "TENANT_ID", None)
+    validator = auth.TokenValidator()
+    public_jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    validator._keys = {KEY_ID: jwt.PyJWK({**public_jwk, "kid": KEY_ID, "alg": "RS256"})}
+    validator._keys_fetched_at = time.time()
+    return validator
+
+
+def make_token(kid: str = KEY_ID, **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "aud": AUDIENCE,
+        "iss": f"https://login.microsoftonline.com/{TENANT}/v2.0",
+        "tid": TENANT,
+        "oid": "user-oid",
+        "preferred_username": "staff@unc.edu",
+        "name": "Staff Member",
+        "iat": now,
+        "exp": now + 3600,
+    }
+    claims.update(overrides)
+    claims = {name: value for name, value in claims.items() if value is not None}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+async def assert_rejected(validator, token: str) -> None:
+    with pytest.raises(HTTPException) as error:
+        await validator.validate(token)
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_valid_token_gives_its_principal(validator):
+    principal = await validator.validate(make_token())
+    assert principal.id == "user-oid"
+    assert principal.email == "staff@unc.edu"
+    assert principal.name == "Staff Member"
+    assert principal.tenant_id == TENANT
+
+
+@pytest.mark.asyncio
+async def test_v1_issuer_is_accepted(validator):
+    principal = await validator.validate(make_token(iss=f"https://sts.windows.net/{TENANT}/", upn="v1@unc.edu",
+                                                    preferred_username=None))
+    assert principal.email == "v1@unc.edu"
+
+
+@pytest.mark.asyncio
+async def test_principal_is_cached_per_token(validator):
+    token = make_token()
+    first = await validator.validate(token)
+    validator._keys = {}
+    assert await validator.validate(token) is first
+
+
+@pytest.mark.asyncio
+async def test_wrong_audience_is_rejected(validator):
+    await assert_rejected(validator, make_token(aud="api://someone-else"))
+
+
+@pytest.mark.asyncio
+async def test_issuer_of_another_tenant_is_rejected(validator):
+    await assert_rejected(validator, make_token(iss="https://login.microsoftonline.com/other-tenant/v2.0"))
+
+
+@pytest.mark.asyncio
+async def test_expired_token_is_rejected(validator):
+    past = int(time.time()) - auth.CLOCK_SKEW_SECONDS - 60
+    await assert_rejected(validator, make_token(exp=past, iat=past - 3600))
+
+
+@pytest.mark.asyncio
+async def test_token_within_clock_skew_is_accepted(validator):
+    assert await validator.validate(make_token(exp=int(time.time()) - 30))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("claim", ["exp", "iss", "tid"])
+async def test_missing_required_claim_is_rejected(validator, claim):
+    await assert_rejected(validator, make_token(**{claim: None}))
+
+
+@pytest.mark.asyncio
+async def test_tenant_restriction(validator, monkeypatch):
+    monkeypatch.setattr(auth, "TENANT_ID", "22222222-2222-2222-2222-222222222222")
+    await assert_rejected(validator, make_token())
+
+
+@pytest.mark.asyncio
+async def test_bad_signature_is_rejected(validator):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode({"aud": AUDIENCE, "tid": TENANT, "exp": int(time.time()) + 60}, other_key,
+                       algorithm="RS256", headers={"kid": KEY_ID})
+    await assert_rejected(validator, token)
+
+
+@pytest.mark.asyncio
+async def test_no_configured_audience_rejects_api_tokens(validator, monkeypatch):
+    monkeypatch.setattr(auth, "API_AUDIENCES", [])
+    await assert_rejected(validator, make_token())
+
+
+@pytest.mark.asyncio
+async def test_expired_graph_token_is_rejected_without_calling_graph(validator, monkeypatch):
+    async def no_graph(*args, **kwargs):
+        raise AssertionError("Graph must not be called")
+    monkeypatch.setattr(auth.httpx.AsyncClient, "get", no_graph)
+    past = int(time.time()) - auth.CLOCK_SKEW_SECONDS - 60
+    await assert_rejected(validator, make_token(aud=auth.GRAPH_AUDIENCES[0], exp=past))
+
+
+@pytest.mark.asyncio
+async def test_garbage_token_is_rejected(validator):
+    await assert_rejected(validator, "not-a-jwt")
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from bulk_actions import BulkItem, _load_approvals
+from models import ApprovalQueue
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    """Answers the approval lookup with the given rows and keeps the statement"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(stmt)
+        return FakeResult(self.rows)
+
+
+def approval(**values) -> ApprovalQueue:
+    return ApprovalQueue(id=uuid.uuid4(), approved=False, rejected=False, **values)
+
+
+@pytest.mark.asyncio
+async def test_load_approvals_locks_rows_in_id_order():
+    rows = [approval(), approval()]
+    session = FakeSession(rows)
+    items = [BulkItem(str(row.id)) for row in rows]
+
+    await _load_approvals(session, items)
+
+    sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+    assert "ORDER BY approval_queue.id" in sql
+    assert sql.rstrip().endswith("FOR UPDATE")
+    assert [item.approval for item in items] == rows
+    assert all(item.ok for item in items)
+
+
+@pytest.mark.asyncio
+async def test_load_approvals_fails_resolved_missing_and_invalid_items():
+    pending, approved, rejected = approval(), approval(), approval()
+    approved.approved = True
+    rejected.rejected = True
+    session = FakeSession([pending, approved, rejected])
+    items = [BulkItem(str(row.id)) for row in (pending, approved, rejected)]
+    items += [BulkItem(str(uuid.uuid4())), BulkItem("not-a-uuid"), BulkItem(str(pending.id))]
+
+    await _load_approvals(session, items)
+
+    assert [item.status_code for item in items] == [200, 409, 409, 404, 400, 400]
+    assert items[-1].message == "Duplicate approval id"
+
+
+@pytest.mark.asyncio
+async def test_load_approvals_skips_the_query_without_valid_ids():
+    session = FakeSession([])
+    items = [BulkItem("not-a-uuid")]
+
+    await _load_approvals(session, items)
+
+    assert session.statements == []
+    assert items[0].status_code == 400
@@ -0,0 +1,33 @@
+import pytest
+from starlette.requests import Request
+
+from etags import etag_matches
+
+ETAG = 'W/"approval_queue-42"'
+
+
+def request_with(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("header", [
+    'W/"approval_queue-42"',
+    '"approval_queue-42"',
+    '"email_history-7", W/"approval_queue-42"',
+    ' W/"approval_queue-42" ',
+    "*",
+])
+def test_matching_if_none_match(header):
+    assert etag_matches(request_with(header), ETAG)
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    'W/"approval_queue-41"',
+    'W/"approval_queue-420"',
+    'W/"email_history-42"',
+])
+def test_non_matching_if_none_match(header):
+    assert not etag_matches(request_with(header), ETAG)
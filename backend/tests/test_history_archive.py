@@ -0,0 +1,34 @@
+from datetime import date, datetime
+
+import pytest
+
+from history_archive import add_months, month_start, partition_month, partition_name
+
+
+@pytest.mark.parametrize("month, months, expected", [
+    (date(2026, 1, 1), 0, date(2026, 1, 1)),
+    (date(2026, 1, 1), 1, date(2026, 2, 1)),
+    (date(2026, 11, 1), 2, date(2027, 1, 1)),
+    (date(2026, 12, 1), 1, date(2027, 1, 1)),
+    (date(2026, 1, 1), -1, date(2025, 12, 1)),
+    (date(2026, 3, 1), -24, date(2024, 3, 1)),
+    (date(2026, 5, 1), 27, date(2028, 8, 1)),
+])
+def test_add_months(month, months, expected):
+    assert add_months(month, months) == expected
+
+
+def test_add_months_always_returns_the_first_of_the_month():
+    assert add_months(date(2026, 1, 31), 1) == date(2026, 2, 1)
+
+
+def test_month_start():
+    assert month_start(datetime(2026, 2, 28, 23, 59)) == date(2026, 2, 1)
+
+
+def test_partition_names_round_trip():
+    month = date(2026, 7, 1)
+    assert partition_name(month) == "email_history_2026_07"
+    assert partition_month(partition_name(month)) == month
+    assert partition_month("email_history_default") is None
+    assert partition_month("email_history_2026_7") is None
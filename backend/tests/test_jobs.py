@@ -0,0 +1,112 @@
+import asyncio
+import uuid
+
+import pytest
+
+from jobs import FINISHED_STATUSES, TriageJobRunner
+
+
+class MemoryJobRunner(TriageJobRunner):
+    """Keeps jobs and events in memory instead of triage_jobs/triage_job_events"""
+
+    def __init__(self, execute, fail_emits=False):
+        super().__init__(agent=None, classifier=None)
+        self.execute = execute
+        self.fail_emits = fail_emits
+        self.jobs = {}
+        self.events = []
+
+    def _create_job(self):
+        job_id = uuid.uuid4()
+        self.jobs[job_id] = {'status': 'queued', 'error': None}
+        return {'id': str(job_id), 'status': 'queued'}
+
+    def _store_event(self, job_id, data):
+        if self.fail_emits:
+            raise RuntimeError("database is down")
+        self.events.append((job_id, data))
+        if data.get('status') in ('done', 'error'):
+            self.jobs[job_id]['status'] = data['status']
+        return len(self.events)
+
+    def _fail_unfinished_job(self, job_id, error):
+        if self.jobs[job_id]['status'] not in FINISHED_STATUSES:
+            self.jobs[job_id] = {'status': 'error', 'error': error}
+
+    async def _execute(self, job_id, access_token):
+        await self.execute(self, job_id)
+
+
+async def run_jobs(runner, count=1):
+    jobs = [uuid.UUID((await runner.enqueue("token"))['id']) for _ in range(count)]
+    runner._tasks = [asyncio.create_task(runner._work())]
+    try:
+        await asyncio.wait_for(wait_finished(runner, jobs), timeout=2)
+    finally:
+        assert not runner._tasks[0].done(), "the worker must survive failing jobs"
+        await runner.stop()
+    return jobs
+
+
+async def wait_finished(runner, jobs):
+    while any(runner.jobs[job_id]['status'] not in FINISHED_STATUSES for job_id in jobs):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_marked_error_even_if_the_error_event_cannot_be_stored():
+    async def execute(runner, job_id):
+        raise ValueError("Graph said no")
+
+    runner = MemoryJobRunner(execute, fail_emits=True)
+    first, second = await run_jobs(runner, count=2)
+
+    assert runner.jobs[first] == {'status': 'error', 'error': "Graph said no"}
+    assert runner.jobs[second]['status'] == 'error'
+    assert runner._updates == {}
+
+
+@pytest.mark.asyncio
+async def test_job_ending_without_a_result_is_marked_error():
+    async def execute(runner, job_id):
+        await runner._emit(job_id, {'status': 'processing', 'progress': 50})
+
+    runner = MemoryJobRunner(execute)
+    [job_id] = await run_jobs(runner)
+
+    assert runner.jobs[job_id]['status'] == 'error'
+
+
+@pytest.mark.asyncio
+async def test_finished_job_is_left_alone():
+    async def execute(runner, job_id):
+        await runner._emit(job_id, {'status': 'done', 'progress': 100, 'results': {}})
+
+    runner = MemoryJobRunner(execute)
+    [job_id] = await run_jobs(runner)
+
+    assert runner.jobs[job_id] == {'status': 'done', 'error': None}
+
+
+@pytest.mark.asyncio
+async def test_stream_polls_instead_of_spinning_once_the_worker_let_go():
+    runner = MemoryJobRunner(execute=None)
+    job_id = uuid.uuid4()
+    runner._updates[job_id] = asyncio.Condition()
+    loads = []
+
+    def load_events(job_id, last_event_id):
+        loads.append(last_event_id)
+        # The worker is done with the job, but its end was never stored
+        runner._updates.pop(job_id, None)
+        return [], False
+
+    runner._load_events = load_events
+
+    async def consume():
+        async for _ in runner.stream_events(job_id):
+            pass
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(consume(), timeout=0.3)
+    assert len(loads) == 1
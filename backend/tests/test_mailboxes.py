@@ -0,0 +1,42 @@
+from mailboxes import FairScheduler
+from models import Email
+
+
+def make_email(email_id: str, mailbox=None) -> Email:
+    return Email(id=email_id, conversation_id=None, conversation_index=None, subject="Subject", body="Body",
+                 sender="Sender", sender_email="sender@example.edu", received_at="2026-01-01T00:00:00Z",
+                 is_read=False, mailbox=mailbox)
+
+
+def ids(emails):
+    return [email.id for email in emails]
+
+
+def test_single_mailbox_keeps_order():
+    emails = [make_email(f"m{n}") for n in range(4)]
+    assert ids(FairScheduler(weights={}).schedule(emails)) == ["m0", "m1", "m2", "m3"]
+
+
+def test_equal_weights_interleave_mailboxes():
+    emails = [make_email(f"a{n}", "a@unc.edu") for n in range(3)] + [make_email("b0", "b@unc.edu")]
+    assert ids(FairScheduler(weights={}).schedule(emails)) == ["a0", "b0", "a1", "a2"]
+
+
+def test_weights_give_a_mailbox_more_turns():
+    emails = [make_email(f"a{n}", "a@unc.edu") for n in range(4)] + [make_email(f"b{n}", "b@unc.edu") for n in range(2)]
+    scheduled = ids(FairScheduler(weights={"a@unc.edu": 2}).schedule(emails))
+    assert scheduled == ["a0", "a1", "b0", "a2", "a3", "b1"]
+
+
+def test_own_mailbox_uses_the_default_weight():
+    scheduler = FairScheduler(weights={"a@unc.edu": 3})
+    assert scheduler.weight(None) == 1.0
+    assert scheduler.weight("a@unc.edu") == 3
+
+
+def test_every_email_is_scheduled_once():
+    emails = [make_email(f"{mailbox}{n}", mailbox) for mailbox in ("x", "y", "z") for n in range(5)]
+    scheduled = FairScheduler(weights={"x": 0.5, "z": 2.5}).schedule(emails)
+    assert sorted(ids(scheduled)) == sorted(ids(emails))
+    # Each mailbox keeps its own order
+    assert [email.id for email in scheduled if email.mailbox == "y"] == [f"y{n}" for n in range(5)]
@@ -0,0 +1,42 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+
+def test_timestamp_cursor_round_trips():
+    row_id = uuid.uuid4()
+    value = datetime(2026, 3, 14, 15, 9, 26, 535897)
+    assert decode_cursor(encode_cursor(value, row_id)) == (value, row_id)
+
+
+def test_score_cursor_round_trips():
+    row_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(0.875, row_id)) == (0.875, row_id)
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor(datetime(2026, 1, 1), uuid.uuid4())
+    assert "=" not in cursor
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    _raw_cursor(["2026-01-01T00:00:00"]),
+    _raw_cursor(["2026-01-01T00:00:00", "not-a-uuid"]),
+    _raw_cursor(["yesterday", str(uuid.uuid4())]),
+    _raw_cursor([None, str(uuid.uuid4())]),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
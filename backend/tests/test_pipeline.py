@@ -0,0 +1,162 @@
+import asyncio
+import random
+
+import pytest
+
+from pipeline import FEED_STAGE, Pipeline, Stage
+
+# Every run must finish well within this; a hang fails the test instead of blocking the suite
+TIMEOUT = 5
+
+
+def items(count):
+    return [{'n': n} for n in range(count)]
+
+
+async def collect(pipeline, source):
+    async def run():
+        return [outcome async for outcome in pipeline.run(source)]
+
+    return await asyncio.wait_for(run(), timeout=TIMEOUT)
+
+
+def assert_one_outcome_per_item(outcomes, source):
+    seen = [id(outcome.item) for outcome in outcomes if outcome.stage != FEED_STAGE]
+    assert sorted(seen) == sorted(id(item) for item in source)
+
+
+async def jitter(item):
+    await asyncio.sleep(random.random() / 1000)
+    return item
+
+
+@pytest.mark.asyncio
+async def test_all_items_complete_through_every_stage():
+    source = items(50)
+    pipeline = Pipeline([Stage("parse", jitter, workers=3, queue_size=2),
+                         Stage("classify", jitter, workers=2, queue_size=1),
+                         Stage("store", jitter)])
+
+    outcomes = await collect(pipeline, source)
+
+    assert_one_outcome_per_item(outcomes, source)
+    assert all(outcome.completed and outcome.stage == "store" for outcome in outcomes)
+    assert {name: metrics['processed'] for name, metrics in pipeline.get_metrics().items()} == {
+        "parse": 50, "classify": 50, "store": 50}
+
+
+@pytest.mark.asyncio
+async def test_dropped_and_failed_items_leave_at_their_stage():
+    async def classify(item):
+        if item['n'] % 3 == 0:
+            raise RuntimeError(f"cannot classify {item['n']}")
+        return None if item['n'] % 3 == 1 else item
+
+    source = items(30)
+    pipeline = Pipeline([Stage("classify", classify, workers=4), Stage("store", jitter)])
+
+    outcomes = await collect(pipeline, source)
+
+    assert_one_outcome_per_item(outcomes, source)
+    by_n = {outcome.item['n']: outcome for outcome in outcomes}
+    assert by_n[3].stage == "classify" and not by_n[3].completed and by_n[3].error == "cannot classify 3"
+    assert by_n[4].stage == "classify" and not by_n[4].completed and by_n[4].error is None
+    assert by_n[5].stage == "store" and by_n[5].completed
+    metrics = pipeline.get_metrics()["classify"]
+    assert (metrics['processed'], metrics['dropped'], metrics['failed']) == (10, 10, 10)
+
+
+@pytest.mark.asyncio
+async def test_feed_error_finishes_the_items_already_fed():
+    source = items(5)
+
+    def broken_source():
+        yield from source
+        raise OSError("mailbox went away")
+
+    pipeline = Pipeline([Stage("classify", jitter, workers=2), Stage("store", jitter)])
+
+    outcomes = await collect(pipeline, broken_source())
+
+    assert_one_outcome_per_item(outcomes, source)
+    [feed_error] = [outcome for outcome in outcomes if outcome.stage == FEED_STAGE]
+    assert feed_error.item is None and not feed_error.completed
+    assert feed_error.error == "mailbox went away"
+
+
+@pytest.mark.asyncio
+async def test_batch_stage_passes_returned_items_and_drops_the_rest():
+    batches = []
+
+    async def store(batch):
+        batches.append(len(batch))
+        return [item for item in batch if item['n'] % 2 == 0]
+
+    source = items(20)
+    pipeline = Pipeline([Stage("classify", jitter, workers=4), Stage("store", store, batch_size=4)])
+
+    outcomes = await collect(pipeline, source)
+
+    assert_one_outcome_per_item(outcomes, source)
+    assert all(1 <= size <= 4 for size in batches) and sum(batches) == 20
+    assert sorted(outcome.item['n'] for outcome in outcomes if outcome.completed) == list(range(0, 20, 2))
+    assert all(outcome.stage == "store" for outcome in outcomes)
+
+
+@pytest.mark.asyncio
+async def test_failing_batch_fails_each_of_its_items():
+    async def store(batch):
+        raise RuntimeError("database is down")
+
+    source = items(10)
+    pipeline = Pipeline([Stage("store", store, batch_size=3, queue_size=10)])
+
+    outcomes = await collect(pipeline, source)
+
+    assert_one_outcome_per_item(outcomes, source)
+    assert all(outcome.error == "database is down" and not outcome.completed for outcome in outcomes)
+    assert pipeline.get_metrics()["store"]['failed'] == 10
+
+
+@pytest.mark.asyncio
+async def test_stopping_early_cancels_every_stage():
+    release = asyncio.Event()
+
+    async def slow(item):
+        if item['n'] > 0:
+            await release.wait()
+        return item
+
+    before = asyncio.all_tasks()
+    pipeline = Pipeline([Stage("classify", slow, workers=2, queue_size=1), Stage("store", jitter)])
+    run = pipeline.run(items(100))
+
+    first = await asyncio.wait_for(run.__anext__(), timeout=TIMEOUT)
+    await asyncio.wait_for(run.aclose(), timeout=TIMEOUT)
+
+    assert first.item['n'] == 0 and first.completed
+    assert asyncio.all_tasks() == before
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_consumer_cancels_every_stage():
+    started = asyncio.Event()
+
+    async def stuck(item):
+        started.set()
+        await asyncio.Event().wait()
+
+    before = asyncio.all_tasks()
+    pipeline = Pipeline([Stage("classify", stuck, workers=2), Stage("store", jitter)])
+
+    async def consume():
+        async for _ in pipeline.run(items(10)):
+            pass
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.wait_for(started.wait(), timeout=TIMEOUT)
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(consumer, timeout=TIMEOUT)
+
+    assert asyncio.all_tasks() == before
@@ -0,0 +1,73 @@
+from models import Email
+from priority_scorer import HOLD, NEGATIVE, TIME_SENSITIVE, URGENT, PriorityScorer
+
+scorer = PriorityScorer()
+
+
+def make_email(email_id: str, subject: str) -> Email:
+    return Email(id=email_id, conversation_id=None, conversation_index=None, subject=subject, body="",
+                 sender="Student", sender_email="student@example.edu", received_at="2026-01-01T00:00:00Z",
+                 is_read=False)
+
+
+def test_plain_email_is_standard_priority():
+    result = scorer.score({'subject': 'Question', 'body': 'When is the office open?'})
+    assert result['priority_level'] == 1
+    assert result['factors'] == []
+    assert result['reasoning'] == "Standard priority - no urgent indicators"
+
+
+def test_match_keywords_is_case_insensitive_and_accepts_plurals():
+    found = scorer.match_keywords("URGENT: two Deadlines missed")
+    assert found[URGENT] == ['urgent', 'deadline']
+
+
+def test_phrase_carries_the_categories_of_keywords_inside_it():
+    found = scorer.match_keywords("I have a financial hold on my account")
+    assert 'financial hold' in found[URGENT]
+    assert found[HOLD] == ['financial hold']
+
+
+def test_keywords_need_word_boundaries():
+    found = scorer.match_keywords("The holder of the latest form")
+    assert found[HOLD] == []
+    assert found[URGENT] == []
+
+
+def test_repeated_keywords_count_once():
+    found = scorer.match_keywords("urgent urgent URGENT")
+    assert found[URGENT] == ['urgent']
+
+
+def test_phrases_match_across_whitespace():
+    found = scorer.match_keywords("please reply as soon  as\npossible, I am upset")
+    assert found[TIME_SENSITIVE] == ['as soon as possible']
+    assert found[NEGATIVE] == ['upset']
+
+
+def test_factors_add_up_and_are_capped():
+    result = scorer.score({
+        'subject': 'URGENT financial hold',
+        'body': 'I am frustrated, registration is blocked and it is due today',
+        'sender_type': 'Parent of student',
+        'sender_email': 'mom@example.com',
+    })
+    assert result['urgency_score'] == 1.0
+    assert result['priority_level'] == 10
+    assert len(result['factors']) == 6
+
+
+def test_sender_type_and_parent_address():
+    assert scorer.score({'subject': '', 'body': '', 'sender_type': 'Registrar'})['priority_level'] == 3
+    assert scorer.score({'subject': '', 'body': '', 'sender_email': 'dad123@example.com'})['priority_level'] == 2
+
+
+def test_missing_fields_are_treated_as_empty():
+    assert scorer.score({'subject': None, 'body': None, 'sender_email': None})['priority_level'] == 1
+
+
+def test_score_batch_keys_by_email_id():
+    scores = scorer.score_batch([make_email("urgent", "Urgent: account past due"), make_email("plain", "Hello")])
+    assert scores["plain"] == 1
+    assert scores["urgent"] > scores["plain"]
+    assert scorer.is_urgent(7) and not scorer.is_urgent(6)
@@ -0,0 +1,47 @@
+from replay import PIIScrubber
+
+
+def test_addresses_map_to_stable_placeholders():
+    scrubber = PIIScrubber()
+    text = scrubber.scrub_text("From Jane.Doe@unc.edu to bursar@unc.edu, cc jane.doe@UNC.edu")
+    assert text == "From person1@example.edu to person2@example.edu, cc person1@example.edu"
+
+
+def test_numbers_are_masked():
+    scrubber = PIIScrubber()
+    assert scrubber.scrub_text("Call (919) 555-0123") == "Call [PHONE]"
+    assert scrubber.scrub_text("My PID is 730123456") == "My PID is [PID]"
+    assert scrubber.scrub_text("Card 4111 1111 1111 1111 was charged") == "Card [NUMBER] was charged"
+
+
+def test_registered_names_are_replaced_longest_first():
+    scrubber = PIIScrubber()
+    scrubber.add_name("Jane")
+    scrubber.add_name("Jane Doe")
+    assert scrubber.scrub_text("Hi Jane Doe, this is Jane") == "Hi Person 2, this is Person 1"
+
+
+def test_placeholder_names_are_not_registered():
+    scrubber = PIIScrubber()
+    for name in (None, "", "Unknown", "someone@unc.edu"):
+        scrubber.add_name(name)
+    assert scrubber.names == {}
+
+
+def test_scrub_leaves_id_and_timestamp_fields_alone():
+    scrubber = PIIScrubber()
+    message = {
+        "id": "AAMk123456789",
+        "conversationId": "conv-919-555-0123",
+        "receivedDateTime": "2026-01-01T00:00:00Z",
+        "from": {"emailAddress": {"address": "jane@unc.edu", "name": "Jane"}},
+        "toRecipients": [{"emailAddress": {"address": "bursar@unc.edu"}}],
+        "isRead": False,
+    }
+    scrubbed = scrubber.scrub(message)
+    assert scrubbed["id"] == message["id"]
+    assert scrubbed["conversationId"] == message["conversationId"]
+    assert scrubbed["receivedDateTime"] == message["receivedDateTime"]
+    assert scrubbed["from"]["emailAddress"]["address"] == "person1@example.edu"
+    assert scrubbed["toRecipients"][0]["emailAddress"]["address"] == "person2@example.edu"
+    assert scrubbed["isRead"] is False
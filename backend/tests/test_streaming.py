@@ -0,0 +1,27 @@
+import pytest
+from starlette.requests import Request
+
+from streaming import negotiate_encoding
+
+
+def request_with(accept_encoding=None) -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("BR", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0, gzip", "gzip"),
+    ("br;q=oops, gzip", "gzip"),
+    ("deflate;q=0.5, gzip;q=0.1", "gzip"),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(request_with(header)) == expected
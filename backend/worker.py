@@ -0,0 +1,247 @@
+"""
+Distributed triage workers
+Ingestion (in the API, where the user's Graph token is available) stores one
+work item per unread email together with its conversation thread. Any number of
+worker processes, on any node, lease items with FOR UPDATE SKIP LOCKED and run
+the classify -> generate -> persist stages of EmailEngine on them.
+
+Run a standalone worker with:  python worker.py
+"""
+import asyncio
+import json
+import math
+import os
+import socket
+import uuid
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from models import Email, SessionLocal
+from email_client import EmailClient
+from email_engine import EmailEngine, MAX_TRIAGE_ATTEMPTS, FETCH_WORKERS, STAGE_QUEUE_SIZE, priority_scorer
+from pipeline import Pipeline, Stage
+from repository import (
+    complete_work_items, defer_work_items, enqueue_work_items, exhausted_email_ids, fail_work_item,
+    heartbeat_work_items, known_email_ids, lease_work_items, work_item_mailboxes
+)
+
+load_dotenv()
+
+WORK_BATCH_SIZE = int(os.getenv('TRIAGE_WORK_BATCH_SIZE', 10))
+LEASE_SECONDS = int(os.getenv('TRIAGE_LEASE_SECONDS', 120))
+POLL_INTERVAL_SECONDS = float(os.getenv('TRIAGE_WORKER_POLL_SECONDS', 2))
+# Emails another triage run holds are retried after this long; that run may still fail
+CLAIMED_RETRY_SECONDS = int(os.getenv('TRIAGE_CLAIMED_RETRY_SECONDS', 60))
+
+
+async def ingest_emails(emails: List[Email], email_client: EmailClient) -> Dict[str, int]:
+    """
+    Enqueue unread emails as work items, with their threads fetched up front
+
+    Args:
+        emails: Unread emails from Graph
+        email_client: Client holding the user's Graph token (used for thread fetches)
+    Returns:
+        Counts of emails enqueued and skipped
+    """
+    known = await asyncio.to_thread(_skippable_email_ids, [email.id for email in emails])
+    new_emails = [email for email in emails if email.id not in known]
+    # Workers lease the most urgent items first
+    priorities = priority_scorer.score_batch(new_emails)
+
+    async def fetch_thread(email: Email) -> Dict[str, Any]:
+        thread = []
+        if email.conversation_id:
+            try:
+                thread = await email_client.for_mailbox(email.mailbox).get_conversation_messages(email.conversation_id)
+            except Exception as e:
+                print(f"⚠️ Thread fetch failed for {email.id}: {e}")
+        return {"email_id": email.id, "mailbox": email.mailbox, "priority": priorities[email.id],
+                "payload": json.dumps({"email": asdict(email), "thread_messages": thread})}
+
+    async def enqueue(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        await asyncio.to_thread(_enqueue, items)
+        return items
+
+    pipeline = Pipeline([
+        Stage("fetch_thread", fetch_thread, workers=FETCH_WORKERS, queue_size=STAGE_QUEUE_SIZE),
+        Stage("enqueue", enqueue, workers=1, queue_size=STAGE_QUEUE_SIZE, batch_size=50),
+    ])
+    enqueued = 0
+    async for outcome in pipeline.run(new_emails):
+        if outcome.completed:
+            enqueued += 1
+    return {"enqueued": enqueued, "skipped": len(emails) - len(new_emails)}
+
+
+def _skippable_email_ids(email_ids: List[str]) -> set:
+    """Emails already pending or processed, or out of retry attempts"""
+    with SessionLocal() as session:
+        return known_email_ids(session, email_ids) | exhausted_email_ids(session, email_ids, MAX_TRIAGE_ATTEMPTS)
+
+
+def _enqueue(items: List[Dict[str, Any]]) -> None:
+    with SessionLocal() as session:
+        enqueue_work_items(session, items)
+        session.commit()
+
+
+class TriageWorker:
+    """Leases work items and runs them through EmailEngine until stopped"""
+
+    def __init__(self, agent, classifier, worker_id: Optional[str] = None,
+                 batch_size: int = WORK_BATCH_SIZE, lease_seconds: int = LEASE_SECONDS,
+                 poll_interval: float = POLL_INTERVAL_SECONDS) -> None:
+        self.agent = agent
+        self.classifier = classifier
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.running = False
+        self._next_mailbox = 0
+        # Formatting helpers only; workers never call Graph
+        self.email_client = EmailClient(access_token="")
+
+    async def run(self) -> None:
+        """Lease and process batches until stop() is called"""
+        self.running = True
+        print(f"Triage worker {self.worker_id} started")
+        while self.running:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                print(f"Error in triage worker loop: {e}")
+                processed = 0
+            if processed == 0:
+                await asyncio.sleep(self.poll_interval)
+
+    def stop(self) -> None:
+        self.running = False
+
+    async def run_once(self) -> int:
+        """
+        Lease one batch of work items and process it
+
+        Returns:
+            Number of items leased
+        """
+        # Database calls are blocking, so they run in a thread off the event loop
+        leased = await asyncio.to_thread(self._lease)
+        if not leased:
+            return 0
+
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await self._process(leased)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        return len(leased)
+
+    def _lease(self) -> List[tuple]:
+        with SessionLocal() as session:
+            items = self._lease_fair(session)
+            session.commit()
+            return [(item.email_id, item.payload) for item in items]
+
+    def _lease_fair(self, session) -> list:
+        """
+        Lease a batch split evenly across mailboxes with waiting work
+
+        Each mailbox gets an equal quota, starting from a rotating mailbox so
+        remainders are shared too; unused quota is filled from any mailbox.
+        """
+        mailboxes = work_item_mailboxes(session)
+        if len(mailboxes) <= 1:
+            return lease_work_items(session, self.worker_id, self.batch_size, self.lease_seconds)
+
+        mailboxes.sort(key=lambda mailbox: mailbox or '')
+        start = self._next_mailbox % len(mailboxes)
+        self._next_mailbox += 1
+        quota = max(1, math.ceil(self.batch_size / len(mailboxes)))
+        items = []
+        for mailbox in mailboxes[start:] + mailboxes[:start]:
+            wanted = min(quota, self.batch_size - len(items))
+            if wanted <= 0:
+                break
+            items.extend(lease_work_items(session, self.worker_id, wanted, self.lease_seconds, mailbox=mailbox))
+        if len(items) < self.batch_size:
+            items.extend(lease_work_items(session, self.worker_id, self.batch_size - len(items), self.lease_seconds))
+        return items
+
+    async def _process(self, leased: List[tuple]) -> None:
+        emails = []
+        threads = {}
+        for email_id, payload in leased:
+            data = json.loads(payload)
+            emails.append(Email(**data["email"]))
+            threads[email_id] = data.get("thread_messages", [])
+
+        engine = EmailEngine(emails=emails, email_client=self.email_client, agent=self.agent,
+                             classifier=self.classifier, thread_messages=threads)
+        done, failed, deferred, parked = [], {}, [], []
+        try:
+            await asyncio.to_thread(engine.prepare_emails)
+            # Only emails already in the queue or history are finished; another run's emails come back later
+            done.extend(email.id for email in emails if email.id in engine.known_ids)
+            deferred.extend(email.id for email in emails if email.id in engine.claimed_elsewhere)
+            # Out of attempts: parked as failed right away rather than leased again
+            parked.extend(engine.exhausted_ids)
+            async for outcome in engine.run_pipeline():
+                error = outcome.error or outcome.item.error
+                if error is not None:
+                    failed[outcome.item.email.id] = error
+                else:
+                    done.append(outcome.item.email.id)
+        except Exception as e:
+            handled = set(done) | set(failed) | set(deferred) | set(parked)
+            for email in emails:
+                if email.id not in handled:
+                    failed[email.id] = str(e)
+
+        await asyncio.to_thread(self._finish, done, failed, deferred, parked)
+        print(f"Worker {self.worker_id}: {len(done)} done, {len(failed) + len(parked)} failed, {len(deferred)} deferred")
+
+    def _finish(self, done: List[str], failed: Dict[str, str], deferred: List[str], parked: List[str]) -> None:
+        with SessionLocal() as session:
+            complete_work_items(session, self.worker_id, done)
+            for email_id, error in failed.items():
+                fail_work_item(session, self.worker_id, email_id, error, MAX_TRIAGE_ATTEMPTS)
+            for email_id in parked:
+                fail_work_item(session, self.worker_id, email_id, f"Triage failed {MAX_TRIAGE_ATTEMPTS} times", 0)
+            defer_work_items(session, self.worker_id, deferred, CLAIMED_RETRY_SECONDS)
+            session.commit()
+
+    def _extend_leases(self) -> None:
+        with SessionLocal() as session:
+            heartbeat_work_items(session, self.worker_id, self.lease_seconds)
+            session.commit()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.lease_seconds / 3, 1))
+            try:
+                await asyncio.to_thread(self._extend_leases)
+            except Exception as e:
+                print(f"⚠️ Heartbeat failed for {self.worker_id}: {e}")
+
+
+async def main():
+    """Main entry point for a standalone worker process"""
+    from azure.azure_ai_client import AzureAIClient
+    from classifier import EmailClassifier
+    from agent_handler import AzureAIFoundryAgent
+
+    azure_ai_client = AzureAIClient()
+    worker = TriageWorker(
+        agent=AzureAIFoundryAgent(project_client=azure_ai_client.project_client),
+        classifier=EmailClassifier(llm=azure_ai_client.get_llm())
+    )
+    await worker.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
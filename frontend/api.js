@@ -1,13 +1,28 @@
 /*
 This file contains the API calls for the frontend
 */
+import { msalInstance } from './lib/msalInstance';
+import { loginRequest } from './lib/authConfig';
 
+/* Authorization header for backend calls that do not need extra Graph scopes; the backend rejects calls without one */
+const authHeaders = async () => {
+    const account = msalInstance.getActiveAccount() || msalInstance.getAllAccounts()[0];
+    if (!account) {
+        throw new Error('No accounts found');
+    }
+    const tokenResponse = await msalInstance.acquireTokenSilent({
+        scopes: loginRequest.scopes,
+        account
+    });
+    return { 'Authorization': `Bearer ${tokenResponse.accessToken}` };
+};
 
 
 export const rejectResponse = async (approvalId) => {
     const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/reject-response`, {
         method: 'POST',
         headers: {
+            ...(await authHeaders()),
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
@@ -17,8 +32,8 @@ export const rejectResponse = async (approvalId) => {
     return response;
 };
 
-export const getApprovalQueue = async (instance, accounts, route = 'AI_AGENT') => {
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read'];
+export const getApprovalQueue = async (instance, accounts, route = 'AI_AGENT', cursor = null) => {
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared'];
     if (!accounts.length) {
         throw new Error('No accounts found');
     }
@@ -30,7 +45,13 @@ export const getApprovalQueue = async (instance, accounts, route = 'AI_AGENT') =
 
     const accessToken = tokenResponse.accessToken;
 
-    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/approval-queue?route=${encodeURIComponent(route)}`, {
+    /* Paginated: the response is { items, next_cursor }, pass next_cursor back to get the next page */
+    const params = new URLSearchParams({ route });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/approval-queue?${params}`, {
         method: 'GET',
         headers: {
             'Content-Type': 'application/json',
@@ -44,7 +65,7 @@ export const getApprovalQueue = async (instance, accounts, route = 'AI_AGENT') =
 export const fetchPendingEmails = async (instance, accounts, routeFilter = 'all') => {
 
     /* This is the endpoint to fetch the triage emails */
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read'];
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared'];
 
     const tokenResponse = await instance.acquireTokenSilent({
         scopes: graphScopes,
@@ -65,7 +86,7 @@ export const fetchPendingEmails = async (instance, accounts, routeFilter = 'all'
 };
 
 export const approveResponse = async (approvalId, staffEdits = '', instance, accounts) => {
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Send'];
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared', 'https://graph.microsoft.com/Mail.Send', 'https://graph.microsoft.com/Mail.Send.Shared'];
     if (!accounts.length) {
         throw new Error('No accounts found');
     }
@@ -101,7 +122,7 @@ export const approveResponse = async (approvalId, staffEdits = '', instance, acc
 };
 
 export const fetchTriageEmails = async (instance, accounts) => {
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read'];
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared'];
     if (!accounts.length) {
         throw new Error('No accounts found');
     }
@@ -124,14 +145,121 @@ export const fetchTriageEmails = async (instance, accounts) => {
     return response;
 };
 
-export const getEmailHistory = async () => {
-    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/email-history`, {
+export const getEmailHistory = async (cursor = null) => {
+    /* Paginated: the response is { items, next_cursor }, pass next_cursor back to get the next page */
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/email-history${query}`, {
+        method: 'GET',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        }
+    });
+
+    return response;
+};
+
+/* Pending emails per route, { AI_AGENT, HUMAN_REQUIRED, REDIRECT }, without loading the queue */
+export const getApprovalQueueCounts = async () => {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/approval-queue/counts`, {
         method: 'GET',
         headers: {
+            ...(await authHeaders()),
             'Content-Type': 'application/json'
         }
     });
+    return response;
+};
 
+/* Triage analytics from the daily rollups; since/until are YYYY-MM-DD, defaulting to the last 30 days */
+export const getAnalytics = async (since = null, until = null) => {
+    const params = new URLSearchParams();
+    if (since) {
+        params.set('since', since);
+    }
+    if (until) {
+        params.set('until', until);
+    }
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/analytics?${params}`, {
+        method: 'GET',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        }
+    });
+    return response;
+};
+
+/*
+ * Live approval queue changes. onEvent gets each delta ({ op, id, route, status, ...summary })
+ * and { op: 'resync' } whenever events may have been missed. Returns a function that unsubscribes.
+ * Read with fetch rather than EventSource, which cannot send the Authorization header.
+ */
+export const subscribeApprovalQueue = (onEvent, retryMs = 5000) => {
+    const controller = new AbortController();
+    const run = async () => {
+        let connectedBefore = false;
+        while (!controller.signal.aborted) {
+            try {
+                // A fresh token per connection, so reconnects keep working after the last one expired
+                const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/approval-queue/stream`, {
+                    headers: { ...(await authHeaders()), 'Accept': 'text/event-stream' },
+                    signal: controller.signal
+                });
+                if (response.ok) {
+                    // Changes made while the stream was down are unknown
+                    if (connectedBefore) onEvent({ op: 'resync' });
+                    connectedBefore = true;
+                    await readEventStream(response, (data) => onEvent(data));
+                }
+            } catch (e) {
+                if (controller.signal.aborted) return;
+                console.error('Approval queue stream interrupted:', e);
+            }
+            await new Promise((resolve) => setTimeout(resolve, retryMs));
+        }
+    };
+    run();
+    return () => controller.abort();
+};
+
+/* Full body and generated draft of one queued email; the queue list only carries a snippet */
+export const getApproval = async (approvalId) => {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/approval/${approvalId}`, {
+        method: 'GET',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        }
+    });
+    return response;
+};
+
+/* Full final response of one history entry; the history list only carries a snippet */
+export const getEmailHistoryItem = async (historyId) => {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/email-history/${historyId}`, {
+        method: 'GET',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        }
+    });
+    return response;
+};
+
+/* Full-text search over email history, best matches first; paginated like getEmailHistory */
+export const searchEmailHistory = async (query, cursor = null) => {
+    const params = new URLSearchParams({ q: query, source: 'history' });
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/search?${params}`, {
+        method: 'GET',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        }
+    });
     return response;
 };
 
@@ -139,6 +267,7 @@ export const deleteApproval = async (approvalId) => {
     const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/delete-approval/${approvalId}`, {
         method: 'DELETE',
         headers: {
+            ...(await authHeaders()),
             'Content-Type': 'application/json'
         }
     });
@@ -146,7 +275,7 @@ export const deleteApproval = async (approvalId) => {
 };
 
 export const redirectEmail = async (instance, accounts, approvalId, redirectDepartmentEmail, comment) => {
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Send'];
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared', 'https://graph.microsoft.com/Mail.Send', 'https://graph.microsoft.com/Mail.Send.Shared'];
     if (!accounts.length) {
         throw new Error('No accounts found');
     }
@@ -174,16 +303,13 @@ export const redirectEmail = async (instance, accounts, approvalId, redirectDepa
     return response;
 };
 
-
 /**
- * SSE streaming endpoint for triage with real-time progress
- * @param {object} instance - MSAL instance
- * @param {array} accounts - MSAL accounts
- * @param {function} onProgress - Callback for progress updates: (data) => void
- * @returns {Promise} Resolves when stream completes
+ * Approve many emails in one request
+ * @param {Array<{approval_id: string, staff_edits?: string}>} items
+ * @returns {Promise<Response>} body is { results: [{ approval_id, status, status_code, message }], succeeded, failed }
  */
-export const fetchTriageEmailsStream = async (instance, accounts, onProgress) => {
-    const graphScopes = ['https://graph.microsoft.com/Mail.Read'];
+export const bulkApproveResponses = async (instance, accounts, items) => {
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared', 'https://graph.microsoft.com/Mail.Send', 'https://graph.microsoft.com/Mail.Send.Shared'];
     if (!accounts.length) {
         throw new Error('No accounts found');
     }
@@ -192,38 +318,156 @@ export const fetchTriageEmailsStream = async (instance, accounts, onProgress) =>
         scopes: graphScopes,
         account: accounts[0]
     });
-    
-    const accessToken = tokenResponse.accessToken;
-    
-    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/fetch-triage-stream`, {
-        method: 'GET',
+
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/bulk-approve-response`, {
+        method: 'POST',
         headers: {
-            'Authorization': `Bearer ${accessToken}`,
-            'Accept': 'text/event-stream'
-        }
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${tokenResponse.accessToken}`
+        },
+        body: JSON.stringify({ items }),
+    });
+    return response;
+};
+
+/**
+ * Reject many emails in one request
+ * @returns {Promise<Response>} body is { results, succeeded, failed }
+ */
+export const bulkRejectResponses = async (approvalIds) => {
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/bulk-reject-response`, {
+        method: 'POST',
+        headers: {
+            ...(await authHeaders()),
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ approval_ids: approvalIds }),
     });
+    return response;
+};
 
-    if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
+/**
+ * Redirect many emails in one request
+ * @param {Array<{approval_id: string, redirect_department_email: string, comment?: string}>} items
+ * @returns {Promise<Response>} body is { results, succeeded, failed }
+ */
+export const bulkRedirectEmails = async (instance, accounts, items) => {
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared', 'https://graph.microsoft.com/Mail.Send', 'https://graph.microsoft.com/Mail.Send.Shared'];
+    if (!accounts.length) {
+        throw new Error('No accounts found');
     }
 
+    const tokenResponse = await instance.acquireTokenSilent({
+        scopes: graphScopes,
+        account: accounts[0]
+    });
+
+    const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/bulk-redirect-email`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${tokenResponse.accessToken}`
+        },
+        body: JSON.stringify({ items }),
+    });
+    return response;
+};
+
+/**
+ * Read an SSE response, calling onEvent(data, id) for every data frame
+ * @returns {Promise<number|null>} id of the last event received
+ */
+const readEventStream = async (response, onEvent, lastEventId = null) => {
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
+    let buffer = '';
+    let eventId = lastEventId;
 
     while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const text = decoder.decode(value);
-        const lines = text.split('\n').filter(line => line.startsWith('data: '));
-
-        for (const line of lines) {
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+
+        for (const frame of frames) {
+            let data = null;
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('id: ')) {
+                    eventId = parseInt(line.replace('id: ', ''), 10);
+                } else if (line.startsWith('data: ')) {
+                    data = line.replace('data: ', '');
+                }
+            }
+            if (data === null) continue;
             try {
-                const data = JSON.parse(line.replace('data: ', ''));
-                onProgress(data);
+                onEvent(JSON.parse(data), eventId);
             } catch (e) {
                 console.error('Failed to parse SSE data:', e);
             }
         }
     }
-};
\ No newline at end of file
+    return eventId;
+};
+
+const TERMINAL_TRIAGE_STATUSES = ['done', 'empty', 'error'];
+
+/**
+ * SSE streaming endpoint for triage with real-time progress
+ * The run is a background job on the server; if the connection drops the
+ * stream is resumed from the last event id instead of starting over.
+ * @param {object} instance - MSAL instance
+ * @param {array} accounts - MSAL accounts
+ * @param {function} onProgress - Callback for progress updates: (data) => void
+ * @returns {Promise} Resolves when stream completes
+ */
+export const fetchTriageEmailsStream = async (instance, accounts, onProgress, maxReconnects = 3) => {
+    const graphScopes = ['https://graph.microsoft.com/Mail.Read', 'https://graph.microsoft.com/Mail.Read.Shared'];
+    if (!accounts.length) {
+        throw new Error('No accounts found');
+    }
+
+    const tokenResponse = await instance.acquireTokenSilent({
+        scopes: graphScopes,
+        account: accounts[0]
+    });
+    
+    const accessToken = tokenResponse.accessToken;
+    
+    let jobId = null;
+    let finished = false;
+    const handleEvent = (data) => {
+        if (data.job_id) jobId = data.job_id;
+        if (TERMINAL_TRIAGE_STATUSES.includes(data.status)) finished = true;
+        onProgress(data);
+    };
+
+    let lastEventId = null;
+    let response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/fetch-triage-stream`, {
+        method: 'GET',
+        headers: {
+            'Authorization': `Bearer ${accessToken}`,
+            'Accept': 'text/event-stream'
+        }
+    });
+
+    for (let attempt = 0; ; attempt++) {
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        try {
+            lastEventId = await readEventStream(response, handleEvent, lastEventId);
+        } catch (e) {
+            console.error('Triage stream interrupted:', e);
+        }
+        if (finished || !jobId || attempt >= maxReconnects) break;
+
+        const headers = { 'Accept': 'text/event-stream', 'Authorization': `Bearer ${accessToken}` };
+        if (lastEventId !== null) headers['Last-Event-ID'] = String(lastEventId);
+        response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE_URL}/triage-jobs/${jobId}/events`, {
+            method: 'GET',
+            headers
+        });
+    }
+};
@@ -4,7 +4,7 @@
  * Supports light/dark mode
  */
 import { useState, useEffect } from 'react';
-import { getEmailHistory } from '../api';
+import { getEmailHistory, getEmailHistoryItem, searchEmailHistory } from '../api';
 import { useTheme } from '../lib/ThemeContext';
 
 // Spinner component
@@ -48,7 +48,9 @@ function Badge({ children, variant = 'default', isDark = true }) {
 
 export default function EmailHistory() {
   const [history, setHistory] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
   const [selectedEmail, setSelectedEmail] = useState(null);
   const [filterStatus, setFilterStatus] = useState('all');
@@ -58,17 +60,28 @@ export default function EmailHistory() {
 
   useEffect(() => {
     setMounted(true);
-    loadHistory();
   }, []);
 
+  // Searches run on the server over all history; wait for typing to pause first
+  useEffect(() => {
+    const timer = setTimeout(loadHistory, searchQuery ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchQuery]);
+
+  const fetchHistoryPage = (cursor = null) => {
+    const query = searchQuery.trim();
+    return query ? searchEmailHistory(query, cursor) : getEmailHistory(cursor);
+  };
+
   const loadHistory = async () => {
     setLoading(true);
     setError(null);
     try {
-      const response = await getEmailHistory();
+      const response = await fetchHistoryPage();
       if (response.ok) {
         const data = await response.json();
-        setHistory(data);
+        setHistory(data.items);
+        setNextCursor(data.next_cursor);
       } else {
         const err = await response.json();
         setError(err.detail || 'Failed to load email history');
@@ -80,15 +93,39 @@ export default function EmailHistory() {
     }
   };
 
-  // Filter and search logic
-  const filteredHistory = history.filter((email) => {
-    const matchesStatus = filterStatus === 'all' || email.approval_status === filterStatus;
-    const matchesSearch =
-      searchQuery === '' ||
-      email.subject?.toLowerCase().includes(searchQuery.toLowerCase()) ||
-      email.sender_email?.toLowerCase().includes(searchQuery.toLowerCase());
-    return matchesStatus && matchesSearch;
-  });
+  const loadMoreHistory = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetchHistoryPage(nextCursor);
+      if (response.ok) {
+        const data = await response.json();
+        setHistory((current) => [...current, ...data.items]);
+        setNextCursor(data.next_cursor);
+      }
+    } catch (err) {
+      console.error('Error loading more history:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // The list only has a snippet, so fetch the full response when an entry is opened
+  const selectEmail = async (email) => {
+    setSelectedEmail(email);
+    try {
+      const response = await getEmailHistoryItem(email.id);
+      if (response.ok) {
+        const detail = await response.json();
+        setSelectedEmail((current) => current?.id === email.id ? { ...current, ...detail, detailLoaded: true } : current);
+      }
+    } catch (err) {
+      console.error('Error loading history entry:', err);
+    }
+  };
+
+  // Status filter; the search itself already ran on the server
+  const filteredHistory = history.filter((email) => filterStatus === 'all' || email.approval_status === filterStatus);
 
   // Stats calculations
   const stats = {
@@ -287,7 +324,7 @@ export default function EmailHistory() {
                 <p className={`text-xs font-semibold uppercase tracking-wider ${isDark ? 'text-slate-500' : 'text-slate-500'}`}>
                   Total Processed
                 </p>
-                <p className={`text-2xl font-bold ${isDark ? 'text-white' : 'text-slate-900'}`}>{stats.total}</p>
+                <p className={`text-2xl font-bold ${isDark ? 'text-white' : 'text-slate-900'}`}>{stats.total}{nextCursor ? '+' : ''}</p>
               </div>
             </div>
           </div>
@@ -367,7 +404,7 @@ export default function EmailHistory() {
                   </span>
                   <input
                     type="text"
-                    placeholder="Search by subject or sender..."
+                    placeholder="Search subject, sender or response..."
                     value={searchQuery}
                     onChange={(e) => setSearchQuery(e.target.value)}
                     className={`w-full pl-12 pr-4 py-3 text-sm rounded-xl ring-1 transition-all focus:ring-2 focus:ring-[#7BAFD4] focus:outline-none ${
@@ -419,7 +456,7 @@ export default function EmailHistory() {
                     {filteredHistory.map((email) => (
                       <button
                         key={email.id}
-                        onClick={() => setSelectedEmail(email)}
+                        onClick={() => selectEmail(email)}
                         className={`w-full text-left p-5 transition-all duration-200 ${
                           selectedEmail?.id === email.id
                             ? 'bg-[#7BAFD4]/10 border-l-2 border-[#7BAFD4]'
@@ -449,6 +486,21 @@ export default function EmailHistory() {
                     ))}
                   </div>
                 )}
+                {nextCursor && (
+                  <div className="p-4">
+                    <button
+                      onClick={loadMoreHistory}
+                      disabled={loadingMore}
+                      className={`w-full rounded-xl px-4 py-3 text-sm font-medium ring-1 transition-all duration-200 disabled:opacity-50 ${
+                        isDark
+                          ? 'bg-white/5 text-slate-300 ring-white/10 hover:bg-white/10'
+                          : 'bg-slate-50 text-slate-700 ring-slate-200 hover:bg-slate-100'
+                      }`}
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                  </div>
+                )}
               </div>
             </div>
           </div>
@@ -538,7 +590,7 @@ export default function EmailHistory() {
                       </span>
                       Final Response
                     </h3>
-                    {selectedEmail.final_response ? (
+                    {(selectedEmail.detailLoaded ? selectedEmail.final_response : selectedEmail.snippet) ? (
                       <div className={`rounded-xl p-5 ring-1 max-h-80 overflow-y-auto ${
                         isDark 
                           ? 'bg-[#050B16]/60 ring-white/10' 
@@ -547,7 +599,7 @@ export default function EmailHistory() {
                         <p className={`text-sm whitespace-pre-wrap leading-relaxed ${
                           isDark ? 'text-slate-200' : 'text-slate-700'
                         }`}>
-                          {selectedEmail.final_response}
+                          {selectedEmail.detailLoaded ? selectedEmail.final_response : `${selectedEmail.snippet}…`}
                         </p>
                       </div>
                     ) : (
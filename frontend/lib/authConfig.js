@@ -22,7 +22,9 @@ export const loginRequest = {
   scopes: [
     "https://graph.microsoft.com/User.Read",
     "https://graph.microsoft.com/Mail.Read",
+    "https://graph.microsoft.com/Mail.Read.Shared",
     "https://graph.microsoft.com/Mail.Send",
+    "https://graph.microsoft.com/Mail.Send.Shared",
     "https://graph.microsoft.com/Mail.ReadWrite"
   ]
 };
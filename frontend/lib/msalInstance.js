@@ -0,0 +1,8 @@
+/**
+ * Shared MSAL instance
+ * Used by the MsalProvider and by api.js to attach a token to every backend call
+ */
+import { PublicClientApplication } from "@azure/msal-browser";
+import { msalConfig } from "./authConfig";
+
+export const msalInstance = new PublicClientApplication(msalConfig);
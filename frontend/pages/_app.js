@@ -1,13 +1,9 @@
 import '../styles/globals.css';
 import Head from "next/head";
 import { MsalProvider } from "@azure/msal-react";
-import { PublicClientApplication } from "@azure/msal-browser";
-import { msalConfig } from "../lib/authConfig";
+import { msalInstance } from "../lib/msalInstance";
 import { ThemeProvider } from "../lib/ThemeContext";
 
-// Initialize MSAL instance
-const msalInstance = new PublicClientApplication(msalConfig);
-
 export default function App({ Component, pageProps }) {
   return (
     <ThemeProvider>
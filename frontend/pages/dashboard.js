@@ -1,8 +1,8 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import ApprovalPanel from '../components/ApprovalPanel';
 import ProtectedRoute from '../components/ProtectedRoute';
 import Header from '../components/Header';
-import {approveResponse, getApprovalQueue, rejectResponse, deleteApproval, fetchTriageEmailsStream, redirectEmail } from '../api';
+import {approveResponse, getApproval, getApprovalQueue, getApprovalQueueCounts, subscribeApprovalQueue, rejectResponse, deleteApproval, fetchTriageEmailsStream, redirectEmail } from '../api';
 import { useMsal } from '@azure/msal-react';
 import Head from 'next/head';
 import { useTheme } from '../lib/ThemeContext';
@@ -129,6 +129,9 @@ function Badge({ children, variant = 'default', isDark = true }) {
 
 function DashboardContent() {
   const [approvalQueue, setApprovalQueue] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [routeCounts, setRouteCounts] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedEmail, setSelectedEmail] = useState(null);
   const [filterRoute, setFilterRoute] = useState('AI_AGENT');
   const [fetchingTriage, setFetchingTriage] = useState(false);
@@ -148,28 +151,103 @@ function DashboardContent() {
     loadApprovalQueue();
   }, [filterRoute]);
 
+  // The stream handler outlives renders, so it reads the current route and loaders through refs
+  const filterRouteRef = useRef(filterRoute);
+  filterRouteRef.current = filterRoute;
+  const loadersRef = useRef({});
+
+  useEffect(() => {
+    let countsTimer = null;
+    const unsubscribe = subscribeApprovalQueue((event) => {
+      if (event.op === 'resync') {
+        loadersRef.current.loadApprovalQueue();
+        return;
+      }
+      if (event.op !== 'delete' && event.status === 'pending' && event.route === filterRouteRef.current) {
+        setApprovalQueue((current) => current.some((email) => email.id === event.id) ? current : [event, ...current]);
+      } else {
+        setApprovalQueue((current) => current.filter((email) => email.id !== event.id));
+        setSelectedEmail((current) => current?.id === event.id ? null : current);
+      }
+      // One counts request per burst of changes (e.g. a triage run inserting many rows)
+      clearTimeout(countsTimer);
+      countsTimer = setTimeout(() => loadersRef.current.loadRouteCounts(), 500);
+    });
+    return () => {
+      clearTimeout(countsTimer);
+      unsubscribe();
+    };
+  }, []);
+
   const showToast = useCallback((message, type = 'success') => {
     setToast({ message, type });
   }, []);
 
+  const loadRouteCounts = async () => {
+    try {
+      const response = await getApprovalQueueCounts();
+      if (response.ok) {
+        setRouteCounts(await response.json());
+      }
+    } catch (error) {
+      console.error('Error fetching queue counts:', error);
+    }
+  };
+
   const loadApprovalQueue = async () => {
+    loadRouteCounts();
     try {
       const response = await getApprovalQueue(instance, accounts, filterRoute);
       if (response.ok) {
         const data = await response.json();
-        setApprovalQueue(data);
+        setApprovalQueue(data.items);
+        setNextCursor(data.next_cursor);
       }
     } catch (error) {
       console.error('Error fetching emails:', error);
     }
   };
 
+  /* The list only has a snippet, so fetch the body and draft when an email is opened */
+  const selectEmail = async (email) => {
+    setSelectedEmail(email);
+    try {
+      const response = await getApproval(email.id);
+      if (response.ok) {
+        const detail = await response.json();
+        // Ignore the answer if another email was selected meanwhile
+        setSelectedEmail((current) => current?.id === email.id ? { ...current, ...detail, detailLoaded: true } : current);
+      }
+    } catch (error) {
+      console.error('Error fetching email details:', error);
+    }
+  };
+
+  loadersRef.current = { loadApprovalQueue, loadRouteCounts };
+
+  const loadMoreApprovals = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await getApprovalQueue(instance, accounts, filterRoute, nextCursor);
+      if (response.ok) {
+        const data = await response.json();
+        setApprovalQueue((current) => [...current, ...data.items]);
+        setNextCursor(data.next_cursor);
+      }
+    } catch (error) {
+      console.error('Error fetching more emails:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleApprove = async (approvalId, editedResponse) => {
     try {
       const response = await approveResponse(approvalId, editedResponse, instance, accounts);
 
       if (response.ok) {
-        showToast('Response sent successfully!', 'success');
+        showToast('Reply queued for sending', 'success');
         loadApprovalQueue();
         setSelectedEmail(null);
       } else {
@@ -200,7 +278,7 @@ function DashboardContent() {
     try {
       const response = await redirectEmail(instance, accounts, approvalId, redirectDepartmentEmail, comment);
       if (response.ok) {
-        showToast('Email redirected successfully', 'success');
+        showToast('Redirect queued for sending', 'success');
         loadApprovalQueue();
         setSelectedEmail(null);
       }
@@ -353,7 +431,7 @@ function DashboardContent() {
                 }`}>
                   <div className={`text-sm ${isDark ? 'text-slate-400' : 'text-slate-600'}`}>Pending</div>
                   <div className="text-2xl font-bold text-[#7BAFD4]">
-                    {approvalQueue.length}
+                    {routeCounts ? routeCounts[filterRoute] : `${approvalQueue.length}${nextCursor ? '+' : ''}`}
                   </div>
                 </div>
               </div>
@@ -387,9 +465,9 @@ function DashboardContent() {
                         : 'bg-slate-50 text-slate-900 ring-slate-200'
                     }`}
                   >
-                    <option value="AI_AGENT">🤖 AI Agent (Ready to Send)</option>
-                    <option value="HUMAN_REQUIRED">👤 Human Required</option>
-                    <option value="REDIRECT">↪️ Redirect</option>
+                    <option value="AI_AGENT">🤖 AI Agent (Ready to Send){routeCounts ? ` · ${routeCounts.AI_AGENT}` : ''}</option>
+                    <option value="HUMAN_REQUIRED">👤 Human Required{routeCounts ? ` · ${routeCounts.HUMAN_REQUIRED}` : ''}</option>
+                    <option value="REDIRECT">↪️ Redirect{routeCounts ? ` · ${routeCounts.REDIRECT}` : ''}</option>
                   </select>
                 </div>
 
@@ -415,7 +493,7 @@ function DashboardContent() {
                               ? 'bg-white/5 ring-white/10 hover:bg-white/10 hover:ring-white/20'
                               : 'bg-slate-50 ring-slate-200 hover:bg-slate-100 hover:ring-slate-300'
                         }`}
-                        onClick={() => setSelectedEmail(email)}
+                        onClick={() => selectEmail(email)}
                       >
                         {/* Delete button */}
                         <button
@@ -478,6 +556,19 @@ function DashboardContent() {
                       </div>
                     ))
                   )}
+                  {nextCursor && (
+                    <button
+                      onClick={loadMoreApprovals}
+                      disabled={loadingMore}
+                      className={`w-full rounded-xl px-4 py-3 text-sm font-medium ring-1 transition-all duration-200 disabled:opacity-50 ${
+                        isDark
+                          ? 'bg-white/5 text-slate-300 ring-white/10 hover:bg-white/10'
+                          : 'bg-slate-50 text-slate-700 ring-slate-200 hover:bg-slate-100'
+                      }`}
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                  )}
                 </div>
               </div>
             </div>
@@ -554,7 +645,7 @@ function DashboardContent() {
                           ? 'text-slate-300 bg-[#050B16]/60 ring-white/10' 
                           : 'text-slate-700 bg-slate-50 ring-slate-200'
                       }`}>
-                        {selectedEmail.body}
+                        {selectedEmail.detailLoaded ? selectedEmail.body : `${selectedEmail.snippet || ''}…`}
                       </div>
                     </div>
 
@@ -589,7 +680,19 @@ function DashboardContent() {
 
             {/* Right: Approval Panel */}
             <div className="lg:col-span-1">
-              {selectedEmail ? (
+              {selectedEmail && !selectedEmail.detailLoaded ? (
+                <div className={`rounded-2xl p-6 ring-1 backdrop-blur-xl min-h-[400px] transition-colors duration-300 ${
+                  isDark 
+                    ? 'bg-gradient-to-br from-white/10 to-white/[0.02] ring-white/10' 
+                    : 'bg-white ring-slate-200 shadow-lg'
+                }`}>
+                  <div className="flex flex-col items-center justify-center h-full py-16 text-center">
+                    <p className={`text-sm ${isDark ? 'text-slate-400' : 'text-slate-500'}`}>
+                      Loading response...
+                    </p>
+                  </div>
+                </div>
+              ) : selectedEmail ? (
                 <ApprovalPanel
                   email={selectedEmail}
                   route={selectedEmail.route}